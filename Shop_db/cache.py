@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+
+class ExpiringDict:
+    # Entries live exactly ttl seconds: unlike TTLCache nothing is evicted
+    # early to bound the size. Every entry has the same ttl, so insertion
+    # order is expiry order and writes prune expired ones from the front.
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return default
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            while self._data:
+                oldest = next(iter(self._data.values()))
+                if oldest[0] >= now:
+                    break
+                self._data.popitem(last=False)
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+class TableVersions:
+    # Per-table write counters. A cache key that includes the versions of the
+    # tables it read goes stale as soon as one of them is written.
+    def __init__(self):
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, tables) -> None:
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def snapshot(self, tables) -> tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+
+class InsertedIds:
+    # Ids of committed inserts for the tables a consumer tracks, kept until it
+    # takes them. A table becomes None, meaning "reload it in full", when an
+    # insert did not report its ids or more than maxsize are pending.
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._ids: dict[str, set | None] = {}
+        self._lock = threading.Lock()
+
+    def track(self, tables) -> None:
+        with self._lock:
+            for table in tables:
+                self._ids.setdefault(table, set())
+
+    def record(self, table: str, ids) -> None:
+        with self._lock:
+            if table not in self._ids or self._ids[table] is None:
+                return
+            if ids is None or len(self._ids[table]) + len(ids) > self.maxsize:
+                self._ids[table] = None
+            else:
+                self._ids[table].update(ids)
+
+    def take(self, tables) -> dict:
+        with self._lock:
+            taken = {table: self._ids.get(table, set()) for table in tables}
+            for table in tables:
+                if table in self._ids:
+                    self._ids[table] = set()
+            return taken
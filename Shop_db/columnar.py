@@ -0,0 +1,323 @@
+import os
+import threading
+import time
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+import crud
+import models
+
+try:
+    import numpy as np
+except ImportError:  # optional: only needed with ANALYTICS_ENGINE=columnar
+    np = None
+
+COLUMNAR_CHUNK_SIZE = int(os.getenv("COLUMNAR_CHUNK_SIZE", "50000"))
+# Writes made by this process are seen through crud's table versions and
+# inserted ids, including ids that commit after higher ones. Inserts from other
+# processes are picked up every COLUMNAR_REFRESH_SECONDS when their ids are
+# above the loaded ones; out-of-order ids, updates and deletes from there wait
+# for the next full reload after COLUMNAR_MAX_AGE_SECONDS.
+COLUMNAR_REFRESH_SECONDS = float(os.getenv("COLUMNAR_REFRESH_SECONDS", "5"))
+COLUMNAR_MAX_AGE_SECONDS = float(os.getenv("COLUMNAR_MAX_AGE_SECONDS", "600"))
+
+FACT_TABLES = (models.Orders.__tablename__, models.OrderDetail.__tablename__)
+DIMENSION_TABLES = (models.Product.__tablename__, models.Customer.__tablename__, models.Supplier.__tablename__)
+
+STATUSES = list(models.OrderStatus)
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+# 1970-01-01 was a Thursday; (days + 3) % 7 is 0 on Mondays.
+EPOCH_WEEKDAY_OFFSET = 3
+
+
+def available() -> bool:
+    return np is not None
+
+
+def _ids(values):
+    return np.fromiter((-1 if value is None else value for value in values), np.int32, len(values))
+
+
+def _seconds(values):
+    return np.array(values, dtype="datetime64[s]")
+
+
+def _status_codes(values):
+    return np.fromiter((STATUS_CODES.get(value, -1) for value in values), np.int8, len(values))
+
+
+def _cents(values):
+    return np.fromiter((0 if value is None else round(value * 100) for value in values), np.int64, len(values))
+
+
+def _objects(values):
+    return np.array(values, dtype=object)
+
+
+def _fetch(db: Session, statement, converters) -> list:
+    # Streams the rows and converts each partition to column arrays.
+    parts = [[] for _ in converters]
+    result = db.execute(statement.execution_options(stream_results=True, yield_per=COLUMNAR_CHUNK_SIZE))
+    for rows in result.partitions():
+        for chunks, convert, values in zip(parts, converters, zip(*rows)):
+            chunks.append(convert(values))
+    return [np.concatenate(chunks) if chunks else convert(()) for chunks, convert in zip(parts, converters)]
+
+
+def _categorical(values) -> tuple:
+    # Codes ordered like the sorted labels, -1 for NULL, as ORDER BY sorts them.
+    labels = sorted({value for value in values if value is not None})
+    lookup = {label: code for code, label in enumerate(labels)}
+    return np.fromiter((lookup.get(value, -1) for value in values), np.int32, len(values)), labels
+
+
+def _positions(ids, keys):
+    # Row index of each key in the sorted ids array, -1 where it is missing.
+    if not len(ids):
+        return np.full(len(keys), -1, dtype=np.int64)
+    positions = np.searchsorted(ids, keys)
+    positions[positions >= len(ids)] = 0
+    return np.where(ids[positions] == keys, positions, -1)
+
+
+def _missing(loaded, ids):
+    # The ids not in loaded, which is sorted by id for orders but not for lines.
+    ids = np.array(sorted(ids), dtype=np.int64)
+    return ids[~np.isin(ids, loaded)]
+
+
+def _group_sums(inverse, groups: int, values):
+    # Exact int64 sums per group: sort once, then add up each run.
+    order = np.argsort(inverse, kind="stable")
+    starts = np.searchsorted(inverse[order], np.arange(groups))
+    return np.add.reduceat(values[order], starts)
+
+
+class ColumnarStore:
+    # Orders and OrderDetail as NumPy columns (int32 ids, int8 status codes),
+    # with Product/Customer/Supplier as small lookup columns (int64 cents,
+    # categorical country and supplier codes). New rows are appended by id;
+    # updates and deletes trigger a full reload on the next query.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = self._polled_at = float("-inf")
+        self._fact_versions = self._fact_rewrites = self._dimension_versions = None
+        self.lines = self.orders = self.dimensions = None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = self._polled_at = float("-inf")
+            self.lines = self.orders = self.dimensions = None
+
+    def _load_facts(self, db: Session, full: bool) -> None:
+        detail, order = models.OrderDetail, models.Orders
+        crud.inserted_ids.track(FACT_TABLES)
+        inserted = crud.inserted_ids.take(FACT_TABLES)
+        late_lines = []
+        if not full:
+            after_line = int(self.lines["id"].max()) if len(self.lines["id"]) else -1
+            after_order = int(self.orders["id"][-1]) if len(self.orders["id"]) else -1
+            # Ids at or below the loaded maximum that are not loaded yet
+            # committed out of order. Lines are fetched by id and appended;
+            # orders must stay sorted by id, so a late order means a full reload.
+            late_orders, late_lines = (
+                None if ids is None else _missing(loaded, [value for value in ids if value <= maximum])
+                for ids, loaded, maximum in (
+                    (inserted[order.__tablename__], self.orders["id"], after_order),
+                    (inserted[detail.__tablename__], self.lines["id"], after_line),
+                )
+            )
+            full = late_orders is None or late_lines is None or len(late_orders) > 0
+        if full:
+            after_line = after_order = -1
+            late_lines = []
+            self._fact_rewrites = crud.table_rewrites.snapshot(FACT_TABLES)
+        self._fact_versions = crud.table_versions.snapshot(FACT_TABLES)
+
+        new_lines = detail.OrderDetailID > after_line
+        if len(late_lines):
+            new_lines = or_(new_lines, detail.OrderDetailID.in_(late_lines.tolist()))
+        # Lines first: any order a loaded line points to is then loaded too.
+        line_id, line_order, line_product, quantity = _fetch(
+            db,
+            select(detail.OrderDetailID, detail.OrderID, detail.ProductID, detail.Quantity)
+            .where(new_lines)
+            .order_by(detail.OrderDetailID),
+            [_ids, _ids, _ids, _ids],
+        )
+        order_id, customer, order_date, status = _fetch(
+            db,
+            select(order.OrderID, order.CustomerID, order.OrderDate, order.Status)
+            .where(order.OrderID > after_order)
+            .order_by(order.OrderID),
+            [_ids, _ids, _seconds, _status_codes],
+        )
+        new_orders = {"id": order_id, "customer": customer, "date": order_date, "status": status}
+        if not full:
+            new_orders = {name: np.concatenate([self.orders[name], new_orders[name]]) for name in new_orders}
+        new_lines = {
+            "id": line_id,
+            "order": line_order,
+            "product": line_product,
+            "quantity": quantity,
+            # Orders only grow at the end, so positions of loaded lines stay valid.
+            "order_pos": _positions(new_orders["id"], line_order),
+        }
+        if not full:
+            new_lines = {name: np.concatenate([self.lines[name], new_lines[name]]) for name in new_lines}
+        self.orders, self.lines = new_orders, new_lines
+
+    def _load_dimensions(self, db: Session) -> None:
+        self._dimension_versions = crud.table_versions.snapshot(DIMENSION_TABLES)
+        product_id, price, product_supplier = _fetch(
+            db,
+            select(models.Product.ProductID, models.Product.Price, models.Product.SupplierID).order_by(
+                models.Product.ProductID
+            ),
+            [_ids, _cents, _ids],
+        )
+        supplier_id, supplier_name = _fetch(
+            db,
+            select(models.Supplier.SupplierID, models.Supplier.SupplierName).order_by(models.Supplier.SupplierID),
+            [_ids, _objects],
+        )
+        customer_id, country = _fetch(
+            db,
+            select(models.Customer.CustomerID, models.Customer.Country).order_by(models.Customer.CustomerID),
+            [_ids, _objects],
+        )
+        supplier_names = [
+            supplier_name[position] if position >= 0 else None
+            for position in _positions(supplier_id, product_supplier).tolist()
+        ]
+        supplier_codes, supplier_labels = _categorical(supplier_names)
+        country_codes, country_labels = _categorical(country)
+        self.dimensions = {
+            "product_id": product_id,
+            "price": price,
+            "supplier": supplier_codes,
+            "supplier_labels": supplier_labels,
+            "customer_id": customer_id,
+            "country": country_codes,
+            "country_labels": country_labels,
+        }
+
+    def refresh(self, db: Session) -> None:
+        now = time.monotonic()
+        poll = now - self._polled_at > COLUMNAR_REFRESH_SECONDS
+        with self._lock:
+            facts_changed = True
+            if (
+                self.orders is None
+                or now - self._loaded_at > COLUMNAR_MAX_AGE_SECONDS
+                or crud.table_rewrites.snapshot(FACT_TABLES) != self._fact_rewrites
+            ):
+                self._load_facts(db, full=True)
+                self._loaded_at = now
+            elif poll or crud.table_versions.snapshot(FACT_TABLES) != self._fact_versions:
+                self._load_facts(db, full=False)
+            else:
+                facts_changed = False
+            if self.dimensions is None or poll or (
+                crud.table_versions.snapshot(DIMENSION_TABLES) != self._dimension_versions
+            ):
+                self._load_dimensions(db)
+            elif not facts_changed:
+                return
+            if poll:
+                self._polled_at = now
+            product_pos = _positions(self.dimensions["product_id"], self.lines["product"])
+            self.lines = {**self.lines, "product_pos": product_pos}
+
+    def aggregate(
+        self,
+        db: Session,
+        bucket: str | None = None,
+        group_by: str | None = None,
+        date_from=None,
+        date_to=None,
+        status=None,
+        customer_id: int | None = None,
+    ) -> list[dict]:
+        # Same rows as crud.revenue_series: period/group, orders, quantity, revenue.
+        self.refresh(db)
+        with self._lock:
+            lines, orders, dimensions = self.lines, self.orders, self.dimensions
+
+        mask = (lines["order_pos"] >= 0) & (lines["product_pos"] >= 0)
+        order_pos = np.where(mask, lines["order_pos"], 0)
+        dates = orders["date"][order_pos]
+        if date_from is not None:
+            mask &= dates >= np.datetime64(date_from, "s")
+        if date_to is not None:
+            mask &= dates < np.datetime64(date_to, "s")
+        if status is not None:
+            mask &= orders["status"][order_pos] == STATUS_CODES[models.OrderStatus(status)]
+        if customer_id is not None:
+            mask &= orders["customer"][order_pos] == customer_id
+
+        order_pos = order_pos[mask]
+        product_pos = lines["product_pos"][mask]
+        quantity = lines["quantity"][mask].astype(np.int64)
+        revenue = quantity * dimensions["price"][product_pos]
+
+        # (name, codes, labels) per output key, combined into one int64 key.
+        keys = []
+        if bucket is not None:
+            days = dates[mask].astype("datetime64[D]")
+            if bucket == "week":
+                days = days - (days.astype(np.int64) + EPOCH_WEEKDAY_OFFSET) % 7
+            elif bucket == "month":
+                days = days.astype("datetime64[M]").astype("datetime64[D]")
+            values, codes = np.unique(days, return_inverse=True)
+            keys.append(("period", codes, [str(value) for value in values]))
+        if group_by is not None:
+            codes, label = self._group_codes(group_by, orders, dimensions, order_pos, product_pos)
+            values, codes = np.unique(codes, return_inverse=True)
+            keys.append(("group", codes, [label(value) for value in values]))
+
+        composite = np.zeros(len(quantity), dtype=np.int64)
+        for _, codes, names in keys:
+            composite = composite * len(names) + codes
+        groups, inverse = np.unique(composite, return_inverse=True)
+        if not len(groups):
+            return []
+        quantities = _group_sums(inverse, len(groups), quantity)
+        revenues = _group_sums(inverse, len(groups), revenue)
+        # Distinct orders per group: count unique (group, order) pairs.
+        pairs = np.unique(inverse.astype(np.int64) * len(orders["id"]) + order_pos)
+        order_counts = np.bincount(pairs // len(orders["id"]), minlength=len(groups))
+
+        rows = []
+        for index, group in enumerate(groups.tolist()):
+            row = {}
+            for key, _, names in reversed(keys):
+                group, code = divmod(group, len(names))
+                row[key] = names[code]
+            row.update(orders=int(order_counts[index]), quantity=int(quantities[index]), revenue=int(revenues[index]) / 100)
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def _group_codes(group_by: str, orders, dimensions, order_pos, product_pos):
+        if group_by == "status":
+            codes = orders["status"][order_pos].astype(np.int64)
+            return codes, lambda code: STATUSES[code].value if code >= 0 else None
+        if group_by == "customer":
+            codes = orders["customer"][order_pos].astype(np.int64)
+            return codes, lambda code: int(code) if code >= 0 else None
+        if group_by == "product":
+            codes = dimensions["product_id"][product_pos].astype(np.int64)
+            return codes, int
+        if group_by == "supplier":
+            codes = dimensions["supplier"][product_pos].astype(np.int64)
+            names = dimensions["supplier_labels"]
+        else:
+            customer_pos = _positions(dimensions["customer_id"], orders["customer"][order_pos])
+            codes = np.where(customer_pos >= 0, dimensions["country"][customer_pos], -1).astype(np.int64)
+            names = dimensions["country_labels"]
+        return codes, lambda code: names[code] if code >= 0 else None
+
+
+store = ColumnarStore()
@@ -1,37 +1,204 @@
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy import and_, delete, event, exists, func, insert, inspect, literal, or_, select, text, true, update
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.orm import Session, aliased
 import models
+from cache import InsertedIds, TableVersions
+from hll import HyperLogLog
+import order_totals
+import product_sales
 
 ROLE_ADMIN = "admin"
+ROLE_SELLER = "seller"
+
+# Role lookups are cached on the request's Session so a request that checks the
+# same customer's scope several times only reads it once.
+ROLE_CACHE_KEY = "customer_roles"
+SELLER_CACHE_KEY = "seller_flags"
+UNIT_OF_WORK_KEY = "unit_of_work"
+WRITTEN_TABLES_KEY = "written_tables"
+REWRITTEN_TABLES_KEY = "rewritten_tables"
+INSERTED_IDS_KEY = "inserted_ids"
+
+# Bumped when a transaction that wrote a table commits; read-side caches put
+# the versions of the tables they depend on into their keys. table_rewrites
+# only counts updates and deletes, for readers that can append inserts.
+table_versions = TableVersions()
+table_rewrites = TableVersions()
+# Ids inserted by committed transactions, for readers that append new rows
+# by id and would otherwise miss ids that committed out of order.
+inserted_ids = InsertedIds()
+
+
+def mark_written(db: Session, *models_or_tables, rewrite: bool = False) -> None:
+    keys = (WRITTEN_TABLES_KEY, REWRITTEN_TABLES_KEY) if rewrite else (WRITTEN_TABLES_KEY,)
+    for item in models_or_tables:
+        name = getattr(item, "__tablename__", None) or item.name
+        for key in keys:
+            db.info.setdefault(key, set()).add(name)
+
+
+def mark_inserted(db: Session, model_or_table, ids=None) -> None:
+    # ids=None for inserts whose generated keys are not known.
+    mark_written(db, model_or_table)
+    name = getattr(model_or_table, "__tablename__", None) or model_or_table.name
+    inserted = db.info.setdefault(INSERTED_IDS_KEY, {})
+    if ids is None or inserted.get(name, set()) is None:
+        inserted[name] = None
+    else:
+        inserted.setdefault(name, set()).update(ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_written_tables(session: Session, flush_context) -> None:
+    for instance in session.new:
+        key = inspect(instance).mapper.primary_key_from_instance(instance)
+        mark_inserted(session, type(instance), key if len(key) == 1 else None)
+    for instance in session.deleted:
+        mark_written(session, type(instance), rewrite=True)
+    for instance in session.dirty:
+        # Objects that only gained a related object are dirty without a row change.
+        state = inspect(instance)
+        changed = any(state.attrs[column.key].history.has_changes() for column in state.mapper.column_attrs)
+        mark_written(session, type(instance), rewrite=changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_table_versions(session: Session) -> None:
+    if not session.in_nested_transaction():
+        # Ids first, so a reader that sees the new version also gets them.
+        for table, ids in session.info.pop(INSERTED_IDS_KEY, {}).items():
+            inserted_ids.record(table, ids)
+        table_versions.bump(session.info.pop(WRITTEN_TABLES_KEY, ()))
+        table_rewrites.bump(session.info.pop(REWRITTEN_TABLES_KEY, ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_written_tables(session: Session) -> None:
+    if not session.in_nested_transaction():
+        session.info.pop(WRITTEN_TABLES_KEY, None)
+        session.info.pop(REWRITTEN_TABLES_KEY, None)
+        session.info.pop(INSERTED_IDS_KEY, None)
+
+
+@contextmanager
+def unit_of_work(db: Session):
+    # Inside the block crud writes only flush; the block commits once on exit
+    # and rolls everything back if it raises. Nested blocks join the outer one.
+    if db.info.get(UNIT_OF_WORK_KEY):
+        yield db
+        return
+    db.info[UNIT_OF_WORK_KEY] = True
+    expire_on_commit = db.expire_on_commit
+    try:
+        yield db
+        # Flushed objects already hold their ids and values; keep them loaded
+        # instead of re-reading every row after the commit.
+        db.expire_on_commit = False
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.expire_on_commit = expire_on_commit
+        db.info.pop(UNIT_OF_WORK_KEY, None)
+
+
+def _save(db: Session, instance=None) -> None:
+    if db.info.get(UNIT_OF_WORK_KEY):
+        db.flush()
+        return
+    db.commit()
+    if instance is not None:
+        db.refresh(instance)
+
+
+def _role_cache(db: Session) -> dict:
+    return db.info.setdefault(ROLE_CACHE_KEY, {})
+
+
+def _seller_cache(db: Session) -> dict:
+    return db.info.setdefault(SELLER_CACHE_KEY, {})
+
+
+def remember_customer(db: Session, customer: models.Customer) -> None:
+    _role_cache(db)[customer.CustomerID] = (getattr(customer, "Role", "") or "").lower()
+
+
+def remember_seller(db: Session, customer_id: int, is_seller: bool) -> None:
+    _seller_cache(db)[customer_id] = is_seller
+
+
+def forget_customer(db: Session, customer_id: int) -> None:
+    _role_cache(db).pop(customer_id, None)
+    _seller_cache(db).pop(customer_id, None)
+
+
+def _customer_role(db: Session, customer_id: int) -> str | None:
+    roles = _role_cache(db)
+    if customer_id not in roles:
+        row = db.query(models.Customer.Role).filter(models.Customer.CustomerID == customer_id).first()
+        roles[customer_id] = (row.Role or "").lower() if row else None
+    return roles[customer_id]
 
 
 def _is_admin_customer_scope(db: Session, customer_id: int | None) -> bool:
     if customer_id is None:
         return False
     try:
-        customer = db.query(models.Customer).filter(models.Customer.CustomerID == customer_id).first()
+        return _customer_role(db, customer_id) == ROLE_ADMIN
     except SQLAlchemyError:
         return False
-    if not customer:
-        return False
-    return (getattr(customer, "Role", "") or "").lower() == ROLE_ADMIN
+
+
+def is_seller_customer(db: Session, customer_id: int) -> bool:
+    sellers = _seller_cache(db)
+    if customer_id not in sellers:
+        seller_profile = (
+            db.query(models.Supplier.SupplierID)
+            .filter(
+                models.Supplier.OwnerCustomerID == customer_id,
+                func.lower(models.Supplier.Role) == ROLE_SELLER,
+            )
+            .first()
+        )
+        sellers[customer_id] = seller_profile is not None
+    return sellers[customer_id]
 
 
 def _should_apply_customer_filter(db: Session, customer_id: int | None) -> bool:
     return customer_id is not None and not _is_admin_customer_scope(db, customer_id)
 
 
+def _keyset(query, key_column, after_id: int | None = None, limit: int | None = None):
+    if after_id is not None:
+        query = query.filter(key_column > after_id)
+    query = query.order_by(key_column)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
 # ---------- CUSTOMER ----------
 def create_customer(db: Session, Name: str, Email: str, Phone: str = None, Country: str = None):
     customer = models.Customer(Name=Name, Email=Email, Phone=Phone, Country=Country)
     db.add(customer)
-    db.commit()
-    db.refresh(customer)
+    _save(db, customer)
     return customer
 
 
-def get_customers(db: Session):
-    return db.query(models.Customer).all()
+def query_customers(db: Session, customer_id: int = None):
+    query = db.query(models.Customer)
+    if _should_apply_customer_filter(db, customer_id):
+        query = query.filter(models.Customer.CustomerID == customer_id)
+    return query
+
+
+def get_customers(db: Session, after_id: int | None = None, limit: int | None = None):
+    return _keyset(query_customers(db), models.Customer.CustomerID, after_id, limit)
 
 
 def get_customer(db: Session, customer_id: int):
@@ -44,8 +211,8 @@ def update_customer(db: Session, customer_id: int, **kwargs):
         return None
     for key, value in kwargs.items():
         setattr(customer, key, value)
-    db.commit()
-    db.refresh(customer)
+    _save(db, customer)
+    remember_customer(db, customer)
     return customer
 
 
@@ -54,7 +221,8 @@ def delete_customer(db: Session, customer_id: int):
     if not customer:
         return None
     db.delete(customer)
-    db.commit()
+    _save(db)
+    forget_customer(db, customer_id)
     return customer
 
 
@@ -77,16 +245,26 @@ def create_supplier(
         OwnerCustomerID=owner_customer_id,
     )
     db.add(supplier)
-    db.commit()
-    db.refresh(supplier)
+    _save(db, supplier)
+    db.info.pop(SELLER_CACHE_KEY, None)
     return supplier
 
 
-def get_suppliers(db: Session, owner_customer_id: int = None):
+def query_suppliers(db: Session, owner_customer_id: int = None):
     query = db.query(models.Supplier)
     if _should_apply_customer_filter(db, owner_customer_id):
         query = query.filter(models.Supplier.OwnerCustomerID == owner_customer_id)
-    return query.all()
+    return query
+
+
+def get_suppliers(
+    db: Session,
+    owner_customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    query = query_suppliers(db, owner_customer_id=owner_customer_id)
+    return _keyset(query, models.Supplier.SupplierID, after_id, limit)
 
 
 def get_supplier(db: Session, supplier_id: int, owner_customer_id: int = None):
@@ -102,8 +280,8 @@ def update_supplier(db: Session, supplier_id: int, owner_customer_id: int = None
         return None
     for key, value in kwargs.items():
         setattr(supplier, key, value)
-    db.commit()
-    db.refresh(supplier)
+    _save(db, supplier)
+    db.info.pop(SELLER_CACHE_KEY, None)
     return supplier
 
 
@@ -112,7 +290,8 @@ def delete_supplier(db: Session, supplier_id: int, owner_customer_id: int = None
     if not supplier:
         return None
     db.delete(supplier)
-    db.commit()
+    _save(db)
+    db.info.pop(SELLER_CACHE_KEY, None)
     return supplier
 
 
@@ -131,16 +310,25 @@ def create_product(
         OwnerCustomerID=owner_customer_id,
     )
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    _save(db, product)
     return product
 
 
-def get_products(db: Session, owner_customer_id: int = None):
+def query_products(db: Session, owner_customer_id: int = None):
     query = db.query(models.Product)
     if _should_apply_customer_filter(db, owner_customer_id):
         query = query.filter(models.Product.OwnerCustomerID == owner_customer_id)
-    return query.all()
+    return query
+
+
+def get_products(
+    db: Session,
+    owner_customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    query = query_products(db, owner_customer_id=owner_customer_id)
+    return _keyset(query, models.Product.ProductID, after_id, limit)
 
 
 def get_product(db: Session, product_id: int, owner_customer_id: int = None):
@@ -156,8 +344,7 @@ def update_product(db: Session, product_id: int, owner_customer_id: int = None,
         return None
     for key, value in kwargs.items():
         setattr(product, key, value)
-    db.commit()
-    db.refresh(product)
+    _save(db, product)
     return product
 
 
@@ -166,7 +353,7 @@ def delete_product(db: Session, product_id: int, owner_customer_id: int = None):
     if not product:
         return None
     db.delete(product)
-    db.commit()
+    _save(db)
     return product
 
 
@@ -178,16 +365,25 @@ def create_order(db: Session, order_date, customer_id: int, Status: str = "Pendi
         Status=Status,
     )
     db.add(order)
-    db.commit()
-    db.refresh(order)
+    _save(db, order)
     return order
 
 
-def get_orders(db: Session, customer_id: int = None):
+def query_orders(db: Session, customer_id: int = None):
     query = db.query(models.Orders)
     if _should_apply_customer_filter(db, customer_id):
         query = query.filter(models.Orders.CustomerID == customer_id)
-    return query.all()
+    return query
+
+
+def get_orders(
+    db: Session,
+    customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    query = query_orders(db, customer_id=customer_id)
+    return _keyset(query, models.Orders.OrderID, after_id, limit)
 
 
 def get_order(db: Session, order_id: int, customer_id: int = None):
@@ -215,8 +411,7 @@ def update_order(db: Session, order_id: int, customer_id: int = None, **kwargs):
         if key in field_map:
             setattr(order, field_map[key], value)
 
-    db.commit()
-    db.refresh(order)
+    _save(db, order)
     return order
 
 
@@ -225,7 +420,7 @@ def delete_order(db: Session, order_id: int, customer_id: int = None):
     if not order:
         return None
     db.delete(order)
-    db.commit()
+    _save(db)
     return order
 
 
@@ -244,18 +439,38 @@ def create_order_detail(
         ShippingAddress=shipping_address,
     )
     db.add(detail)
-    db.commit()
-    db.refresh(detail)
+    _save(db, detail)
     return detail
 
 
-def get_order_details(db: Session, customer_id: int = None):
+def query_order_details(db: Session, customer_id: int = None):
     query = db.query(models.OrderDetail)
     if _should_apply_customer_filter(db, customer_id):
         query = query.join(models.Orders, models.OrderDetail.OrderID == models.Orders.OrderID).filter(
             models.Orders.CustomerID == customer_id
         )
-    return query.all()
+    return query
+
+
+def get_order_details(
+    db: Session,
+    customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    query = query_order_details(db, customer_id=customer_id)
+    return _keyset(query, models.OrderDetail.OrderDetailID, after_id, limit)
+
+
+def get_order_details_by_order(
+    db: Session,
+    order_id: int,
+    customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    query = query_order_details(db, customer_id=customer_id).filter(models.OrderDetail.OrderID == order_id)
+    return _keyset(query, models.OrderDetail.OrderDetailID, after_id, limit)
 
 
 def get_order_detail(db: Session, detail_id: int, customer_id: int = None):
@@ -286,8 +501,7 @@ def update_order_detail(db: Session, detail_id: int, customer_id: int = None, **
     for key, value in kwargs.items():
         if key in field_map:
             setattr(detail, field_map[key], value)
-    db.commit()
-    db.refresh(detail)
+    _save(db, detail)
     return detail
 
 
@@ -296,7 +510,7 @@ def delete_order_detail(db: Session, detail_id: int, customer_id: int = None):
     if not detail:
         return None
     db.delete(detail)
-    db.commit()
+    _save(db)
     return detail
 
 
@@ -309,18 +523,27 @@ def create_courier(db: Session, courier_name: str, country: str = None, price: f
         OrderID=order_id,
     )
     db.add(db_courier)
-    db.commit()
-    db.refresh(db_courier)
+    _save(db, db_courier)
     return db_courier
 
 
-def get_couriers(db: Session, customer_id: int = None):
+def query_couriers(db: Session, customer_id: int = None):
     query = db.query(models.Courier)
     if _should_apply_customer_filter(db, customer_id):
         query = query.join(models.Orders, models.Courier.OrderID == models.Orders.OrderID).filter(
             models.Orders.CustomerID == customer_id
         )
-    return query.all()
+    return query
+
+
+def get_couriers(
+    db: Session,
+    customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    query = query_couriers(db, customer_id=customer_id)
+    return _keyset(query, models.Courier.CourierID, after_id, limit)
 
 
 def get_courier(db: Session, courier_id: int, customer_id: int = None):
@@ -338,8 +561,7 @@ def update_courier(db: Session, courier_id: int, customer_id: int = None, **kwar
         return None
     for key, value in kwargs.items():
         setattr(courier, key, value)
-    db.commit()
-    db.refresh(courier)
+    _save(db, courier)
     return courier
 
 
@@ -348,7 +570,7 @@ def delete_courier(db: Session, courier_id: int, customer_id: int = None):
     if not courier:
         return None
     db.delete(courier)
-    db.commit()
+    _save(db)
     return courier
 
 
@@ -356,18 +578,27 @@ def delete_courier(db: Session, courier_id: int, customer_id: int = None):
 def create_payment(db: Session, order_id: int, Status: str, amount: float, payment_date):
     payment = models.Payment(OrderID=order_id, Status=Status, Amount=amount, PaymentDate=payment_date)
     db.add(payment)
-    db.commit()
-    db.refresh(payment)
+    _save(db, payment)
     return payment
 
 
-def get_payments(db: Session, customer_id: int = None):
+def query_payments(db: Session, customer_id: int = None):
     query = db.query(models.Payment)
     if _should_apply_customer_filter(db, customer_id):
         query = query.join(models.Orders, models.Payment.OrderID == models.Orders.OrderID).filter(
             models.Orders.CustomerID == customer_id
         )
-    return query.all()
+    return query
+
+
+def get_payments(
+    db: Session,
+    customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    query = query_payments(db, customer_id=customer_id)
+    return _keyset(query, models.Payment.PaymentID, after_id, limit)
 
 
 def get_payment(db: Session, payment_id: int, customer_id: int = None):
@@ -387,8 +618,7 @@ def update_payment(db: Session, payment_id: int, customer_id: int = None, **kwar
         if key == "amount":
             key = "Amount"
         setattr(payment, key, value)
-    db.commit()
-    db.refresh(payment)
+    _save(db, payment)
     return payment
 
 
@@ -397,7 +627,7 @@ def delete_payment(db: Session, payment_id: int, customer_id: int = None):
     if not payment:
         return None
     db.delete(payment)
-    db.commit()
+    _save(db)
     return payment
 
 
@@ -405,12 +635,11 @@ def delete_payment(db: Session, payment_id: int, customer_id: int = None):
 def create_gift(db: Session, amount: float, exp_date, type_: str, unit: str, payment_id: int = None):
     gift = models.Gifts(Amount=amount, ExparesDate=exp_date, Type=type_, Unit=unit, PaymentID=payment_id)
     db.add(gift)
-    db.commit()
-    db.refresh(gift)
+    _save(db, gift)
     return gift
 
 
-def get_gifts(db: Session, customer_id: int = None):
+def query_gifts(db: Session, customer_id: int = None):
     query = db.query(models.Gifts)
     if _should_apply_customer_filter(db, customer_id):
         query = (
@@ -419,7 +648,28 @@ def get_gifts(db: Session, customer_id: int = None):
             .join(models.Orders, models.Payment.OrderID == models.Orders.OrderID)
             .filter(models.Orders.CustomerID == customer_id)
         )
-    return query.all()
+    return query
+
+
+def get_gifts(
+    db: Session,
+    customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    query = query_gifts(db, customer_id=customer_id)
+    return _keyset(query, models.Gifts.GiftID, after_id, limit)
+
+
+def get_gifts_by_payment(
+    db: Session,
+    payment_id: int,
+    customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    query = query_gifts(db, customer_id=customer_id).filter(models.Gifts.PaymentID == payment_id)
+    return _keyset(query, models.Gifts.GiftID, after_id, limit)
 
 
 def get_gift(db: Session, gift_id: int, customer_id: int = None):
@@ -440,8 +690,7 @@ def update_gift(db: Session, gift_id: int, customer_id: int = None, **kwargs):
         return None
     for key, value in kwargs.items():
         setattr(gift, key, value)
-    db.commit()
-    db.refresh(gift)
+    _save(db, gift)
     return gift
 
 
@@ -450,5 +699,623 @@ def delete_gift(db: Session, gift_id: int, customer_id: int = None):
     if not gift:
         return None
     db.delete(gift)
-    db.commit()
+    _save(db)
     return gift
+
+
+# ---------- ORDER TOTALS ----------
+def query_order_totals(db: Session, customer_id: int = None):
+    query = db.query(models.OrderTotals)
+    if _should_apply_customer_filter(db, customer_id):
+        query = query.join(models.Orders, models.OrderTotals.OrderID == models.Orders.OrderID).filter(
+            models.Orders.CustomerID == customer_id
+        )
+    return query
+
+
+def get_order_totals(
+    db: Session,
+    customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    query = query_order_totals(db, customer_id=customer_id)
+    return _keyset(query, models.OrderTotals.OrderID, after_id, limit)
+
+
+# ---------- CUSTOMER ANALYTICS ----------
+def get_customer_ltv(db: Session, customer_id: int = None, offset: int = 0, limit: int | None = None):
+    totals = models.CustomerTotals
+    query = (
+        db.query(totals, models.Customer.Name)
+        .join(models.Customer, models.Customer.CustomerID == totals.CustomerID)
+        .order_by(totals.LifetimeValue.desc(), totals.CustomerID)
+    )
+    if _should_apply_customer_filter(db, customer_id):
+        query = query.filter(totals.CustomerID == customer_id)
+    query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def get_cohort_sizes(db: Session, cohort_from=None, cohort_to=None):
+    totals = models.CustomerTotals
+    query = db.query(
+        totals.CohortMonth,
+        func.count().label("customers"),
+        func.sum(totals.LifetimeValue).label("lifetime_value"),
+    )
+    if cohort_from is not None:
+        query = query.filter(totals.CohortMonth >= cohort_from)
+    if cohort_to is not None:
+        query = query.filter(totals.CohortMonth <= cohort_to)
+    return query.group_by(totals.CohortMonth).order_by(totals.CohortMonth).all()
+
+
+def get_cohort_activity(db: Session, cohort_from=None, cohort_to=None):
+    # Active customers and their order value per (cohort month, calendar month).
+    totals, monthly = models.CustomerTotals, models.CustomerMonthly
+    query = (
+        db.query(
+            totals.CohortMonth,
+            monthly.Month,
+            func.count().label("customers"),
+            func.sum(monthly.Value).label("value"),
+        )
+        .join(monthly, monthly.CustomerID == totals.CustomerID)
+    )
+    if cohort_from is not None:
+        query = query.filter(totals.CohortMonth >= cohort_from)
+    if cohort_to is not None:
+        query = query.filter(totals.CohortMonth <= cohort_to)
+    return query.group_by(totals.CohortMonth, monthly.Month).order_by(totals.CohortMonth, monthly.Month).all()
+
+
+# ---------- PRODUCT SALES ----------
+def get_top_products(
+    db: Session,
+    date_from=None,
+    date_to=None,
+    owner_customer_id: int = None,
+    offset: int = 0,
+    limit: int | None = None,
+):
+    # Перша вюжка.sql served from the ProductDailySales rollup.
+    rollup = models.ProductDailySales
+    sales = func.sum(rollup.Quantity * models.Product.Price)
+    query = (
+        db.query(
+            rollup.ProductID,
+            models.Product.ProductName,
+            func.sum(rollup.OrderCount).label("TotalOrders"),
+            func.sum(rollup.Quantity).label("TotalQuantity"),
+            sales.label("TotalSales"),
+        )
+        .join(models.Product, models.Product.ProductID == rollup.ProductID)
+        .group_by(rollup.ProductID, models.Product.ProductName)
+    )
+    if date_from is not None:
+        query = query.filter(rollup.Day >= date_from)
+    if date_to is not None:
+        query = query.filter(rollup.Day <= date_to)
+    if _should_apply_customer_filter(db, owner_customer_id):
+        query = query.filter(models.Product.OwnerCustomerID == owner_customer_id)
+    query = query.order_by(sales.desc(), rollup.ProductID).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def count_product_customers(db: Session, product_ids: list[int], date_from=None, date_to=None) -> dict:
+    # Distinct customers do not add up across days, so they are counted from
+    # the order lines, for the requested products only. This scans each
+    # product's history in the range; estimate_product_customers does not.
+    query = (
+        db.query(models.OrderDetail.ProductID, func.count(func.distinct(models.Orders.CustomerID)))
+        .join(models.Orders, models.Orders.OrderID == models.OrderDetail.OrderID)
+        .filter(models.OrderDetail.ProductID.in_(product_ids))
+        .group_by(models.OrderDetail.ProductID)
+    )
+    if date_from is not None:
+        query = query.filter(models.Orders.OrderDate >= datetime.combine(date_from, datetime.min.time()))
+    if date_to is not None:
+        query = query.filter(models.Orders.OrderDate < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    return dict(query.all())
+
+
+def estimate_product_customers(db: Session, product_ids: list[int], date_from=None, date_to=None) -> dict:
+    # Merges the daily ProductDailyCustomers sketches; see hll.py for the error bound.
+    sketches = models.ProductDailyCustomers
+    query = db.query(sketches.ProductID, sketches.Sketch).filter(sketches.ProductID.in_(product_ids))
+    if date_from is not None:
+        query = query.filter(sketches.Day >= date_from)
+    if date_to is not None:
+        query = query.filter(sketches.Day <= date_to)
+    merged = {}
+    for product_id, data in query.yield_per(1000):
+        sketch = HyperLogLog.from_bytes(data)
+        if product_id in merged:
+            merged[product_id].update(sketch)
+        else:
+            merged[product_id] = sketch
+    return {product_id: sketch.count() for product_id, sketch in merged.items()}
+
+
+# ---------- ORDER SUMMARY ----------
+def get_order_summary_ids(
+    db: Session,
+    customer_id: int = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    status=None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    # Filters run on Orders alone, so only the page's orders reach the GROUP BY.
+    query = db.query(models.Orders.OrderID).filter(
+        models.Orders.CustomerID.is_not(None),
+        exists().where(models.OrderDetail.OrderID == models.Orders.OrderID),
+    )
+    if date_from is not None:
+        query = query.filter(models.Orders.OrderDate >= date_from)
+    if date_to is not None:
+        query = query.filter(models.Orders.OrderDate < date_to)
+    if status is not None:
+        query = query.filter(models.Orders.Status == status)
+    if _should_apply_customer_filter(db, customer_id):
+        query = query.filter(models.Orders.CustomerID == customer_id)
+    return _keyset(query, models.Orders.OrderID, after_id, limit)
+
+
+def query_order_summary(db: Session, order_ids: list[int]):
+    return (
+        db.query(
+            models.Orders.OrderID,
+            models.Orders.OrderDate,
+            models.Customer.Name.label("CustomerName"),
+            models.Orders.Status,
+            func.sum(models.OrderDetail.Quantity * models.Product.Price).label("total_amount"),
+        )
+        .join(models.OrderDetail, models.OrderDetail.OrderID == models.Orders.OrderID)
+        .join(models.Product, models.Product.ProductID == models.OrderDetail.ProductID)
+        .join(models.Customer, models.Customer.CustomerID == models.Orders.CustomerID)
+        .filter(models.Orders.OrderID.in_(order_ids))
+        .group_by(models.Orders.OrderID, models.Orders.OrderDate, models.Customer.Name, models.Orders.Status)
+        .order_by(models.Orders.OrderID)
+    )
+
+
+# ---------- REVENUE ----------
+REVENUE_BUCKETS = ("day", "week", "month")
+REVENUE_GROUPS = {
+    "status": models.Orders.Status,
+    "country": models.Customer.Country,
+    "supplier": models.Supplier.SupplierName,
+    "customer": models.Orders.CustomerID,
+    "product": models.OrderDetail.ProductID,
+}
+
+
+def _bucket(db: Session, bucket: str, column):
+    # Start date of the day, week (Monday) or month containing column.
+    if db.get_bind().dialect.name == "mysql":
+        if bucket == "week":
+            return func.subdate(func.date(column), func.weekday(column))
+        if bucket == "month":
+            return func.date(func.date_format(column, "%Y-%m-01"))
+        return func.date(column)
+    if bucket == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    if bucket == "month":
+        return func.date(column, "start of month")
+    return func.date(column)
+
+
+def revenue_series(
+    db: Session,
+    bucket: str | None = "day",
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    group_by: str | None = None,
+    customer_id: int = None,
+    status=None,
+):
+    # bucket=None aggregates the whole range into one row per group.
+    group_columns = []
+    columns = []
+    if bucket is not None:
+        period = _bucket(db, bucket, models.Orders.OrderDate)
+        group_columns.append(period)
+        columns.append(period.label("period"))
+    if group_by is not None:
+        group_columns.append(REVENUE_GROUPS[group_by])
+        columns.append(REVENUE_GROUPS[group_by].label("group"))
+    query = (
+        db.query(
+            *columns,
+            func.count(func.distinct(models.Orders.OrderID)).label("orders"),
+            func.sum(models.OrderDetail.Quantity).label("quantity"),
+            func.sum(models.OrderDetail.Quantity * models.Product.Price).label("revenue"),
+        )
+        .join(models.OrderDetail, models.OrderDetail.OrderID == models.Orders.OrderID)
+        .join(models.Product, models.Product.ProductID == models.OrderDetail.ProductID)
+    )
+    if group_by == "country":
+        query = query.outerjoin(models.Customer, models.Customer.CustomerID == models.Orders.CustomerID)
+    elif group_by == "supplier":
+        query = query.outerjoin(models.Supplier, models.Supplier.SupplierID == models.Product.SupplierID)
+    if date_from is not None:
+        query = query.filter(models.Orders.OrderDate >= date_from)
+    if date_to is not None:
+        query = query.filter(models.Orders.OrderDate < date_to)
+    if status is not None:
+        query = query.filter(models.Orders.Status == status)
+    if _should_apply_customer_filter(db, customer_id):
+        query = query.filter(models.Orders.CustomerID == customer_id)
+    return query.group_by(*group_columns).order_by(*group_columns).all()
+
+
+# ---------- CHECKOUT ----------
+def product_prices(db: Session, product_ids) -> dict:
+    # Shared locks keep the products from being deleted or repriced before
+    # the order lines referencing them are inserted.
+    return dict(
+        db.query(models.Product.ProductID, models.Product.Price)
+        .filter(models.Product.ProductID.in_(set(product_ids)))
+        .with_for_update(read=True)
+        .all()
+    )
+
+
+def checkout(
+    db: Session,
+    customer_id: int,
+    lines: list[dict],
+    order_date=None,
+    courier: dict | None = None,
+    gifts: list[dict] | None = None,
+    payment_status: str = "Pending",
+):
+    # Meant to run inside unit_of_work(): returns None, before inserting
+    # anything, when a line references a missing product.
+    prices = product_prices(db, [line["ProductID"] for line in lines])
+    if any(line["ProductID"] not in prices for line in lines):
+        return None
+
+    # Same total as CreateRandomOrderForCustomer in Процедура.sql.
+    amount = sum(prices[line["ProductID"]] * line.get("Quantity", 1) for line in lines)
+    now = datetime.now()
+    order = models.Orders(
+        OrderDate=order_date or now,
+        CustomerID=customer_id,
+        Status=models.OrderStatus.Pending,
+        details=[models.OrderDetail(**line) for line in lines],
+    )
+    if courier is not None:
+        order.courier = models.Courier(**courier)
+    order.payment = models.Payment(
+        Status=payment_status,
+        Amount=amount,
+        PaymentDate=now,
+        gifts=[models.Gifts(**gift) for gift in gifts or ()],
+    )
+    db.add(order)
+    db.flush()
+    return order
+
+
+# ---------- BULK ----------
+def _autoinc_settings(db: Session) -> tuple[int, int]:
+    # (auto_increment_increment, innodb_autoinc_lock_mode) of the connection.
+    return tuple(db.execute(text("SELECT @@auto_increment_increment, @@innodb_autoinc_lock_mode")).one())
+
+
+def _insert_rows(db: Session, model, rows: list[dict]) -> list[int]:
+    table = model.__table__
+    key = table.primary_key.columns[0]
+    if db.get_bind().dialect.insert_executemany_returning:
+        return list(db.execute(insert(table).returning(key, sort_by_parameter_order=True), rows).scalars())
+    # MySQL has no RETURNING. In the consecutive and traditional lock modes
+    # InnoDB gives a multi-row INSERT one block of ids starting at
+    # LAST_INSERT_ID(), spaced by auto_increment_increment (> 1 on Galera and
+    # multi-primary setups). Interleaved mode (2) does not promise a block, so
+    # rows are inserted one at a time there.
+    increment, lock_mode = _autoinc_settings(db)
+    if lock_mode == 2:
+        return [db.execute(insert(table).values(row)).lastrowid for row in rows]
+    result = db.execute(insert(table).values(rows))
+    return list(range(result.lastrowid, result.lastrowid + len(rows) * increment, increment))
+
+
+def bulk_insert(db: Session, model, rows: list[dict], chunk_size: int = 1000) -> list:
+    # One entry per row: the generated primary key, or the database error
+    # message if that row was rejected. Rows must all have the same keys.
+    results = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+        try:
+            with db.begin_nested():
+                results.extend(_insert_rows(db, model, chunk))
+            continue
+        except DBAPIError:
+            pass
+        # Retry the rejected chunk row by row so only the bad rows fail.
+        for row in chunk:
+            try:
+                with db.begin_nested():
+                    results.extend(_insert_rows(db, model, [row]))
+            except DBAPIError as exc:
+                results.append(str(exc.orig))
+    mark_inserted(db, model, [value for value in results if not isinstance(value, str)])
+    if model in (models.Customer, models.Supplier):
+        db.info.pop(ROLE_CACHE_KEY, None)
+        db.info.pop(SELLER_CACHE_KEY, None)
+    if model is models.Orders:
+        order_totals.touch(db, order_ids=[value for value in results if not isinstance(value, str)])
+    elif model in (models.OrderDetail, models.Courier, models.Payment):
+        order_totals.touch(db, order_ids=[row.get("OrderID") for row in rows])
+        if model is models.OrderDetail:
+            product_sales.touch(db, detail_ids=[value for value in results if not isinstance(value, str)])
+    elif model is models.Gifts:
+        order_totals.touch(db, payment_ids=[row.get("PaymentID") for row in rows])
+    return results
+
+
+def _owner_condition(db: Session, model, customer_id: int | None):
+    # Set-based form of the per-entity scoping used by the query_* helpers.
+    if not _should_apply_customer_filter(db, customer_id):
+        return None
+    if model is models.Customer:
+        return models.Customer.CustomerID == customer_id
+    if model in (models.Supplier, models.Product):
+        return model.OwnerCustomerID == customer_id
+    if model is models.Orders:
+        return models.Orders.CustomerID == customer_id
+    owned_orders = select(models.Orders.OrderID).where(models.Orders.CustomerID == customer_id)
+    if model is models.Gifts:
+        return models.Gifts.PaymentID.in_(
+            select(models.Payment.PaymentID).where(models.Payment.OrderID.in_(owned_orders))
+        )
+    return model.OrderID.in_(owned_orders)
+
+
+def _scoped_where(db: Session, model, conditions: list, customer_id: int | None) -> list:
+    owner = _owner_condition(db, model, customer_id)
+    return conditions if owner is None else [*conditions, owner]
+
+
+# model -> (columns that change totals, {order_totals.touch argument: key column})
+_TOTALS_SOURCES = {
+    # Previous customers too, for orders moved to another customer.
+    models.Orders: (
+        {"CustomerID", "OrderDate"},
+        {"order_ids": models.Orders.OrderID, "customer_ids": models.Orders.CustomerID},
+    ),
+    models.OrderDetail: ({"OrderID", "ProductID", "Quantity"}, {"order_ids": models.OrderDetail.OrderID}),
+    models.Courier: ({"OrderID", "Price"}, {"order_ids": models.Courier.OrderID}),
+    models.Payment: ({"OrderID"}, {"order_ids": models.Payment.OrderID}),
+    models.Gifts: ({"PaymentID", "Amount", "Unit"}, {"payment_ids": models.Gifts.PaymentID}),
+    models.Product: ({"Price"}, {"product_ids": models.Product.ProductID}),
+}
+
+
+def _touch_totals_where(db: Session, model, where: list, values: dict | None = None) -> None:
+    # Set-based statements bypass the ORM flush hooks, so collect the keys
+    # they are about to affect up front.
+    source = _TOTALS_SOURCES.get(model)
+    if source is None or (values is not None and not source[0] & values.keys()):
+        return
+    order_totals.touch(
+        db,
+        **{
+            argument: db.execute(select(column).where(*where).distinct()).scalars().all()
+            for argument, column in source[1].items()
+        },
+    )
+
+
+def _touch_sales_where(db: Session, model, where: list, values: dict | None = None) -> None:
+    # The cells the rows are in before the statement; the ones they move to
+    # are read at commit from the touched ids.
+    if model is models.OrderDetail and (values is None or set(product_sales.DETAIL_COLUMNS) & values.keys()):
+        lines = db.execute(select(models.OrderDetail.OrderDetailID).where(*where)).scalars().all()
+        condition = models.OrderDetail.OrderDetailID.in_(lines)
+        product_sales.touch(db, line_ids=lines, cells=product_sales.cells(db, condition))
+    elif model is models.Orders and (values is None or set(product_sales.ORDER_COLUMNS) & values.keys()):
+        orders = db.execute(select(models.Orders.OrderID).where(*where)).scalars().all()
+        condition = models.OrderDetail.OrderID.in_(orders)
+        product_sales.touch(db, order_ids=orders, cells=product_sales.cells(db, condition))
+
+
+def ids_where(db: Session, model, conditions: list, customer_id: int = None) -> list:
+    # Primary keys a following update_where/delete_where with the same
+    # arguments will affect.
+    key = model.__table__.primary_key.columns[0]
+    return db.execute(select(key).where(*_scoped_where(db, model, conditions, customer_id))).scalars().all()
+
+
+def update_where(db: Session, model, conditions: list, values: dict, customer_id: int = None) -> int:
+    where = _scoped_where(db, model, conditions, customer_id)
+    _touch_totals_where(db, model, where, values)
+    _touch_sales_where(db, model, where, values)
+    statement = (
+        update(model)
+        .where(*where)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    count = db.execute(statement).rowcount
+    mark_written(db, model, rewrite=True)
+    _save(db)
+    if model in (models.Customer, models.Supplier):
+        db.info.pop(ROLE_CACHE_KEY, None)
+        db.info.pop(SELLER_CACHE_KEY, None)
+    return count
+
+
+def delete_where(db: Session, model, conditions: list, customer_id: int = None) -> int:
+    where = _scoped_where(db, model, conditions, customer_id)
+    _touch_totals_where(db, model, where)
+    _touch_sales_where(db, model, where)
+    statement = (
+        delete(model)
+        .where(*where)
+        .execution_options(synchronize_session=False)
+    )
+    count = db.execute(statement).rowcount
+    mark_written(db, model, rewrite=True)
+    _save(db)
+    if model in (models.Customer, models.Supplier):
+        db.info.pop(ROLE_CACHE_KEY, None)
+        db.info.pop(SELLER_CACHE_KEY, None)
+    return count
+
+
+# ---------- HIERARCHY ----------
+class OrderPath(NamedTuple):
+    order: models.Orders | None = None
+    detail: models.OrderDetail | None = None
+    product: models.Product | None = None
+    supplier: models.Supplier | None = None
+    courier: models.Courier | None = None
+    payment: models.Payment | None = None
+    gift: models.Gifts | None = None
+
+
+def _admin_scope(customer_id: int):
+    return exists().where(
+        models.Customer.CustomerID == customer_id,
+        func.lower(models.Customer.Role) == ROLE_ADMIN,
+    )
+
+
+def _scope(condition, customer_id: int | None):
+    # SQL form of _should_apply_customer_filter: the filter is skipped when the
+    # scoping customer is an admin, but evaluated inside the same statement.
+    if customer_id is None:
+        return true()
+    return or_(condition, _admin_scope(customer_id))
+
+
+def _order_owned_by(order_id_column, customer_id: int):
+    scope_order = aliased(models.Orders)
+    return exists().where(scope_order.OrderID == order_id_column, scope_order.CustomerID == customer_id)
+
+
+def _payment_owned_by(payment_id_column, customer_id: int):
+    scope_payment = aliased(models.Payment)
+    scope_order = aliased(models.Orders)
+    return exists().where(
+        scope_payment.PaymentID == payment_id_column,
+        scope_order.OrderID == scope_payment.OrderID,
+        scope_order.CustomerID == customer_id,
+    )
+
+
+def resolve_order_path(
+    db: Session,
+    customer_id: int,
+    order_id: int,
+    detail_id: int = None,
+    product_id: int = None,
+    supplier_id: int = None,
+    payment_id: int = None,
+    gift_id: int = None,
+    with_product: bool = False,
+    with_supplier: bool = False,
+    with_courier: bool = False,
+    with_payment: bool = False,
+    owner_customer_id: int = None,
+) -> OrderPath:
+    # Every requested entity is LEFT JOINed onto a one-row anchor by its own id
+    # (or through its parent for with_*) using the same scope rules as the
+    # matching get_* function, so callers can still tell "missing" from
+    # "belongs to another parent" while paying for a single round trip.
+    path = [
+        (
+            "order",
+            models.Orders,
+            and_(
+                models.Orders.OrderID == order_id,
+                _scope(models.Orders.CustomerID == customer_id, customer_id),
+            ),
+        )
+    ]
+
+    if detail_id is not None:
+        path.append(
+            (
+                "detail",
+                models.OrderDetail,
+                and_(
+                    models.OrderDetail.OrderDetailID == detail_id,
+                    _scope(_order_owned_by(models.OrderDetail.OrderID, customer_id), customer_id),
+                ),
+            )
+        )
+
+    product_on = None
+    if product_id is not None:
+        product_on = models.Product.ProductID == product_id
+    elif with_product and detail_id is not None:
+        product_on = models.Product.ProductID == models.OrderDetail.ProductID
+    if product_on is not None:
+        path.append(
+            (
+                "product",
+                models.Product,
+                and_(product_on, _scope(models.Product.OwnerCustomerID == owner_customer_id, owner_customer_id)),
+            )
+        )
+
+    supplier_on = None
+    if supplier_id is not None:
+        supplier_on = models.Supplier.SupplierID == supplier_id
+    elif with_supplier and product_on is not None:
+        supplier_on = models.Supplier.SupplierID == models.Product.SupplierID
+    if supplier_on is not None:
+        path.append(
+            (
+                "supplier",
+                models.Supplier,
+                and_(supplier_on, _scope(models.Supplier.OwnerCustomerID == owner_customer_id, owner_customer_id)),
+            )
+        )
+
+    if with_courier:
+        path.append(("courier", models.Courier, models.Courier.OrderID == models.Orders.OrderID))
+
+    if payment_id is not None:
+        path.append(
+            (
+                "payment",
+                models.Payment,
+                and_(
+                    models.Payment.PaymentID == payment_id,
+                    _scope(_order_owned_by(models.Payment.OrderID, customer_id), customer_id),
+                ),
+            )
+        )
+    elif with_payment:
+        path.append(("payment", models.Payment, models.Payment.OrderID == models.Orders.OrderID))
+
+    if gift_id is not None:
+        path.append(
+            (
+                "gift",
+                models.Gifts,
+                and_(
+                    models.Gifts.GiftID == gift_id,
+                    _scope(_payment_owned_by(models.Gifts.PaymentID, customer_id), customer_id),
+                ),
+            )
+        )
+
+    anchor = select(literal(1).label("anchor")).subquery("path_anchor")
+    stmt = select(*(entity for _, entity, _ in path)).select_from(anchor)
+    for _, entity, onclause in path:
+        stmt = stmt.outerjoin(entity, onclause)
+
+    row = db.execute(stmt).first()
+    return OrderPath(**{name: row[index] for index, (name, _, _) in enumerate(path)})
@@ -0,0 +1,109 @@
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from crud import ROLE_ADMIN, ROLE_CACHE_KEY, ROLE_SELLER, SELLER_CACHE_KEY
+
+# Async counterparts of the hot read paths in crud.py. They share crud's
+# per-session role cache, so scope rules behave the same on both paths.
+
+
+async def _customer_role(db: AsyncSession, customer_id: int) -> str | None:
+    roles = db.info.setdefault(ROLE_CACHE_KEY, {})
+    if customer_id not in roles:
+        result = await db.execute(select(models.Customer.Role).where(models.Customer.CustomerID == customer_id))
+        row = result.first()
+        roles[customer_id] = (row.Role or "").lower() if row else None
+    return roles[customer_id]
+
+
+async def _is_admin_customer_scope(db: AsyncSession, customer_id: int | None) -> bool:
+    if customer_id is None:
+        return False
+    try:
+        return await _customer_role(db, customer_id) == ROLE_ADMIN
+    except SQLAlchemyError:
+        return False
+
+
+async def _should_apply_customer_filter(db: AsyncSession, customer_id: int | None) -> bool:
+    return customer_id is not None and not await _is_admin_customer_scope(db, customer_id)
+
+
+async def _keyset(db: AsyncSession, stmt, key_column, after_id: int | None = None, limit: int | None = None):
+    if after_id is not None:
+        stmt = stmt.where(key_column > after_id)
+    stmt = stmt.order_by(key_column)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+async def is_seller_customer(db: AsyncSession, customer_id: int) -> bool:
+    sellers = db.info.setdefault(SELLER_CACHE_KEY, {})
+    if customer_id not in sellers:
+        result = await db.execute(
+            select(models.Supplier.SupplierID)
+            .where(
+                models.Supplier.OwnerCustomerID == customer_id,
+                func.lower(models.Supplier.Role) == ROLE_SELLER,
+            )
+            .limit(1)
+        )
+        sellers[customer_id] = result.first() is not None
+    return sellers[customer_id]
+
+
+# ---------- CUSTOMER ----------
+async def get_customer(db: AsyncSession, customer_id: int):
+    result = await db.execute(select(models.Customer).where(models.Customer.CustomerID == customer_id))
+    return result.scalars().first()
+
+
+async def get_customer_by_name(db: AsyncSession, name: str):
+    result = await db.execute(select(models.Customer).where(models.Customer.Name == name))
+    return result.scalars().first()
+
+
+# ---------- PRODUCT ----------
+async def get_products(
+    db: AsyncSession,
+    owner_customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    stmt = select(models.Product)
+    if await _should_apply_customer_filter(db, owner_customer_id):
+        stmt = stmt.where(models.Product.OwnerCustomerID == owner_customer_id)
+    return await _keyset(db, stmt, models.Product.ProductID, after_id, limit)
+
+
+async def get_product(db: AsyncSession, product_id: int, owner_customer_id: int = None):
+    stmt = select(models.Product).where(models.Product.ProductID == product_id)
+    if await _should_apply_customer_filter(db, owner_customer_id):
+        stmt = stmt.where(models.Product.OwnerCustomerID == owner_customer_id)
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+
+# ---------- ORDERS ----------
+async def get_orders(
+    db: AsyncSession,
+    customer_id: int = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+):
+    stmt = select(models.Orders)
+    if await _should_apply_customer_filter(db, customer_id):
+        stmt = stmt.where(models.Orders.CustomerID == customer_id)
+    return await _keyset(db, stmt, models.Orders.OrderID, after_id, limit)
+
+
+async def get_order(db: AsyncSession, order_id: int, customer_id: int = None):
+    stmt = select(models.Orders).where(models.Orders.OrderID == order_id)
+    if await _should_apply_customer_filter(db, customer_id):
+        stmt = stmt.where(models.Orders.CustomerID == customer_id)
+    result = await db.execute(stmt)
+    return result.scalars().first()
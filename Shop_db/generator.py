@@ -0,0 +1,175 @@
+import os
+import random
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import crud
+import models
+
+GENERATOR_CHUNK_SIZE = int(os.getenv("GENERATOR_CHUNK_SIZE", "1000"))
+ID_CACHE_TTL_SECONDS = float(os.getenv("ID_CACHE_TTL_SECONDS", "60"))
+ID_CACHE_MAX_IDS = int(os.getenv("ID_CACHE_MAX_IDS", "1000000"))
+ID_SAMPLE_MAX_ROUNDS = int(os.getenv("ID_SAMPLE_MAX_ROUNDS", "20"))
+
+
+class IdSampler:
+    # Random primary keys without ORDER BY RAND(): tables up to max_cached rows
+    # are kept as an int array refreshed every ttl seconds, larger ones are
+    # sampled by id range and checked with one IN query per round, for at most
+    # ID_SAMPLE_MAX_ROUNDS rounds: a sparse range can return fewer than k ids.
+    def __init__(self, column, ttl: float = ID_CACHE_TTL_SECONDS, max_cached: int = ID_CACHE_MAX_IDS):
+        self.column = column
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self._ids: array | None = None
+        self._loaded_at = float("-inf")
+        self._loaded = False
+        self._refreshing = False
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = float("-inf")
+            self._generation += 1
+
+    def _load(self, db: Session) -> array | None:
+        count = db.query(func.count(self.column)).scalar()
+        if count > self.max_cached:
+            return None
+        return array("q", (row[0] for row in db.query(self.column).yield_per(10_000)))
+
+    def _cached_ids(self, db: Session) -> array | None:
+        # One caller reloads outside the lock while the others keep sampling
+        # the stale array; before the first load they load their own copy.
+        with self._lock:
+            if time.monotonic() - self._loaded_at < self.ttl or (self._refreshing and self._loaded):
+                return self._ids
+            self._refreshing = True
+            generation = self._generation
+        try:
+            ids = self._load(db)
+        except BaseException:
+            with self._lock:
+                self._refreshing = False
+            raise
+        with self._lock:
+            self._ids, self._loaded, self._refreshing = ids, True, False
+            if generation == self._generation:
+                self._loaded_at = time.monotonic()
+        return ids
+
+    def _sample_range(self, db: Session, k: int) -> list[int]:
+        low, high = db.query(func.min(self.column), func.max(self.column)).one()
+        if low is None:
+            return []
+        sample = []
+        for _ in range(ID_SAMPLE_MAX_ROUNDS):
+            if len(sample) >= k:
+                break
+            candidates = [random.randint(low, high) for _ in range(min(2 * (k - len(sample)), 1000))]
+            existing = {row[0] for row in db.query(self.column).filter(self.column.in_(set(candidates)))}
+            sample.extend(candidate for candidate in candidates if candidate in existing)
+        return sample[:k]
+
+    def sample(self, db: Session, k: int) -> list[int]:
+        if k <= 0:
+            return []
+        ids = self._cached_ids(db)
+        if ids is None:
+            return self._sample_range(db, k)
+        return random.choices(ids, k=k) if ids else []
+
+
+product_ids = IdSampler(models.Product.ProductID)
+customer_ids = IdSampler(models.Customer.CustomerID)
+
+
+def _insert(db: Session, model, rows: list[dict]) -> list:
+    return crud.bulk_insert(db, model, rows, GENERATOR_CHUNK_SIZE) if rows else []
+
+
+def _generate_chunk(db: Session, count: int, customer_id: int | None, max_lines: int) -> list[int]:
+    now = datetime.now()
+    owners = [customer_id] * count if customer_id is not None else customer_ids.sample(db, count)
+    if not owners:
+        return []
+    countries = dict(
+        db.query(models.Customer.CustomerID, models.Customer.Country)
+        .filter(models.Customer.CustomerID.in_(set(owners)))
+        .all()
+    )
+
+    results = _insert(
+        db,
+        models.Orders,
+        [{"OrderDate": now, "CustomerID": owner, "Status": "Pending"} for owner in owners],
+    )
+    placed = [(order_id, owner) for order_id, owner in zip(results, owners) if not isinstance(order_id, str)]
+    order_ids = [order_id for order_id, _ in placed]
+
+    # Like CreateRandomOrderForCustomer in Процедура.sql: 1..max_lines distinct
+    # products with quantity 1..3, a courier, and a paid payment for the total.
+    line_counts = [random.randint(1, max_lines) for _ in placed]
+    sampled = iter(product_ids.sample(db, sum(line_counts)))
+    details = []
+    for (order_id, owner), lines in zip(placed, line_counts):
+        address = f"Street_{random.randint(0, 99)} {countries.get(owner) or ''}".strip()
+        for product_id in {next(sampled, None) for _ in range(lines)} - {None}:
+            details.append(
+                {
+                    "OrderID": order_id,
+                    "ProductID": product_id,
+                    "Quantity": random.randint(1, 3),
+                    "ShippingAddress": address,
+                }
+            )
+    if any(isinstance(result, str) for result in _insert(db, models.OrderDetail, details)):
+        # A cached product id no longer exists; reload the id array next time.
+        product_ids.invalidate()
+
+    _insert(
+        db,
+        models.Courier,
+        [
+            {
+                "Name": f"Courier_{random.randint(0, 999)}",
+                "Country": "Ukraine",
+                "Price": round(10 + random.random() * 20, 2),
+                "OrderID": order_id,
+            }
+            for order_id in order_ids
+        ],
+    )
+
+    totals = dict(
+        db.query(models.OrderDetail.OrderID, func.sum(models.Product.Price * models.OrderDetail.Quantity))
+        .join(models.Product, models.Product.ProductID == models.OrderDetail.ProductID)
+        .filter(models.OrderDetail.OrderID.in_(order_ids))
+        .group_by(models.OrderDetail.OrderID)
+        .all()
+    )
+    _insert(
+        db,
+        models.Payment,
+        [
+            {"OrderID": order_id, "Status": "Paid", "Amount": totals.get(order_id, 0), "PaymentDate": now}
+            for order_id in order_ids
+        ],
+    )
+    return order_ids
+
+
+def generate_orders(db: Session, count: int, customer_id: int | None = None, max_lines: int = 3) -> list[int]:
+    # Creates `count` random orders for one customer, or for randomly sampled
+    # customers when customer_id is None, and commits once.
+    order_ids = []
+    with crud.unit_of_work(db):
+        for start in range(0, count, GENERATOR_CHUNK_SIZE):
+            order_ids.extend(_generate_chunk(db, min(GENERATOR_CHUNK_SIZE, count - start), customer_id, max_lines))
+    return order_ids
@@ -1,6 +1,11 @@
+from contextlib import asynccontextmanager
+
+from anyio import to_thread
 from fastapi import FastAPI, Depends
 from sqlalchemy import inspect, text
-from database import Base, engine
+import order_totals
+import product_sales
+from database import ASYNC_DB_ENABLED, THREADPOOL_SIZE, Base, SessionLocal, engine
 from routers import (
     customer,
     order,
@@ -10,9 +15,14 @@ from routers import (
     courier,
     product,
     supplier,
-    analytics
+    analytics,
+    export,
+    admin,
+    async_reads,
+    checkout,
+    bulk,
 )
-from routers.customer import auth_router, get_current_user
+from routers.customer import auth_router, get_current_user, get_current_user_async
 
 Base.metadata.create_all(bind=engine)
 
@@ -30,6 +40,21 @@ def _ensure_column(table_name: str, column_name: str, ddl: str) -> None:
         connection.execute(text(ddl))
 
 
+def _ensure_index(table_name: str, index_name: str, columns: list[str]) -> None:
+    inspector = inspect(engine)
+    if not inspector.has_table(table_name):
+        return
+
+    # MySQL already indexes foreign key columns, so any index led by the same
+    # columns is good enough.
+    for index in inspector.get_indexes(table_name):
+        if index["column_names"][: len(columns)] == columns:
+            return
+
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE INDEX {index_name} ON {table_name} ({', '.join(columns)})"))
+
+
 def _migrate_shipping_address_to_order_detail() -> None:
     inspector = inspect(engine)
     if not inspector.has_table("Orders") or not inspector.has_table("OrderDetail"):
@@ -109,14 +134,44 @@ _ensure_column(
 
 _migrate_shipping_address_to_order_detail()
 
+_ensure_index("Customer", "ix_Customer_Name", ["Name"])
+_ensure_index("OrderDetail", "ix_OrderDetail_OrderID", ["OrderID"])
+_ensure_index("Gifts", "ix_Gifts_PaymentID", ["PaymentID"])
+_ensure_index("OrderDetail", "ix_OrderDetail_ProductID", ["ProductID"])
+_ensure_index("Orders", "ix_Orders_OrderDate", ["OrderDate"])
+_ensure_index("Orders", "ix_Orders_Status", ["Status"])
+
+with SessionLocal() as _session:
+    order_totals.ensure_built(_session)
+    product_sales.ensure_built(_session)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Size the threadpool that runs sync handlers to match the DB pool.
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    yield
+
+
 app = FastAPI(
     title="Electron-Shop API",
     description="Магазин електроніки, API для керування клієнтами, замовленнями, товарами та постачальниками.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.include_router(auth_router, tags=["Auth"])
 
+if ASYNC_DB_ENABLED:
+    # Registered first so these async handlers win over the sync routes with the same paths.
+    app.include_router(
+        async_reads.router,
+        tags=["Async reads"],
+        dependencies=[Depends(get_current_user_async)],
+    )
+
+# Before the entity routers so DELETE /{entity}/bulk is not taken for DELETE /{entity}/{id}.
+app.include_router(bulk.router, tags=["Bulk"], dependencies=[Depends(get_current_user)])
 app.include_router(customer.router, tags=["Customer"], dependencies=[Depends(get_current_user)])
 app.include_router(order.router, tags=["Order"], dependencies=[Depends(get_current_user)])
 app.include_router(orderdetail.router, tags=["Order Detail"], dependencies=[Depends(get_current_user)])
@@ -125,7 +180,10 @@ app.include_router(gift.router, tags=["Gift"], dependencies=[Depends(get_current
 app.include_router(courier.router, tags=["Courier"], dependencies=[Depends(get_current_user)])
 app.include_router(product.router, tags=["Product"], dependencies=[Depends(get_current_user)])
 app.include_router(supplier.router, tags=["Supplier"], dependencies=[Depends(get_current_user)])
+app.include_router(checkout.router, tags=["Checkout"], dependencies=[Depends(get_current_user)])
 app.include_router(analytics.router, tags=["Analytics"], dependencies=[Depends(get_current_user)])
+app.include_router(export.router, tags=["Export"], dependencies=[Depends(get_current_user)])
+app.include_router(admin.router, tags=["Admin"], dependencies=[Depends(get_current_user)])
 
 @app.get("/")
 def root():
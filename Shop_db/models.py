@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, DECIMAL, Date, DateTime, Enum, ForeignKey, LargeBinary
 from sqlalchemy.orm import relationship
 from database import Base
 import enum
@@ -31,7 +31,7 @@ class Customer(Base):
     __tablename__ = "Customer"
 
     CustomerID = Column(Integer, primary_key=True, index=True)
-    Name = Column(String(100), nullable=False)
+    Name = Column(String(100), nullable=False, index=True)
     Email = Column(String(100), unique=True, nullable=False)
     Phone = Column(String(20))
     Country = Column(String(50))
@@ -72,9 +72,9 @@ class Orders(Base):
     __tablename__ = "Orders"
 
     OrderID = Column(Integer, primary_key=True, index=True)
-    OrderDate = Column(DateTime, nullable=False)
+    OrderDate = Column(DateTime, nullable=False, index=True)
     CustomerID = Column(Integer, ForeignKey("Customer.CustomerID"))
-    Status = Column(Enum(OrderStatus), default=OrderStatus.Pending)
+    Status = Column(Enum(OrderStatus), default=OrderStatus.Pending, index=True)
 
     customer = relationship("Customer", back_populates="orders")
     details = relationship("OrderDetail", back_populates="order")
@@ -86,8 +86,8 @@ class OrderDetail(Base):
     __tablename__ = "OrderDetail"
 
     OrderDetailID = Column(Integer, primary_key=True, index=True)
-    OrderID = Column(Integer, ForeignKey("Orders.OrderID"), nullable=False)
-    ProductID = Column(Integer, ForeignKey("Product.ProductID"), nullable=False)
+    OrderID = Column(Integer, ForeignKey("Orders.OrderID"), nullable=False, index=True)
+    ProductID = Column(Integer, ForeignKey("Product.ProductID"), nullable=False, index=True)
     Quantity = Column(Integer, nullable=False, default=1)
     ShippingAddress = Column(String(200), nullable=True)
 
@@ -128,6 +128,66 @@ class Gifts(Base):
     ExparesDate = Column(DateTime)
     Type = Column(Enum(GiftType))
     Unit = Column(Enum(GiftUnit), nullable=False)
-    PaymentID = Column(Integer, ForeignKey("Payment.PaymentID"))
+    PaymentID = Column(Integer, ForeignKey("Payment.PaymentID"), index=True)
 
     payment = relationship("Payment", back_populates="gifts")
+
+
+class OrderTotals(Base):
+    # Derived from OrderDetail/Product/Courier/Gifts and kept up to date by
+    # order_totals.py; no foreign key so it never blocks deleting an order.
+    __tablename__ = "OrderTotals"
+
+    OrderID = Column(Integer, primary_key=True)
+    ProductsTotal = Column(DECIMAL(12, 2), nullable=False, default=0)
+    CourierPrice = Column(DECIMAL(10, 2), nullable=False, default=0)
+    GiftAmount = Column(DECIMAL(12, 2), nullable=False, default=0)
+    TotalToPay = Column(DECIMAL(12, 2), nullable=False, default=0)
+
+
+class ProductDailySales(Base):
+    # Per-product, per-day rollup of OrderDetail kept up to date by
+    # product_sales.py. Sales are Quantity * the current Product.Price, as in
+    # Перша вюжка.sql, so price changes need no refresh.
+    __tablename__ = "ProductDailySales"
+
+    Day = Column(Date, primary_key=True)
+    ProductID = Column(Integer, primary_key=True, index=True)
+    OrderCount = Column(Integer, nullable=False, default=0)
+    Quantity = Column(Integer, nullable=False, default=0)
+
+
+class ProductDailyCustomers(Base):
+    # HyperLogLog sketch (hll.py) of the distinct customers who bought a product
+    # on a day, kept next to ProductDailySales by product_sales.py. Sketches
+    # merge across days, unlike distinct counts.
+    __tablename__ = "ProductDailyCustomers"
+
+    Day = Column(Date, primary_key=True)
+    ProductID = Column(Integer, primary_key=True, index=True)
+    Sketch = Column(LargeBinary, nullable=False)
+
+
+class CustomerTotals(Base):
+    # Per-customer rollup of OrderTotals, kept up to date by order_totals.py.
+    # LifetimeValue is products total minus gifts over all of the customer's orders.
+    __tablename__ = "CustomerTotals"
+
+    CustomerID = Column(Integer, primary_key=True)
+    CohortMonth = Column(Date, nullable=False, index=True)
+    FirstOrderDate = Column(DateTime, nullable=False)
+    LastOrderDate = Column(DateTime, nullable=False)
+    OrderCount = Column(Integer, nullable=False, default=0)
+    ProductsTotal = Column(DECIMAL(14, 2), nullable=False, default=0)
+    GiftAmount = Column(DECIMAL(14, 2), nullable=False, default=0)
+    LifetimeValue = Column(DECIMAL(14, 2), nullable=False, default=0, index=True)
+
+
+class CustomerMonthly(Base):
+    # Orders and value per customer per calendar month, for retention cohorts.
+    __tablename__ = "CustomerMonthly"
+
+    CustomerID = Column(Integer, primary_key=True)
+    Month = Column(Date, primary_key=True)
+    OrderCount = Column(Integer, nullable=False, default=0)
+    Value = Column(DECIMAL(14, 2), nullable=False, default=0)
@@ -0,0 +1,268 @@
+import argparse
+import os
+import time
+
+from sqlalchemy import case, delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+import models
+
+ORDER_TOTALS_CHUNK_SIZE = int(os.getenv("ORDER_TOTALS_CHUNK_SIZE", "1000"))
+
+# Keys touched by the current transaction, kept on Session.info until commit.
+DIRTY_ORDERS_KEY = "order_totals_orders"
+DIRTY_PAYMENTS_KEY = "order_totals_payments"
+DIRTY_PRODUCTS_KEY = "order_totals_products"
+DIRTY_CUSTOMERS_KEY = "order_totals_customers"
+DIRTY_KEYS = (DIRTY_ORDERS_KEY, DIRTY_PAYMENTS_KEY, DIRTY_PRODUCTS_KEY, DIRTY_CUSTOMERS_KEY)
+
+
+def touch(db: Session, order_ids=(), payment_ids=(), product_ids=(), customer_ids=()) -> None:
+    # customer_ids are only needed for customers an order moved away from;
+    # the current customer of every touched order is refreshed anyway.
+    for key, ids in (
+        (DIRTY_ORDERS_KEY, order_ids),
+        (DIRTY_PAYMENTS_KEY, payment_ids),
+        (DIRTY_PRODUCTS_KEY, product_ids),
+        (DIRTY_CUSTOMERS_KEY, customer_ids),
+    ):
+        ids = {value for value in ids if value is not None}
+        if ids:
+            db.info.setdefault(key, set()).update(ids)
+
+
+def _current_and_previous(instance, attribute: str) -> set:
+    # Attribute history never triggers a load, which matters for rows the
+    # flush just deleted.
+    history = inspect(instance).attrs[attribute].history
+    return {*history.added, *history.unchanged, *history.deleted}
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_touched_rows(session: Session, flush_context) -> None:
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, models.Orders):
+            touch(
+                session,
+                order_ids=_current_and_previous(instance, "OrderID"),
+                customer_ids=_current_and_previous(instance, "CustomerID"),
+            )
+        elif isinstance(instance, (models.OrderDetail, models.Courier, models.Payment)):
+            # A line's price is already read in full when its order is
+            # recomputed, so only repricing or deleting a Product fans out.
+            touch(session, order_ids=_current_and_previous(instance, "OrderID"))
+        elif isinstance(instance, models.Gifts):
+            touch(session, payment_ids=_current_and_previous(instance, "PaymentID"))
+        elif isinstance(instance, models.Product):
+            if instance in session.deleted or inspect(instance).attrs.Price.history.has_changes():
+                touch(session, product_ids=_current_and_previous(instance, "ProductID"))
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_before_commit(session: Session) -> None:
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    refresh_touched(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_touched(session: Session) -> None:
+    if not session.in_nested_transaction():
+        for key in DIRTY_KEYS:
+            session.info.pop(key, None)
+
+
+def totals_select(order_condition):
+    # Друга вюжка.sql: products total + courier price - gifts (USD or percent).
+    detail, product = models.OrderDetail, models.Product
+    products = (
+        select(detail.OrderID, func.sum(detail.Quantity * product.Price).label("products_total"))
+        .join(product, product.ProductID == detail.ProductID)
+        .where(order_condition(detail.OrderID))
+        .group_by(detail.OrderID)
+        .subquery()
+    )
+    products_total = func.coalesce(products.c.products_total, 0)
+    gifts = (
+        select(
+            models.Payment.OrderID,
+            func.sum(
+                case(
+                    (models.Gifts.Unit == models.GiftUnit.USD, models.Gifts.Amount),
+                    (models.Gifts.Unit == models.GiftUnit.Percent, models.Gifts.Amount / 100 * products_total),
+                    else_=0,
+                )
+            ).label("gift_amount"),
+        )
+        .join(models.Gifts, models.Gifts.PaymentID == models.Payment.PaymentID)
+        .outerjoin(products, products.c.OrderID == models.Payment.OrderID)
+        .where(order_condition(models.Payment.OrderID))
+        .group_by(models.Payment.OrderID)
+        .subquery()
+    )
+    courier_price = func.coalesce(models.Courier.Price, 0)
+    gift_amount = func.coalesce(gifts.c.gift_amount, 0)
+    return (
+        select(
+            models.Orders.OrderID,
+            products_total,
+            courier_price,
+            gift_amount,
+            products_total + courier_price - gift_amount,
+        )
+        .outerjoin(products, products.c.OrderID == models.Orders.OrderID)
+        .outerjoin(models.Courier, models.Courier.OrderID == models.Orders.OrderID)
+        .outerjoin(gifts, gifts.c.OrderID == models.Orders.OrderID)
+        .where(order_condition(models.Orders.OrderID))
+    )
+
+
+def _replace(db: Session, order_condition) -> None:
+    table = models.OrderTotals.__table__
+    db.execute(delete(table).where(order_condition(table.c.OrderID)))
+    db.execute(
+        insert(table).from_select(
+            ["OrderID", "ProductsTotal", "CourierPrice", "GiftAmount", "TotalToPay"],
+            totals_select(order_condition),
+        )
+    )
+
+
+def _month_start(db: Session, column):
+    if db.get_bind().dialect.name == "mysql":
+        return func.date(func.date_format(column, "%Y-%m-01"))
+    return func.date(column, "start of month")
+
+
+def _replace_customers(db: Session, customer_condition) -> None:
+    # CustomerTotals and CustomerMonthly from Orders + OrderTotals, so this
+    # must run after the customers' order totals are current.
+    orders, totals = models.Orders, models.OrderTotals
+    value = totals.ProductsTotal - totals.GiftAmount
+    month = _month_start(db, orders.OrderDate)
+    customer_totals = models.CustomerTotals.__table__
+    monthly = models.CustomerMonthly.__table__
+    db.execute(delete(customer_totals).where(customer_condition(customer_totals.c.CustomerID)))
+    db.execute(delete(monthly).where(customer_condition(monthly.c.CustomerID)))
+    db.execute(
+        insert(customer_totals).from_select(
+            [
+                "CustomerID",
+                "CohortMonth",
+                "FirstOrderDate",
+                "LastOrderDate",
+                "OrderCount",
+                "ProductsTotal",
+                "GiftAmount",
+                "LifetimeValue",
+            ],
+            select(
+                orders.CustomerID,
+                _month_start(db, func.min(orders.OrderDate)),
+                func.min(orders.OrderDate),
+                func.max(orders.OrderDate),
+                func.count(),
+                func.sum(totals.ProductsTotal),
+                func.sum(totals.GiftAmount),
+                func.sum(value),
+            )
+            .join(totals, totals.OrderID == orders.OrderID)
+            .where(customer_condition(orders.CustomerID))
+            .group_by(orders.CustomerID),
+        )
+    )
+    db.execute(
+        insert(monthly).from_select(
+            ["CustomerID", "Month", "OrderCount", "Value"],
+            select(orders.CustomerID, month, func.count(), func.sum(value))
+            .join(totals, totals.OrderID == orders.OrderID)
+            .where(customer_condition(orders.CustomerID))
+            .group_by(orders.CustomerID, month),
+        )
+    )
+
+
+def _chunks(values: set, size: int):
+    values = sorted(values)
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def refresh_touched(db: Session) -> None:
+    order_ids = db.info.pop(DIRTY_ORDERS_KEY, set())
+    payment_ids = db.info.pop(DIRTY_PAYMENTS_KEY, set())
+    product_ids = db.info.pop(DIRTY_PRODUCTS_KEY, set())
+    customer_ids = db.info.pop(DIRTY_CUSTOMERS_KEY, set())
+
+    # Orders reached through a gift's payment or a repriced product are
+    # resolved here, once per transaction, rather than on every write.
+    for chunk in _chunks(payment_ids, ORDER_TOTALS_CHUNK_SIZE):
+        order_ids.update(
+            db.execute(select(models.Payment.OrderID).where(models.Payment.PaymentID.in_(chunk))).scalars()
+        )
+    for chunk in _chunks(product_ids, ORDER_TOTALS_CHUNK_SIZE):
+        order_ids.update(
+            db.execute(
+                select(models.OrderDetail.OrderID).where(models.OrderDetail.ProductID.in_(chunk)).distinct()
+            ).scalars()
+        )
+    order_ids.discard(None)
+    for chunk in _chunks(order_ids, ORDER_TOTALS_CHUNK_SIZE):
+        _replace(db, lambda column: column.in_(chunk))
+        customer_ids.update(
+            db.execute(select(models.Orders.CustomerID).where(models.Orders.OrderID.in_(chunk)).distinct()).scalars()
+        )
+    customer_ids.discard(None)
+    for chunk in _chunks(customer_ids, ORDER_TOTALS_CHUNK_SIZE):
+        _replace_customers(db, lambda column: column.in_(chunk))
+
+
+def rebuild(db: Session, chunk_size: int = ORDER_TOTALS_CHUNK_SIZE) -> int:
+    # Full recompute in OrderID ranges, then the customer rollups in
+    # CustomerID ranges, committing per range.
+    for table in (models.OrderTotals, models.CustomerTotals, models.CustomerMonthly):
+        db.execute(delete(table.__table__))
+    db.commit()
+    for column, replace in (
+        (models.Orders.OrderID, _replace),
+        (models.Orders.CustomerID, _replace_customers),
+    ):
+        low, high = db.execute(select(func.min(column), func.max(column))).one()
+        if low is None:
+            continue
+        for start in range(low, high + 1, chunk_size):
+            replace(db, lambda key: key.between(start, start + chunk_size - 1))
+            db.commit()
+    return db.execute(select(func.count()).select_from(models.OrderTotals)).scalar()
+
+
+def ensure_built(db: Session) -> None:
+    # Backfill once when the tables are new and orders already exist.
+    def empty(column, condition=None):
+        statement = select(column).limit(1)
+        if condition is not None:
+            statement = statement.where(condition)
+        return db.execute(statement).first() is None
+
+    if (empty(models.OrderTotals.OrderID) or empty(models.CustomerTotals.CustomerID)) and not empty(
+        models.Orders.OrderID, models.Orders.CustomerID.is_not(None)
+    ):
+        rebuild(db)
+
+
+def main() -> None:
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild OrderTotals and the customer rollups from scratch.")
+    parser.add_argument("--chunk-size", type=int, default=ORDER_TOTALS_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        rows = rebuild(db, args.chunk_size)
+    print(f"OrderTotals rebuilt: {rows} rows in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Date, case, delete, event, exists, func, insert, inspect, or_, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session, aliased
+
+import models
+from hll import HyperLogLog
+
+PRODUCT_SALES_CHUNK_SIZE = int(os.getenv("PRODUCT_SALES_CHUNK_SIZE", "1000"))
+
+# Keys touched by the current transaction, kept on Session.info until commit.
+NEW_DETAILS_KEY = "product_sales_details"
+DIRTY_LINES_KEY = "product_sales_lines"
+DIRTY_ORDERS_KEY = "product_sales_orders"
+DIRTY_CELLS_KEY = "product_sales_cells"
+DIRTY_KEYS = (NEW_DETAILS_KEY, DIRTY_LINES_KEY, DIRTY_ORDERS_KEY, DIRTY_CELLS_KEY)
+
+# Columns whose changes move a line to another (day, product) cell or customer.
+DETAIL_COLUMNS = ("OrderID", "ProductID", "Quantity")
+ORDER_COLUMNS = ("OrderDate", "CustomerID")
+
+
+def touch(db: Session, detail_ids=(), line_ids=(), order_ids=(), cells=()) -> None:
+    # detail_ids are new OrderDetail rows, added to the rollup as deltas.
+    # Edits recompute (Day, ProductID) cells: the cells the edited rows were in
+    # before (cells) and, at commit, the ones edited lines and the lines of
+    # edited orders are in now (line_ids, order_ids).
+    for key, ids in (
+        (NEW_DETAILS_KEY, detail_ids),
+        (DIRTY_LINES_KEY, line_ids),
+        (DIRTY_ORDERS_KEY, order_ids),
+        (DIRTY_CELLS_KEY, cells),
+    ):
+        ids = {value for value in ids if value is not None}
+        if ids:
+            db.info.setdefault(key, set()).update(ids)
+
+
+def _changed(instance, attributes) -> bool:
+    state = inspect(instance)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+def _edited(session: Session):
+    # Primary keys of the edited or deleted lines and orders in the flush.
+    line_ids, order_ids = set(), set()
+    for instance in (*session.dirty, *session.deleted):
+        deleted = instance in session.deleted
+        identity = inspect(instance).identity
+        if identity is None:
+            continue
+        if isinstance(instance, models.OrderDetail) and (deleted or _changed(instance, DETAIL_COLUMNS)):
+            line_ids.add(identity[0])
+        elif isinstance(instance, models.Orders) and (deleted or _changed(instance, ORDER_COLUMNS)):
+            order_ids.add(identity[0])
+    return line_ids, order_ids
+
+
+def cells(connection, line_condition) -> set:
+    # (Day, ProductID) cells of the matching order lines, as stored now.
+    detail = models.OrderDetail
+    day = _day()
+    return set(
+        connection.execute(
+            select(day, detail.ProductID)
+            .join(models.Orders, models.Orders.OrderID == detail.OrderID)
+            .where(line_condition)
+            .distinct()
+        ).all()
+    )
+
+
+def _line_condition(line_ids, order_ids):
+    detail = models.OrderDetail
+    return or_(detail.OrderDetailID.in_(line_ids), detail.OrderID.in_(order_ids))
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_previous_cells(session: Session, flush_context, instances) -> None:
+    # Read through the connection: a Session query would try to autoflush.
+    line_ids, order_ids = _edited(session)
+    if line_ids or order_ids:
+        touch(session, cells=cells(session.connection(), _line_condition(line_ids, order_ids)))
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_rows(session: Session, flush_context) -> None:
+    for instance in session.new:
+        if isinstance(instance, models.OrderDetail):
+            touch(session, detail_ids=[instance.OrderDetailID])
+    line_ids, order_ids = _edited(session)
+    touch(session, line_ids=line_ids, order_ids=order_ids)
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_before_commit(session: Session) -> None:
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    refresh_touched(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_touched(session: Session) -> None:
+    if not session.in_nested_transaction():
+        for key in DIRTY_KEYS:
+            session.info.pop(key, None)
+
+
+def _day():
+    return func.date(models.Orders.OrderDate, type_=Date)
+
+
+def _chunks(values: set, size: int):
+    values = sorted(values)
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def _upsert(db: Session, table, rows: list[dict], assignments) -> None:
+    # Inserts the rows; existing (Day, ProductID) cells get assignments(new row).
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(**assignments(statement.inserted))
+    else:
+        statement = (postgresql if dialect == "postgresql" else sqlite).insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(table.primary_key), set_=assignments(statement.excluded)
+        )
+    db.execute(statement, rows)
+
+
+def _add(db: Session, rows: list[dict]) -> None:
+    # Adds the deltas to existing (Day, ProductID) cells in one statement.
+    table = models.ProductDailySales.__table__
+    _upsert(
+        db,
+        table,
+        rows,
+        lambda new: {"OrderCount": table.c.OrderCount + new.OrderCount, "Quantity": table.c.Quantity + new.Quantity},
+    )
+
+
+def _sketches(db: Session, line_condition) -> dict:
+    # One HyperLogLog of distinct customers per (Day, ProductID) of the lines.
+    detail = models.OrderDetail
+    rows = db.execute(
+        select(_day(), detail.ProductID, models.Orders.CustomerID)
+        .join(models.Orders, models.Orders.OrderID == detail.OrderID)
+        .where(line_condition, detail.ProductID.is_not(None), models.Orders.CustomerID.is_not(None))
+        .distinct()
+    )
+    sketches = {}
+    for day, product_id, customer_id in rows:
+        sketch = sketches.get((day, product_id))
+        if sketch is None:
+            sketch = sketches[day, product_id] = HyperLogLog()
+        sketch.add(customer_id)
+    return sketches
+
+
+def _sketch_rows(sketches: dict) -> list[dict]:
+    return [
+        {"Day": day, "ProductID": product_id, "Sketch": sketch.to_bytes()}
+        for (day, product_id), sketch in sketches.items()
+    ]
+
+
+def _merge_sketches(db: Session, sketches: dict) -> None:
+    # Existing cells are locked while merging. Two transactions creating the
+    # same new cell at once can still drop one side's customers until the next
+    # rebuild; estimates then undercount, never overcount.
+    table = models.ProductDailyCustomers.__table__
+    existing = db.execute(
+        select(table.c.Day, table.c.ProductID, table.c.Sketch)
+        .where(
+            table.c.ProductID.in_({product_id for _, product_id in sketches}),
+            table.c.Day.in_({day for day, _ in sketches}),
+        )
+        .with_for_update()
+    )
+    for day, product_id, data in existing:
+        sketch = sketches.get((day, product_id))
+        if sketch is not None:
+            sketch.update(HyperLogLog.from_bytes(data))
+    _upsert(db, table, _sketch_rows(sketches), lambda new: {"Sketch": new.Sketch})
+
+
+def _add_details(db: Session, detail_ids: list[int]) -> None:
+    detail = models.OrderDetail
+    earlier = aliased(models.OrderDetail)
+    # An order is counted once per product, on its first line for that product.
+    first_line = ~exists().where(
+        earlier.OrderID == detail.OrderID,
+        earlier.ProductID == detail.ProductID,
+        earlier.OrderDetailID < detail.OrderDetailID,
+    )
+    day = _day()
+    rows = db.execute(
+        select(
+            day.label("Day"),
+            detail.ProductID,
+            func.sum(case((first_line, 1), else_=0)).label("OrderCount"),
+            func.sum(detail.Quantity).label("Quantity"),
+        )
+        .join(models.Orders, models.Orders.OrderID == detail.OrderID)
+        .where(detail.OrderDetailID.in_(detail_ids), detail.ProductID.is_not(None))
+        .group_by(day, detail.ProductID)
+    ).mappings().all()
+    if rows:
+        _add(db, [dict(row) for row in rows])
+    sketches = _sketches(db, detail.OrderDetailID.in_(detail_ids))
+    if sketches:
+        _merge_sketches(db, sketches)
+
+
+def _replace(db: Session, product_condition, day=None) -> None:
+    # Recomputes the products' cells, on one day only when day is given.
+    table, sketches = models.ProductDailySales.__table__, models.ProductDailyCustomers.__table__
+    detail = models.OrderDetail
+    lines = product_condition(detail.ProductID)
+    if day is not None:
+        start = datetime.combine(day, datetime.min.time())
+        lines = lines & (models.Orders.OrderDate >= start) & (models.Orders.OrderDate < start + timedelta(days=1))
+    for target in (table, sketches):
+        old = delete(target).where(product_condition(target.c.ProductID))
+        db.execute(old.where(target.c.Day == day) if day is not None else old)
+    order_day = _day()
+    db.execute(
+        insert(table).from_select(
+            ["Day", "ProductID", "OrderCount", "Quantity"],
+            select(order_day, detail.ProductID, func.count(func.distinct(detail.OrderID)), func.sum(detail.Quantity))
+            .join(models.Orders, models.Orders.OrderID == detail.OrderID)
+            .where(lines)
+            .group_by(order_day, detail.ProductID),
+        )
+    )
+    rows = _sketch_rows(_sketches(db, lines))
+    if rows:
+        db.execute(insert(sketches), rows)
+
+
+def refresh_touched(db: Session) -> None:
+    detail_ids = db.info.pop(NEW_DETAILS_KEY, set())
+    line_ids = db.info.pop(DIRTY_LINES_KEY, set())
+    order_ids = db.info.pop(DIRTY_ORDERS_KEY, set())
+    dirty = db.info.pop(DIRTY_CELLS_KEY, set())
+
+    for chunk in _chunks(line_ids, PRODUCT_SALES_CHUNK_SIZE):
+        dirty |= cells(db, models.OrderDetail.OrderDetailID.in_(chunk))
+    for chunk in _chunks(order_ids, PRODUCT_SALES_CHUNK_SIZE):
+        dirty |= cells(db, models.OrderDetail.OrderID.in_(chunk))
+    dirty = {(day, product_id) for day, product_id in dirty if day is not None and product_id is not None}
+    # New lines in a cell that is recomputed anyway are already counted there.
+    detail = models.OrderDetail
+    for chunk in _chunks(detail_ids, PRODUCT_SALES_CHUNK_SIZE):
+        if dirty:
+            chunk = [
+                line_id
+                for line_id, day, product_id in db.execute(
+                    select(detail.OrderDetailID, _day(), detail.ProductID)
+                    .join(models.Orders, models.Orders.OrderID == detail.OrderID)
+                    .where(detail.OrderDetailID.in_(chunk))
+                )
+                if (day, product_id) not in dirty
+            ]
+        if chunk:
+            _add_details(db, chunk)
+    by_day = {}
+    for day, product_id in dirty:
+        by_day.setdefault(day, set()).add(product_id)
+    for day, product_ids in sorted(by_day.items()):
+        for chunk in _chunks(product_ids, PRODUCT_SALES_CHUNK_SIZE):
+            _replace(db, lambda column: column.in_(chunk), day)
+
+
+def rebuild(db: Session, chunk_size: int = PRODUCT_SALES_CHUNK_SIZE) -> int:
+    # Full recompute in ProductID ranges, committing per range.
+    db.execute(delete(models.ProductDailySales.__table__))
+    db.execute(delete(models.ProductDailyCustomers.__table__))
+    db.commit()
+    low, high = db.execute(
+        select(func.min(models.OrderDetail.ProductID), func.max(models.OrderDetail.ProductID))
+    ).one()
+    if low is None:
+        return 0
+    for start in range(low, high + 1, chunk_size):
+        _replace(db, lambda column: column.between(start, start + chunk_size - 1))
+        db.commit()
+    return db.execute(select(func.count()).select_from(models.ProductDailySales)).scalar()
+
+
+def ensure_built(db: Session) -> None:
+    # Backfill once when a table is new and order lines already exist.
+    lines = select(models.OrderDetail.OrderDetailID).join(models.Orders).limit(1)
+    if (
+        db.execute(select(models.ProductDailySales.ProductID).limit(1)).first() is None
+        and db.execute(lines).first() is not None
+    ) or (
+        db.execute(select(models.ProductDailyCustomers.ProductID).limit(1)).first() is None
+        and db.execute(lines.where(models.Orders.CustomerID.is_not(None))).first() is not None
+    ):
+        rebuild(db)
+
+
+def main() -> None:
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild the ProductDailySales rollup and customer sketches from scratch.")
+    parser.add_argument("--chunk-size", type=int, default=PRODUCT_SALES_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        rows = rebuild(db, args.chunk_size)
+    print(f"ProductDailySales rebuilt: {rows} rows in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
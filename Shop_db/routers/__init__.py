@@ -1 +1 @@
-from . import customer, order, orderdetail, payment, gift, courier, product, supplier
+from . import customer, order, orderdetail, payment, gift, courier, product, supplier, export, admin, async_reads, checkout, bulk
@@ -0,0 +1,53 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import database
+import models
+import seed
+from database import get_db
+from .analytics import analytics_cache
+from .customer import get_current_user, is_admin, user_cache
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+def ensure_admin(current_user: models.Customer = Depends(get_current_user)) -> models.Customer:
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+
+@router.get("/auth-cache")
+def read_auth_cache_stats(current_user: models.Customer = Depends(ensure_admin)):
+    return user_cache.stats()
+
+
+@router.get("/analytics-cache")
+def read_analytics_cache_stats(current_user: models.Customer = Depends(ensure_admin)):
+    return analytics_cache.stats()
+
+
+@router.get("/pool")
+def read_pool_stats(current_user: models.Customer = Depends(ensure_admin)):
+    return database.pool_status()
+
+
+@router.post("/import")
+def import_seed_files(
+    only: List[str] | None = Query(None),
+    chunk_size: int = Query(seed.SEED_CHUNK_SIZE, ge=1, le=100_000),
+    db: Session = Depends(get_db),
+    current_user: models.Customer = Depends(ensure_admin),
+):
+    # Loads the bundled *_updated.csv files from SEED_DIR; see seed.py.
+    try:
+        report = seed.import_directory(db, seed.SEED_DIR, only, chunk_size)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except IntegrityError as exc:
+        raise HTTPException(status_code=409, detail=f"Import conflicts with existing rows: {exc.orig}")
+    user_cache.clear()
+    return {"files": report}
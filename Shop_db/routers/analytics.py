@@ -1,45 +1,124 @@
-import random
-from datetime import datetime
+import json
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from database import get_db
-from models import Customer, OrderDetail, Orders, Product
-from .customer import ensure_customer_scope, get_current_user, is_admin
+import columnar
+import crud
+import generator
+from cache import TTLCache
+from database import USE_REPLICA_KEY, get_db
+from models import Courier, Customer, Gifts, OrderDetail, Orders, OrderStatus, Payment, Product, Supplier
+from .customer import ensure_customer_scope, get_current_user, is_admin, is_seller
+from .pagination import NEXT_CURSOR_HEADER, PageParams, paginate
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
+RANDOM_ORDERS_MAX_PER_CALL = int(os.getenv("RANDOM_ORDERS_MAX_PER_CALL", "10000"))
+SUMMARY_CHUNK_SIZE = 100
+# "columnar" answers /revenue and /breakdown from the in-memory NumPy store
+# (needs numpy); anything else, or numpy missing, runs them in SQL.
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "sql").strip().lower()
+ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "300"))
+ANALYTICS_CACHE_MAXSIZE = int(os.getenv("ANALYTICS_CACHE_MAXSIZE", "1024"))
 
-def create_random_order_for_customer(db: Session, customer_id: int):
-    order = Orders(
-        CustomerID=customer_id,
-        OrderDate=datetime.now(),
-        Status="Pending",
-    )
-    db.add(order)
-    db.commit()
-    db.refresh(order)
-
-    product = (
-        db.query(Product)
-        .order_by(func.random())
-        .first()
+# Results keyed on endpoint, caller scope, parameters and the versions of the
+# tables each endpoint reads; a committed write to any of them changes the key.
+# The TTL only bounds staleness from writes made by other processes.
+analytics_cache = TTLCache(maxsize=ANALYTICS_CACHE_MAXSIZE, ttl=ANALYTICS_CACHE_TTL_SECONDS)
+
+SUMMARY_TABLES = (Orders, OrderDetail, Product, Customer)
+ORDER_TOTALS_TABLES = (Orders, OrderDetail, Product, Courier, Payment, Gifts)
+TOP_PRODUCTS_TABLES = (Orders, OrderDetail, Product)
+REVENUE_TABLES = (Orders, OrderDetail, Product, Customer, Supplier)
+COHORT_TABLES = ORDER_TOTALS_TABLES
+CUSTOMER_LTV_TABLES = (*ORDER_TOTALS_TABLES, Customer)
+COHORT_MAX_PERIODS = 60
+GroupBy = Literal["status", "country", "supplier", "customer", "product"]
+
+
+class CustomerValue(BaseModel):
+    Rank: int
+    CustomerID: int
+    Name: str
+    CohortMonth: date
+    FirstOrderDate: datetime
+    LastOrderDate: datetime
+    OrderCount: int
+    ProductsTotal: float
+    GiftAmount: float
+    LifetimeValue: float
+
+
+class TopProduct(BaseModel):
+    Rank: int
+    ProductID: int
+    Product: str
+    TotalOrders: int
+    TotalCustomers: int
+    TotalQuantity: int
+    TotalSales: float
+
+
+def _cache_key(endpoint: str, tables, current_user: Customer, *params):
+    scope = None if is_admin(current_user) else current_user.CustomerID
+    versions = crud.table_versions.snapshot(model.__tablename__ for model in tables)
+    return endpoint, scope, params, versions
+
+
+def _cache_set(db: Session, key, value) -> None:
+    # A lagging replica's result would be stored under the primary's newer
+    # versions and then served to the client that just wrote, so only results
+    # read from the primary are cached.
+    if db.info.get(USE_REPLICA_KEY) and getattr(db, "replica_bind", None) is not None and not db.wrote:
+        return
+    analytics_cache.set(key, value)
+
+
+def _next_cursor(response: Response) -> str | None:
+    return response.headers.get(NEXT_CURSOR_HEADER)
+
+
+def _date_bounds(date_from: date | None, date_to: date | None) -> tuple:
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    return (
+        datetime.combine(date_from, time.min) if date_from else None,
+        datetime.combine(date_to + timedelta(days=1), time.min) if date_to else None,
     )
 
-    order_detail = None
-    if product:
-        order_detail = OrderDetail(
-            OrderID=order.OrderID,
-            ProductID=product.ProductID,
-            Quantity=random.randint(1, 5),
-            ShippingAddress=f"Address {random.randint(1,1000)}",
-        )
-        db.add(order_detail)
-        db.commit()
-        db.refresh(order_detail)
 
+def _aggregate(db: Session, current_user: Customer, **params) -> list[dict]:
+    # Revenue grouped by period and/or a dimension, from SQL or the columnar store.
+    if ANALYTICS_ENGINE == "columnar" and columnar.available():
+        customer_id = None if is_admin(current_user) else current_user.CustomerID
+        return columnar.store.aggregate(db, customer_id=customer_id, **params)
+    rows = crud.revenue_series(db, customer_id=current_user.CustomerID, **params)
+    return [
+        {
+            **({"period": str(r.period)} if params.get("bucket") else {}),
+            **({"group": r.group} if params.get("group_by") else {}),
+            "orders": r.orders,
+            "quantity": r.quantity,
+            "revenue": float(r.revenue),
+        }
+        for r in rows
+    ]
+
+
+def create_random_order_for_customer(db: Session, customer_id: int):
+    order_ids = generator.generate_orders(db, 1, customer_id=customer_id)
+    if not order_ids:
+        # The order row was rejected, e.g. the customer was deleted meanwhile.
+        raise HTTPException(status_code=409, detail="Random order could not be created")
+    order_id = order_ids[0]
+    order = db.get(Orders, order_id)
+    order_detail = db.query(OrderDetail).filter(OrderDetail.OrderID == order_id).first()
     return order, order_detail
 
 
@@ -69,39 +148,297 @@ def create_random_order_endpoint(
     }
 
 
+@router.post("/create-random-orders")
+def create_random_orders_endpoint(
+    count: int = Query(..., ge=1),
+    customer_id: int | None = Query(None),
+    max_lines: int = Query(3, ge=1, le=20),
+    db: Session = Depends(get_db),
+    current_user: Customer = Depends(get_current_user),
+):
+    if count > RANDOM_ORDERS_MAX_PER_CALL:
+        raise HTTPException(status_code=400, detail=f"count must be at most {RANDOM_ORDERS_MAX_PER_CALL}")
+    if customer_id is None and not is_admin(current_user):
+        customer_id = current_user.CustomerID
+    if customer_id is not None:
+        ensure_customer_scope(customer_id, current_user)
+        if not db.query(Customer.CustomerID).filter(Customer.CustomerID == customer_id).first():
+            raise HTTPException(status_code=404, detail="Customer not found")
+
+    order_ids = generator.generate_orders(db, count, customer_id=customer_id, max_lines=max_lines)
+    return {
+        "created": len(order_ids),
+        "first_order_id": order_ids[0] if order_ids else None,
+        "last_order_id": order_ids[-1] if order_ids else None,
+    }
+
+
 @router.get("/orders-summary")
 def get_order_summary(
+    response: Response,
+    date_from: date | None = Query(None, alias="from"),
+    date_to: date | None = Query(None, alias="to"),
+    status: OrderStatus | None = Query(None),
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: Customer = Depends(get_current_user),
 ):
-    try:
-        query = (
-            db.query(
-                Orders.OrderID,
-                Orders.OrderDate,
-                Customer.Name.label("CustomerName"),
-                Orders.Status,
-                func.sum(OrderDetail.Quantity * Product.Price).label("total_amount"),
-            )
-            .join(OrderDetail, OrderDetail.OrderID == Orders.OrderID)
-            .join(Product, Product.ProductID == OrderDetail.ProductID)
-            .join(Customer, Customer.CustomerID == Orders.CustomerID)
-            .group_by(Orders.OrderID, Orders.OrderDate, Customer.Name, Orders.Status)
-        )
-        if not is_admin(current_user):
-            query = query.filter(Orders.CustomerID == current_user.CustomerID)
-        results = query.all()
+    start, end = _date_bounds(date_from, date_to)
+    key = _cache_key(
+        "orders-summary", SUMMARY_TABLES, current_user, date_from, date_to, status, page.after_id, page.limit
+    )
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        content, cursor = cached
+        return Response(content, media_type="application/json", headers={NEXT_CURSOR_HEADER: cursor} if cursor else None)
 
-        summary = [
-            {
+    rows = crud.get_order_summary_ids(
+        db,
+        customer_id=current_user.CustomerID,
+        date_from=start,
+        date_to=end,
+        status=status,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    order_ids = [r.OrderID for r in paginate(response, rows, page, "OrderID")]
+    query = crud.query_order_summary(db, order_ids)
+    cursor = _next_cursor(response)
+
+    def body():
+        # Same {"order_summary": [...]} document as before, written row by row.
+        # Kept for the cache once the whole document has been sent.
+        parts = ['{"order_summary": [']
+        yield parts[0]
+        for r in query.yield_per(SUMMARY_CHUNK_SIZE):
+            row = {
                 "OrderID": r.OrderID,
                 "OrderDate": r.OrderDate.isoformat(),
                 "CustomerName": r.CustomerName,
-                "Status": r.Status,
+                "Status": r.Status.value if r.Status else None,
                 "total_amount": float(r.total_amount),
             }
-            for r in results
+            parts.append(("," if len(parts) > 1 else "") + json.dumps(row, ensure_ascii=False))
+            yield parts[-1]
+        parts.append("]}")
+        yield parts[-1]
+        _cache_set(db, key, ("".join(parts), cursor))
+
+    return StreamingResponse(body(), media_type="application/json", headers={NEXT_CURSOR_HEADER: cursor} if cursor else None)
+
+
+@router.get("/order-totals")
+def get_order_totals(
+    response: Response,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db),
+    current_user: Customer = Depends(get_current_user),
+):
+    key = _cache_key("order-totals", ORDER_TOTALS_TABLES, current_user, page.after_id, page.limit)
+    cached = analytics_cache.get(key)
+    if cached is None:
+        rows = crud.get_order_totals(
+            db,
+            customer_id=current_user.CustomerID,
+            after_id=page.after_id,
+            limit=page.fetch_size,
+        )
+        totals = [
+            {
+                "OrderID": r.OrderID,
+                "ProductsTotal": float(r.ProductsTotal),
+                "CourierPrice": float(r.CourierPrice),
+                "GiftAmount": float(r.GiftAmount),
+                "TotalToPay": float(r.TotalToPay),
+            }
+            for r in paginate(response, rows, page, "OrderID")
         ]
-        return {"order_summary": summary}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        cached = totals, _next_cursor(response)
+        _cache_set(db, key, cached)
+    totals, cursor = cached
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    return totals
+
+
+@router.get("/products/top", response_model=list[TopProduct])
+def get_top_products(
+    response: Response,
+    date_from: date | None = Query(None, alias="from"),
+    date_to: date | None = Query(None, alias="to"),
+    customers: Literal["approx", "exact"] = Query("approx"),
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db),
+    current_user: Customer = Depends(get_current_user),
+):
+    if not is_admin(current_user) and not is_seller(db, current_user):
+        raise HTTPException(status_code=403, detail="Access denied")
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+
+    key = _cache_key(
+        "products/top", TOP_PRODUCTS_TABLES, current_user, date_from, date_to, customers, page.after_id, page.limit
+    )
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        rows, cursor = cached
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
+        return rows
+
+    # The cursor carries the rank of the last row returned.
+    offset = page.after_id or 0
+    rows = crud.get_top_products(
+        db,
+        date_from=date_from,
+        date_to=date_to,
+        owner_customer_id=current_user.CustomerID,
+        offset=offset,
+        limit=page.fetch_size,
+    )
+    ranked = [
+        TopProduct(
+            Rank=offset + index,
+            ProductID=r.ProductID,
+            Product=r.ProductName,
+            TotalOrders=r.TotalOrders,
+            TotalCustomers=0,
+            TotalQuantity=r.TotalQuantity,
+            TotalSales=r.TotalSales,
+        )
+        for index, r in enumerate(rows, 1)
+    ]
+    rows = paginate(response, ranked, page, "Rank")
+    # "approx" merges the daily HyperLogLog sketches (about 1.6% standard
+    # error). "exact" counts distinct customers over the products' order
+    # lines, so its cost grows with their whole history in the range.
+    count = crud.estimate_product_customers if customers == "approx" else crud.count_product_customers
+    counts = count(db, [r.ProductID for r in rows], date_from, date_to)
+    for r in rows:
+        r.TotalCustomers = counts.get(r.ProductID, 0)
+    _cache_set(db, key, (rows, _next_cursor(response)))
+    return rows
+
+
+@router.get("/revenue")
+def get_revenue(
+    bucket: Literal["day", "week", "month"] = Query("day"),
+    date_from: date | None = Query(None, alias="from"),
+    date_to: date | None = Query(None, alias="to"),
+    group_by: Literal["status", "country", "supplier"] | None = Query(None),
+    db: Session = Depends(get_db),
+    current_user: Customer = Depends(get_current_user),
+):
+    start, end = _date_bounds(date_from, date_to)
+    key = _cache_key("revenue", REVENUE_TABLES, current_user, bucket, date_from, date_to, group_by)
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        return cached
+
+    series = _aggregate(db, current_user, bucket=bucket, group_by=group_by, date_from=start, date_to=end)
+    result = {"bucket": bucket, "group_by": group_by, "series": series}
+    _cache_set(db, key, result)
+    return result
+
+
+@router.get("/breakdown")
+def get_breakdown(
+    by: GroupBy = Query(...),
+    date_from: date | None = Query(None, alias="from"),
+    date_to: date | None = Query(None, alias="to"),
+    status: OrderStatus | None = Query(None),
+    db: Session = Depends(get_db),
+    current_user: Customer = Depends(get_current_user),
+):
+    start, end = _date_bounds(date_from, date_to)
+    key = _cache_key("breakdown", REVENUE_TABLES, current_user, by, date_from, date_to, status)
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        return cached
+
+    rows = _aggregate(db, current_user, bucket=None, group_by=by, date_from=start, date_to=end, status=status)
+    result = {"by": by, "rows": rows}
+    _cache_set(db, key, result)
+    return result
+
+
+@router.get("/customers/ltv", response_model=list[CustomerValue])
+def get_customer_ltv(
+    response: Response,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db),
+    current_user: Customer = Depends(get_current_user),
+):
+    key = _cache_key("customers/ltv", CUSTOMER_LTV_TABLES, current_user, page.after_id, page.limit)
+    cached = analytics_cache.get(key)
+    if cached is None:
+        # The cursor carries the rank of the last row returned.
+        offset = page.after_id or 0
+        rows = crud.get_customer_ltv(db, customer_id=current_user.CustomerID, offset=offset, limit=page.fetch_size)
+        ranked = [
+            CustomerValue(
+                Rank=offset + index,
+                CustomerID=totals.CustomerID,
+                Name=name,
+                CohortMonth=totals.CohortMonth,
+                FirstOrderDate=totals.FirstOrderDate,
+                LastOrderDate=totals.LastOrderDate,
+                OrderCount=totals.OrderCount,
+                ProductsTotal=totals.ProductsTotal,
+                GiftAmount=totals.GiftAmount,
+                LifetimeValue=totals.LifetimeValue,
+            )
+            for index, (totals, name) in enumerate(rows, 1)
+        ]
+        cached = paginate(response, ranked, page, "Rank"), _next_cursor(response)
+        _cache_set(db, key, cached)
+    rows, cursor = cached
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    return rows
+
+
+@router.get("/cohorts")
+def get_cohorts(
+    date_from: date | None = Query(None, alias="from"),
+    date_to: date | None = Query(None, alias="to"),
+    periods: int = Query(12, ge=1, le=COHORT_MAX_PERIODS),
+    db: Session = Depends(get_db),
+    current_user: Customer = Depends(get_current_user),
+):
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Access denied")
+    _date_bounds(date_from, date_to)
+    key = _cache_key("cohorts", COHORT_TABLES, current_user, date_from, date_to, periods)
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Cohorts are keyed by the first day of the month of a customer's first order.
+    cohort_from = date_from.replace(day=1) if date_from else None
+    cohorts = {
+        r.CohortMonth: {
+            "cohort": r.CohortMonth.isoformat(),
+            "customers": r.customers,
+            "lifetime_value": float(r.lifetime_value),
+            "periods": [],
+        }
+        for r in crud.get_cohort_sizes(db, cohort_from, date_to)
+    }
+    for r in crud.get_cohort_activity(db, cohort_from, date_to):
+        offset = (r.Month.year - r.CohortMonth.year) * 12 + r.Month.month - r.CohortMonth.month
+        if offset >= periods:
+            continue
+        cohort = cohorts[r.CohortMonth]
+        cohort["periods"].append(
+            {
+                "offset": offset,
+                "month": r.Month.isoformat(),
+                "customers": r.customers,
+                "retention": round(r.customers / cohort["customers"], 4),
+                "value": float(r.value),
+            }
+        )
+    result = {"periods": periods, "cohorts": list(cohorts.values())}
+    _cache_set(db, key, result)
+    return result
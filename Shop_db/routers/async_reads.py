@@ -0,0 +1,84 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud_async
+import models
+from database import get_async_db
+from .customer import get_current_user_async, is_admin
+from .order import Order
+from .pagination import PageParams, paginate
+from .product import ProductRead
+
+# Async versions of the hottest read routes. When ASYNC_DB is enabled main.py
+# registers this router ahead of the sync ones, so these paths are served here.
+router = APIRouter()
+
+
+@router.get("/order", response_model=List[Order])
+async def read_orders(
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Customer = Depends(get_current_user_async),
+):
+    rows = await crud_async.get_orders(
+        db,
+        customer_id=current_user.CustomerID,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "OrderID")
+
+
+@router.get("/order/{order_id}", response_model=Order)
+async def read_order(
+    order_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Customer = Depends(get_current_user_async),
+):
+    order = await crud_async.get_order(db, order_id, customer_id=current_user.CustomerID)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+
+async def _product_owner_scope(db: AsyncSession, current_user: models.Customer) -> int | None:
+    if is_admin(current_user):
+        return None
+    if await crud_async.is_seller_customer(db, current_user.CustomerID):
+        return current_user.CustomerID
+    return None
+
+
+@router.get("/product", response_model=List[ProductRead])
+async def read_products(
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Customer = Depends(get_current_user_async),
+):
+    rows = await crud_async.get_products(
+        db,
+        owner_customer_id=await _product_owner_scope(db, current_user),
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "ProductID")
+
+
+@router.get("/product/{product_id}", response_model=ProductRead)
+async def read_product(
+    product_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Customer = Depends(get_current_user_async),
+):
+    product = await crud_async.get_product(
+        db,
+        product_id,
+        owner_customer_id=await _product_owner_scope(db, current_user),
+    )
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return product
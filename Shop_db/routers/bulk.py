@@ -0,0 +1,462 @@
+import os
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Body, Depends, HTTPException
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import DECIMAL, DateTime, Enum, Integer
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import crud
+import models
+from database import get_db
+from .courier import Courier
+from .customer import Customer, ensure_seller_or_admin, get_current_user, invalidate_user_cache, is_admin
+from .gift import Gift
+from .order import Order
+from .orderdetail import OrderDetail
+from .payment import Payment
+from .product import ProductCreate
+from .supplier import SupplierCreate
+
+router = APIRouter()
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "50000"))
+
+
+# ---------- SCHEMAS ----------
+class BulkError(BaseModel):
+    index: int
+    detail: str
+
+
+class BulkResult(BaseModel):
+    created: int
+    ids: List[int | None]
+    errors: List[BulkError]
+
+
+class BulkFilter(BaseModel):
+    # {"Column": value, "Column__in": [...], "Column__gte": value, ...}
+    filter: Dict[str, Any]
+
+
+class BulkUpdate(BulkFilter):
+    values: Dict[str, Any]
+
+
+# ---------- SCOPE CHECKS ----------
+# Each preparer turns one chunk of validated items into insert rows, returning a
+# row dict or an error message per item. Referenced ids are checked with one
+# query per chunk, using the same scoping as the single-row routes.
+def _visible_ids(query, column, ids) -> set:
+    ids = {value for value in ids if value is not None}
+    if not ids:
+        return set()
+    return {row[0] for row in query.with_entities(column).filter(column.in_(ids)).all()}
+
+
+def _enum_value(enum_cls, value, default=None):
+    if value is None:
+        return default
+    if value not in enum_cls.__members__:
+        raise ValueError(f"Invalid {enum_cls.__name__} '{value}'")
+    return value
+
+
+def _prepare_customers(db: Session, current_user: models.Customer, items: list) -> list:
+    rows = []
+    for item in items:
+        if not item.Name or not item.Email:
+            rows.append("Name and Email are required")
+            continue
+        rows.append(
+            {
+                "Name": item.Name,
+                "Email": item.Email,
+                "Phone": item.Phone,
+                "Country": item.Country,
+                "Role": (item.Role or "user").lower(),
+            }
+        )
+    return rows
+
+
+def _prepare_suppliers(db: Session, current_user: models.Customer, items: list) -> list:
+    return [
+        {
+            "SupplierName": item.SupplierName,
+            "Address": item.Address,
+            "Phone": item.Phone,
+            "DeliveryDate": item.DeliveryDate,
+            "Role": "seller",
+            "OwnerCustomerID": current_user.CustomerID,
+        }
+        for item in items
+    ]
+
+
+def _prepare_products(db: Session, current_user: models.Customer, items: list) -> list:
+    owner_scope = None if is_admin(current_user) else current_user.CustomerID
+    suppliers = _visible_ids(
+        crud.query_suppliers(db, owner_customer_id=owner_scope),
+        models.Supplier.SupplierID,
+        [item.SupplierID for item in items],
+    )
+    rows = []
+    for item in items:
+        if item.SupplierID and item.SupplierID not in suppliers:
+            rows.append("Supplier not found")
+            continue
+        rows.append(
+            {
+                "ProductName": item.ProductName,
+                "Price": item.Price,
+                "SupplierID": item.SupplierID,
+                "OwnerCustomerID": owner_scope,
+            }
+        )
+    return rows
+
+
+def _prepare_orders(db: Session, current_user: models.Customer, items: list) -> list:
+    rows = []
+    for item in items:
+        if is_admin(current_user):
+            customer_id = item.CustomerID or current_user.CustomerID
+        elif item.CustomerID is not None and item.CustomerID != current_user.CustomerID:
+            rows.append("Access denied")
+            continue
+        else:
+            customer_id = current_user.CustomerID
+        if item.orderDate is None:
+            rows.append("OrderDate is required")
+            continue
+        try:
+            status = _enum_value(models.OrderStatus, item.Status, "Pending")
+        except ValueError as exc:
+            rows.append(str(exc))
+            continue
+        rows.append({"OrderDate": item.orderDate, "CustomerID": customer_id, "Status": status})
+    return rows
+
+
+def _visible_orders(db: Session, current_user: models.Customer, items: list) -> set:
+    return _visible_ids(
+        crud.query_orders(db, customer_id=current_user.CustomerID),
+        models.Orders.OrderID,
+        [item.OrderID for item in items],
+    )
+
+
+def _prepare_order_details(db: Session, current_user: models.Customer, items: list) -> list:
+    orders = _visible_orders(db, current_user, items)
+    products = _visible_ids(db.query(models.Product), models.Product.ProductID, [item.ProductID for item in items])
+    rows = []
+    for item in items:
+        if item.OrderID not in orders or item.ProductID not in products:
+            rows.append("Order or Product not found")
+            continue
+        rows.append(
+            {
+                "OrderID": item.OrderID,
+                "ProductID": item.ProductID,
+                "Quantity": item.quantity or 1,
+                "ShippingAddress": item.shippingAddress,
+            }
+        )
+    return rows
+
+
+def _prepare_couriers(db: Session, current_user: models.Customer, items: list) -> list:
+    orders = _visible_orders(db, current_user, items)
+    rows = []
+    for item in items:
+        if item.OrderID is None:
+            rows.append("OrderID is required")
+        elif item.OrderID not in orders:
+            rows.append("Order not found")
+        elif not item.Name:
+            rows.append("Name is required")
+        else:
+            rows.append({"Name": item.Name, "Country": item.Country, "Price": item.Price, "OrderID": item.OrderID})
+    return rows
+
+
+def _prepare_payments(db: Session, current_user: models.Customer, items: list) -> list:
+    orders = _visible_orders(db, current_user, items)
+    rows = []
+    for item in items:
+        if item.OrderID not in orders:
+            rows.append("Order not found")
+            continue
+        if item.amount is None:
+            rows.append("Amount is required")
+            continue
+        try:
+            status = _enum_value(models.PaymentStatus, item.Status, "Pending")
+        except ValueError as exc:
+            rows.append(str(exc))
+            continue
+        rows.append(
+            {"OrderID": item.OrderID, "Status": status, "Amount": item.amount, "PaymentDate": item.PaymentDate}
+        )
+    return rows
+
+
+def _prepare_gifts(db: Session, current_user: models.Customer, items: list) -> list:
+    payments = _visible_ids(
+        crud.query_payments(db, customer_id=current_user.CustomerID),
+        models.Payment.PaymentID,
+        [item.paymentID for item in items],
+    )
+    rows = []
+    for item in items:
+        if item.paymentID and item.paymentID not in payments:
+            rows.append("Payment not found")
+            continue
+        try:
+            gift_type = _enum_value(models.GiftType, item.type)
+            unit = _enum_value(models.GiftUnit, item.unit)
+        except ValueError as exc:
+            rows.append(str(exc))
+            continue
+        if unit is None:
+            rows.append("Unit is required")
+            continue
+        rows.append(
+            {
+                "Amount": item.amount,
+                "ExparesDate": item.exparesDate,
+                "Type": gift_type,
+                "Unit": unit,
+                "PaymentID": item.paymentID,
+            }
+        )
+    return rows
+
+
+def _admin_only(db: Session, current_user: models.Customer) -> None:
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+
+def _suppliers_admin_only(db: Session, current_user: models.Customer) -> None:
+    if not is_admin(current_user):
+        raise HTTPException(
+            status_code=403,
+            detail="Supplier profile is created automatically during seller registration",
+        )
+
+
+def _any_user(db: Session, current_user: models.Customer) -> None:
+    return None
+
+
+# entity -> (model, item schema, route-level permission check, chunk preparer)
+BULK_ENTITIES = {
+    "customer": (models.Customer, Customer, _admin_only, _prepare_customers),
+    "supplier": (models.Supplier, SupplierCreate, _suppliers_admin_only, _prepare_suppliers),
+    "product": (models.Product, ProductCreate, ensure_seller_or_admin, _prepare_products),
+    "order": (models.Orders, Order, _any_user, _prepare_orders),
+    "orderdetail": (models.OrderDetail, OrderDetail, _any_user, _prepare_order_details),
+    "courier": (models.Courier, Courier, _any_user, _prepare_couriers),
+    "payment": (models.Payment, Payment, _any_user, _prepare_payments),
+    "gift": (models.Gifts, Gift, _any_user, _prepare_gifts),
+}
+
+
+# entity -> (model, columns a bulk update may set, route-level permission check)
+BULK_MUTATIONS = {
+    "customer": (models.Customer, {"Phone", "Country", "Role"}, _admin_only),
+    "supplier": (models.Supplier, {"SupplierName", "Address", "Phone", "DeliveryDate"}, ensure_seller_or_admin),
+    "product": (models.Product, {"ProductName", "Price"}, ensure_seller_or_admin),
+    "order": (models.Orders, {"Status", "OrderDate"}, _any_user),
+    "orderdetail": (models.OrderDetail, {"Quantity", "ShippingAddress"}, _any_user),
+    "courier": (models.Courier, {"Name", "Country", "Price"}, _any_user),
+    "payment": (models.Payment, {"Status", "Amount", "PaymentDate"}, _any_user),
+    "gift": (models.Gifts, {"Amount", "ExparesDate", "Type", "Unit"}, _any_user),
+}
+
+EXCLUDED_FILTER_COLUMNS = {"password_hash"}
+
+FILTER_OPERATORS = {
+    "eq": lambda column, value: column.is_(None) if value is None else column == value,
+    "ne": lambda column, value: column.is_not(None) if value is None else column != value,
+    "lt": lambda column, value: column < value,
+    "lte": lambda column, value: column <= value,
+    "gt": lambda column, value: column > value,
+    "gte": lambda column, value: column >= value,
+    "in": lambda column, value: column.in_(value),
+}
+
+
+def _coerce(column, value):
+    if value is None:
+        return None
+    column_type = column.type
+    try:
+        if isinstance(column_type, Enum) and column_type.enum_class is not None:
+            if value not in column_type.enum_class.__members__:
+                raise ValueError
+            return value
+        if isinstance(column_type, Integer):
+            if isinstance(value, bool):
+                raise ValueError
+            return int(value)
+        if isinstance(column_type, DECIMAL):
+            return Decimal(str(value))
+        if isinstance(column_type, DateTime):
+            return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+        return str(value)
+    except (TypeError, ValueError, InvalidOperation):
+        raise HTTPException(status_code=400, detail=f"Invalid value for {column.key}: {value!r}")
+
+
+def _column(model, name: str):
+    column = model.__table__.columns.get(name)
+    if column is None or name in EXCLUDED_FILTER_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Unknown column: {name}")
+    return getattr(model, name)
+
+
+def _filter_conditions(model, filters: Dict[str, Any]) -> list:
+    if not filters:
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+    conditions = []
+    for key, value in filters.items():
+        name, _, operator = key.partition("__")
+        operator = operator or "eq"
+        if operator not in FILTER_OPERATORS:
+            raise HTTPException(status_code=400, detail=f"Unknown filter operator: {operator}")
+        column = _column(model, name)
+        if operator == "in":
+            if not isinstance(value, list) or not value:
+                raise HTTPException(status_code=400, detail=f"{key} expects a non-empty list")
+            value = [_coerce(column, item) for item in value]
+        else:
+            value = _coerce(column, value)
+        conditions.append(FILTER_OPERATORS[operator](column, value))
+    return conditions
+
+
+def _mutation_target(entity: str, db: Session, current_user: models.Customer):
+    if entity not in BULK_MUTATIONS:
+        raise HTTPException(status_code=404, detail="Unknown bulk entity")
+    model, updatable, ensure_allowed = BULK_MUTATIONS[entity]
+    ensure_allowed(db, current_user)
+    return model, updatable
+
+
+def _affected_customers(db: Session, model, conditions: list, current_user: models.Customer) -> list:
+    # Customers changed in bulk lose their cached auth entry and, like the
+    # single-customer routes, their outstanding tokens.
+    if model is not models.Customer:
+        return []
+    return crud.ids_where(db, model, conditions, customer_id=current_user.CustomerID)
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in exc.errors()
+    )
+
+
+# ---------- ROUTES ----------
+@router.post("/{entity}/bulk", response_model=BulkResult)
+def bulk_create(
+    entity: str,
+    items: List[Any] = Body(...),
+    db: Session = Depends(get_db),
+    current_user: models.Customer = Depends(get_current_user),
+):
+    if entity not in BULK_ENTITIES:
+        raise HTTPException(status_code=404, detail="Unknown bulk entity")
+    if len(items) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Too many rows. Maximum is {BULK_MAX_ROWS}")
+
+    model, schema, ensure_allowed, prepare = BULK_ENTITIES[entity]
+    ensure_allowed(db, current_user)
+
+    ids: list[int | None] = [None] * len(items)
+    errors = []
+    with crud.unit_of_work(db):
+        for start in range(0, len(items), BULK_CHUNK_SIZE):
+            positions, validated = [], []
+            for index in range(start, min(start + BULK_CHUNK_SIZE, len(items))):
+                try:
+                    validated.append(schema.model_validate(items[index]))
+                    positions.append(index)
+                except ValidationError as exc:
+                    errors.append({"index": index, "detail": _validation_message(exc)})
+
+            pending_positions, rows = [], []
+            for index, row in zip(positions, prepare(db, current_user, validated)):
+                if isinstance(row, str):
+                    errors.append({"index": index, "detail": row})
+                else:
+                    pending_positions.append(index)
+                    rows.append(row)
+            if not rows:
+                continue
+
+            for index, result in zip(pending_positions, crud.bulk_insert(db, model, rows, BULK_CHUNK_SIZE)):
+                if isinstance(result, str):
+                    errors.append({"index": index, "detail": result})
+                else:
+                    ids[index] = result
+
+    errors.sort(key=lambda error: error["index"])
+    return {"created": sum(1 for value in ids if value is not None), "ids": ids, "errors": errors}
+
+
+@router.patch("/{entity}/bulk")
+def bulk_update(
+    entity: str,
+    payload: BulkUpdate,
+    db: Session = Depends(get_db),
+    current_user: models.Customer = Depends(get_current_user),
+):
+    model, updatable = _mutation_target(entity, db, current_user)
+    if not payload.values:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    not_allowed = sorted(set(payload.values) - updatable)
+    if not_allowed:
+        raise HTTPException(status_code=400, detail=f"Columns cannot be bulk updated: {', '.join(not_allowed)}")
+
+    conditions = _filter_conditions(model, payload.filter)
+    values = {name: _coerce(_column(model, name), value) for name, value in payload.values.items()}
+    if "Role" in values and values["Role"] is not None:
+        values["Role"] = values["Role"].lower()
+    customer_ids = _affected_customers(db, model, conditions, current_user)
+    try:
+        updated = crud.update_where(db, model, conditions, values, customer_id=current_user.CustomerID)
+    except IntegrityError as exc:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"Update violates a constraint: {exc.orig}")
+    for customer_id in customer_ids:
+        invalidate_user_cache(customer_id, revoke_tokens="Role" in values)
+    return {"updated": updated}
+
+
+@router.delete("/{entity}/bulk")
+def bulk_delete(
+    entity: str,
+    payload: BulkFilter,
+    db: Session = Depends(get_db),
+    current_user: models.Customer = Depends(get_current_user),
+):
+    model, _ = _mutation_target(entity, db, current_user)
+    conditions = _filter_conditions(model, payload.filter)
+    customer_ids = _affected_customers(db, model, conditions, current_user)
+    try:
+        deleted = crud.delete_where(db, model, conditions, customer_id=current_user.CustomerID)
+    except IntegrityError as exc:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"Rows are still referenced: {exc.orig}")
+    for customer_id in customer_ids:
+        invalidate_user_cache(customer_id)
+    return {"deleted": deleted}
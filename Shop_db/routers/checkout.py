@@ -0,0 +1,103 @@
+from datetime import datetime
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field, condecimal, constr
+from sqlalchemy.orm import Session
+
+import crud
+import models
+from database import get_db
+from .customer import get_current_user, is_admin
+
+router = APIRouter()
+
+
+# ---------- SCHEMAS ----------
+class CheckoutLine(BaseModel):
+    ProductID: int
+    Quantity: int = Field(1, ge=1)
+    ShippingAddress: str | None = None
+
+
+class CheckoutCourier(BaseModel):
+    Name: constr(min_length=2, max_length=100)
+    Country: constr(min_length=2, max_length=50) | None = None
+    Price: condecimal(gt=0) | None = None
+
+
+class CheckoutGift(BaseModel):
+    Amount: float | None = None
+    ExparesDate: datetime | None = None
+    Type: models.GiftType | None = None
+    Unit: models.GiftUnit
+
+
+class Checkout(BaseModel):
+    CustomerID: int | None = None
+    OrderDate: datetime | None = None
+    ShippingAddress: str | None = None
+    PaymentStatus: models.PaymentStatus = models.PaymentStatus.Pending
+    lines: List[CheckoutLine] = Field(..., min_length=1)
+    courier: CheckoutCourier | None = None
+    gifts: List[CheckoutGift] = []
+
+
+class CheckoutRead(BaseModel):
+    OrderID: int
+    CustomerID: int
+    OrderDate: datetime
+    Status: str
+    PaymentID: int
+    Amount: float
+    PaymentStatus: str
+    CourierID: int | None = None
+    OrderDetailIDs: List[int]
+    GiftIDs: List[int]
+
+
+# ---------- ROUTES ----------
+@router.post("/checkout", response_model=CheckoutRead)
+def checkout(
+    payload: Checkout,
+    db: Session = Depends(get_db),
+    current_user: models.Customer = Depends(get_current_user),
+):
+    if not is_admin(current_user):
+        if payload.CustomerID is not None and payload.CustomerID != current_user.CustomerID:
+            raise HTTPException(status_code=403, detail="Access denied")
+        target_customer_id = current_user.CustomerID
+    else:
+        target_customer_id = payload.CustomerID or current_user.CustomerID
+
+    lines = []
+    for line in payload.lines:
+        data = line.model_dump()
+        data["ShippingAddress"] = data["ShippingAddress"] or payload.ShippingAddress
+        lines.append(data)
+
+    with crud.unit_of_work(db):
+        order = crud.checkout(
+            db,
+            customer_id=target_customer_id,
+            lines=lines,
+            order_date=payload.OrderDate,
+            courier=payload.courier.model_dump() if payload.courier else None,
+            gifts=[gift.model_dump() for gift in payload.gifts],
+            payment_status=payload.PaymentStatus,
+        )
+        if order is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+
+    return {
+        "OrderID": order.OrderID,
+        "CustomerID": order.CustomerID,
+        "OrderDate": order.OrderDate,
+        "Status": order.Status.value,
+        "PaymentID": order.payment.PaymentID,
+        "Amount": order.payment.Amount,
+        "PaymentStatus": order.payment.Status.value,
+        "CourierID": order.courier.CourierID if order.courier else None,
+        "OrderDetailIDs": [detail.OrderDetailID for detail in order.details],
+        "GiftIDs": [gift.GiftID for gift in order.payment.gifts],
+    }
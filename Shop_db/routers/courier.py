@@ -1,6 +1,6 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel, condecimal, constr
 from sqlalchemy.orm import Session
 
@@ -8,6 +8,7 @@ import crud
 import models
 from database import get_db
 from .customer import ensure_customer_scope, get_current_user
+from .pagination import PageParams, paginate
 
 router = APIRouter()
 
@@ -29,10 +30,18 @@ class Courier(BaseModel):
 # ---------- ROUTES ----------
 @router.get("/courier", response_model=List[Courier])
 def read_couriers(
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
-    return crud.get_couriers(db, customer_id=current_user.CustomerID)
+    rows = crud.get_couriers(
+        db,
+        customer_id=current_user.CustomerID,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "CourierID")
 
 
 @router.get("/courier/{courier_id}", response_model=Courier)
@@ -111,15 +120,14 @@ def get_courier_by_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id, with_courier=True)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    courier = db.query(models.Courier).filter(models.Courier.OrderID == order_id).first()
-    if not courier:
+    if not path.courier:
         raise HTTPException(status_code=404, detail="Courier not found for this order")
 
-    return courier
+    return path.courier
 
 
 @router.post("/customer/{customer_id}/orders/{order_id}/courier", response_model=Courier)
@@ -132,8 +140,8 @@ def create_courier_for_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
     return crud.create_courier(db, courier.Name, courier.Country, courier.Price, order_id)
@@ -149,11 +157,11 @@ def update_courier_for_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id, with_courier=True)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    courier_record = db.query(models.Courier).filter(models.Courier.OrderID == order_id).first()
+    courier_record = path.courier
     if not courier_record:
         raise HTTPException(status_code=404, detail="Courier not found for this order")
 
@@ -180,11 +188,11 @@ def delete_courier_for_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id, with_courier=True)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    courier_record = db.query(models.Courier).filter(models.Courier.OrderID == order_id).first()
+    courier_record = path.courier
     if not courier_record:
         raise HTTPException(status_code=404, detail="Courier not found for this order")
 
@@ -1,19 +1,23 @@
 import hashlib
 import hmac
 import os
+import time
 from datetime import datetime, timedelta
 from typing import List
 
 import jwt
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr, constr
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 import crud
+import crud_async
 import models
-from database import DATABASE_URL, get_db
+from cache import ExpiringDict, TTLCache
+from database import DATABASE_URL, get_async_db, get_db
+from .pagination import PageParams, paginate
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
@@ -30,6 +34,21 @@ def _stable_default_signing_key() -> str:
 JWT_SIGNING_KEY = os.getenv("JWT_SIGNING_KEY", _stable_default_signing_key())
 PASSWORD_SIGNING_KEY = os.getenv("PASSWORD_SIGNING_KEY", JWT_SIGNING_KEY)
 ADMIN_REGISTRATION_KEY = os.getenv("ADMIN_REGISTRATION_KEY", "1461")
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAXSIZE = int(os.getenv("AUTH_CACHE_MAXSIZE", "10000"))
+
+# (customer_id, token iat) -> Customer column values, shared across requests.
+user_cache = TTLCache(maxsize=AUTH_CACHE_MAXSIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+CACHED_CUSTOMER_COLUMNS = ("CustomerID", "Name", "Email", "Phone", "Country", "Role")
+
+# Stateless mode trusts the identity and role claims of a valid token instead of
+# re-reading Customer on every request. Tokens are short-lived in this mode and
+# are rejected if they were issued before the customer was last changed.
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "0").strip().lower() in {"1", "true", "yes"}
+STATELESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("STATELESS_TOKEN_EXPIRE_MINUTES", "15"))
+# customer_id -> unix time of the last change; lives as long as a token can.
+# Not size-bounded: an evicted entry would make its revoked tokens valid again.
+token_revocations = ExpiringDict(ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 auth_router = APIRouter()
@@ -42,8 +61,11 @@ def _hs256_sign(value: str, key: str) -> str:
 
 def create_access_token(data: dict):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    issued_at = time.time()
+    lifetime = STATELESS_TOKEN_EXPIRE_MINUTES if AUTH_STATELESS else ACCESS_TOKEN_EXPIRE_MINUTES
+    expire = datetime.utcfromtimestamp(issued_at) + timedelta(minutes=lifetime)
+    # Sub-second iat so a token issued right after a revocation is still accepted.
+    to_encode.update({"exp": expire, "iat": issued_at})
     encoded_jwt = jwt.encode(to_encode, JWT_SIGNING_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -71,15 +93,7 @@ def is_admin(current_user: models.Customer) -> bool:
 def is_seller(db: Session, current_user: models.Customer) -> bool:
     if is_admin(current_user):
         return False
-    seller_profile = (
-        db.query(models.Supplier)
-        .filter(
-            models.Supplier.OwnerCustomerID == current_user.CustomerID,
-            func.lower(models.Supplier.Role) == ROLE_SELLER,
-        )
-        .first()
-    )
-    return seller_profile is not None
+    return crud.is_seller_customer(db, current_user.CustomerID)
 
 
 def ensure_seller_or_admin(db: Session, current_user: models.Customer) -> None:
@@ -96,28 +110,129 @@ def ensure_customer_scope(customer_id: int, current_user: models.Customer) -> No
         raise HTTPException(status_code=403, detail="Access denied")
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, JWT_SIGNING_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        customer_id = payload.get("customer_id")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid credentials")
+def invalidate_user_cache(customer_id: int, revoke_tokens: bool = True) -> None:
+    user_cache.invalidate(lambda key: key[0] == customer_id)
+    if revoke_tokens:
+        token_revocations.set(customer_id, time.time())
+
+
+def _is_revoked(customer_id: int, issued_at) -> bool:
+    revoked_at = token_revocations.get(customer_id)
+    return revoked_at is not None and (issued_at is None or issued_at <= revoked_at)
+
+
+class ClaimsPrincipal:
+    # Identity and role come from the token; any other Customer attribute is
+    # loaded from the database the first time a handler asks for it. Async
+    # handlers only read CustomerID/Role, since the lazy load is synchronous.
+    def __init__(self, db: Session, customer_id: int, name: str, role: str):
+        self.CustomerID = customer_id
+        self.Name = name
+        self.Role = role
+        self._db = db
+        self._customer = None
 
-        customer = None
-        if customer_id is not None:
-            customer = db.query(models.Customer).filter(models.Customer.CustomerID == customer_id).first()
+    def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+        if self._customer is None:
+            self._customer = crud.get_customer(self._db, self.CustomerID)
+            if self._customer is None:
+                raise HTTPException(status_code=401, detail="User not found")
+        return getattr(self._customer, item)
 
-        if customer is None:
-            customer = db.query(models.Customer).filter(models.Customer.Name == username).first()
 
-        if customer is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return customer
+def _cached_customer(cache_key) -> models.Customer | None:
+    if cache_key is None:
+        return None
+    snapshot = user_cache.get(cache_key)
+    if snapshot is None:
+        return None
+    # A fresh transient instance per request, so nothing leaks between sessions.
+    return models.Customer(**snapshot)
+
+
+def _decode_access_token(token: str) -> dict:
+    try:
+        payload = jwt.decode(token, JWT_SIGNING_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    return payload
+
+
+def _token_cache_key(payload: dict):
+    customer_id = payload.get("customer_id")
+    issued_at = payload.get("iat")
+    return (customer_id, issued_at) if customer_id is not None and issued_at is not None else None
+
+
+def _principal_without_lookup(db, payload: dict):
+    customer_id = payload.get("customer_id")
+    role = payload.get("role")
+    if AUTH_STATELESS and customer_id is not None and role is not None:
+        if _is_revoked(customer_id, payload.get("iat")):
+            raise HTTPException(status_code=401, detail="Token revoked")
+        principal = ClaimsPrincipal(db, customer_id, payload["sub"], role)
+        crud.remember_customer(db, principal)
+        if "seller" in payload:
+            crud.remember_seller(db, customer_id, bool(payload["seller"]))
+        return principal
+
+    customer = _cached_customer(_token_cache_key(payload))
+    if customer is not None:
+        crud.remember_customer(db, customer)
+    return customer
+
+
+def _remember_loaded_customer(db, payload: dict, customer: models.Customer | None) -> models.Customer:
+    if customer is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    cache_key = _token_cache_key(payload)
+    if cache_key is not None and customer.CustomerID == cache_key[0]:
+        user_cache.set(cache_key, {column: getattr(customer, column) for column in CACHED_CUSTOMER_COLUMNS})
+    crud.remember_customer(db, customer)
+    return customer
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    payload = _decode_access_token(token)
+    principal = _principal_without_lookup(db, payload)
+    if principal is not None:
+        return principal
+
+    customer = None
+    customer_id = payload.get("customer_id")
+    if customer_id is not None:
+        customer = db.query(models.Customer).filter(models.Customer.CustomerID == customer_id).first()
+
+    if customer is None:
+        customer = db.query(models.Customer).filter(models.Customer.Name == payload["sub"]).first()
+
+    return _remember_loaded_customer(db, payload, customer)
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+):
+    payload = _decode_access_token(token)
+    principal = _principal_without_lookup(db, payload)
+    if principal is not None:
+        return principal
+
+    customer = None
+    customer_id = payload.get("customer_id")
+    if customer_id is not None:
+        customer = await crud_async.get_customer(db, customer_id)
+
+    if customer is None:
+        customer = await crud_async.get_customer_by_name(db, payload["sub"])
+
+    return _remember_loaded_customer(db, payload, customer)
 
 
 @auth_router.post("/register")
@@ -143,30 +258,33 @@ def register(
 
     persisted_customer_role = ROLE_USER if normalized_role == ROLE_SELLER else normalized_role
 
-    new_customer = models.Customer(
-        Name=username,
-        Email=email,
-        Phone=phone,
-        Country=country,
-        Role=persisted_customer_role,
-        password_hash=get_password_hash(password),
-    )
-    db.add(new_customer)
-    db.commit()
-    db.refresh(new_customer)
-
     supplier_id = None
-    if normalized_role == ROLE_SELLER:
-        seller_profile = models.Supplier(
-            SupplierName=username,
+    with crud.unit_of_work(db):
+        new_customer = models.Customer(
+            Name=username,
+            Email=email,
             Phone=phone,
-            Role=ROLE_SELLER,
-            OwnerCustomerID=new_customer.CustomerID,
+            Country=country,
+            Role=persisted_customer_role,
+            password_hash=get_password_hash(password),
         )
-        db.add(seller_profile)
-        db.commit()
-        db.refresh(seller_profile)
-        supplier_id = seller_profile.SupplierID
+        db.add(new_customer)
+        db.flush()
+
+        if normalized_role == ROLE_SELLER:
+            seller_profile = models.Supplier(
+                SupplierName=username,
+                Phone=phone,
+                Role=ROLE_SELLER,
+                OwnerCustomerID=new_customer.CustomerID,
+            )
+            db.add(seller_profile)
+            db.flush()
+            supplier_id = seller_profile.SupplierID
+
+    crud.forget_customer(db, new_customer.CustomerID)
+    crud.remember_customer(db, new_customer)
+    invalidate_user_cache(new_customer.CustomerID, revoke_tokens=False)
 
     return {
         "message": "User created successfully",
@@ -181,13 +299,14 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     if not customer or not customer.password_hash or not verify_password(form_data.password, customer.password_hash):
         raise HTTPException(status_code=401, detail="Invalid username or password")
 
-    token = create_access_token(
-        {
-            "sub": customer.Name,
-            "customer_id": customer.CustomerID,
-            "role": (customer.Role or ROLE_USER).lower(),
-        }
-    )
+    claims = {
+        "sub": customer.Name,
+        "customer_id": customer.CustomerID,
+        "role": (customer.Role or ROLE_USER).lower(),
+    }
+    if AUTH_STATELESS:
+        claims["seller"] = is_seller(db, customer)
+    token = create_access_token(claims)
     return {"access_token": token, "token_type": "bearer"}
 
 # ---------- SCHEMAS ----------
@@ -218,11 +337,14 @@ class CustomerRead(BaseModel):
 # ---------- ROUTES ----------
 @router.get("/customer", response_model=List[CustomerRead])
 def read_customers(
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
     if is_admin(current_user):
-        return crud.get_customers(db)
+        rows = crud.get_customers(db, after_id=page.after_id, limit=page.fetch_size)
+        return paginate(response, rows, page, "CustomerID")
 
     customer = crud.get_customer(db, current_user.CustomerID)
     return [customer] if customer else []
@@ -256,7 +378,9 @@ def update_customer(
     update_data = customer.dict(exclude_unset=True)
     if not is_admin(current_user):
         update_data.pop("Role", None)
-    return crud.update_customer(db, target_customer_id, **update_data)
+    updated = crud.update_customer(db, target_customer_id, **update_data)
+    invalidate_user_cache(target_customer_id, revoke_tokens=bool({"Name", "Role"} & update_data.keys()))
+    return updated
 
 @router.delete("/customer/{customer_id}")
 def delete_customer(
@@ -267,6 +391,7 @@ def delete_customer(
     ensure_customer_scope(customer_id, current_user)
     target_customer_id = customer_id if is_admin(current_user) else current_user.CustomerID
     db_customer = crud.delete_customer(db, target_customer_id)
+    invalidate_user_cache(target_customer_id)
     if not db_customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     return {"message": "Customer deleted successfully"}
@@ -0,0 +1,118 @@
+import csv
+import enum
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+import crud
+import models
+from database import get_db
+from .customer import get_current_user, is_admin, is_seller
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+EXPORT_CHUNK_SIZE = 1000
+
+# entity -> (model, primary key, scoped query builder)
+EXPORTS = {
+    "customer": (models.Customer, "CustomerID", crud.query_customers),
+    "supplier": (models.Supplier, "SupplierID", crud.query_suppliers),
+    "product": (models.Product, "ProductID", crud.query_products),
+    "order": (models.Orders, "OrderID", crud.query_orders),
+    "orderdetail": (models.OrderDetail, "OrderDetailID", crud.query_order_details),
+    "courier": (models.Courier, "CourierID", crud.query_couriers),
+    "payment": (models.Payment, "PaymentID", crud.query_payments),
+    "gift": (models.Gifts, "GiftID", crud.query_gifts),
+}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXCLUDED_COLUMNS = {"password_hash"}
+
+
+def _export_scope(db: Session, entity: str, current_user: models.Customer) -> int | None:
+    if is_admin(current_user):
+        return None
+    if entity == "product":
+        return current_user.CustomerID if is_seller(db, current_user) else None
+    return current_user.CustomerID
+
+
+def _serialize_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _iter_rows(query, columns):
+    # stream_results keeps a server-side cursor open on MySQL; yield_per bounds
+    # how many rows are buffered client-side at any time.
+    result = query.with_entities(*columns).execution_options(stream_results=True).yield_per(EXPORT_CHUNK_SIZE)
+    for row in result:
+        yield [_serialize_value(value) for value in row]
+
+
+def _stream_ndjson(rows, names):
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(dict(zip(names, row)), ensure_ascii=False))
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield "\n".join(buffer) + "\n"
+            buffer.clear()
+    if buffer:
+        yield "\n".join(buffer) + "\n"
+
+
+def _stream_csv(rows, names):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+@router.get("/{entity}")
+def export_entity(
+    entity: str,
+    format: str = Query("ndjson"),
+    db: Session = Depends(get_db),
+    current_user: models.Customer = Depends(get_current_user),
+):
+    if entity not in EXPORTS:
+        raise HTTPException(status_code=404, detail="Unknown export entity")
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid format. Allowed values: ndjson, csv")
+
+    model, key, build_query = EXPORTS[entity]
+    columns = [column for column in model.__table__.columns if column.name not in EXCLUDED_COLUMNS]
+    names = [column.name for column in columns]
+
+    query = build_query(db, _export_scope(db, entity, current_user)).order_by(getattr(model, key))
+    rows = _iter_rows(query, columns)
+    body = _stream_ndjson(rows, names) if format == "ndjson" else _stream_csv(rows, names)
+
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{entity}.{format}"'},
+    )
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
@@ -9,6 +9,7 @@ import crud
 import models
 from database import get_db
 from .customer import ensure_customer_scope, get_current_user
+from .pagination import PageParams, paginate
 
 router = APIRouter()
 
@@ -31,10 +32,18 @@ class Gift(BaseModel):
 # ---------- ROUTES ----------
 @router.get("/gift", response_model=List[Gift])
 def read_gifts(
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
-    return crud.get_gifts(db, customer_id=current_user.CustomerID)
+    rows = crud.get_gifts(
+        db,
+        customer_id=current_user.CustomerID,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "GiftID")
 
 
 @router.get("/gift/{gift_id}", response_model=Gift)
@@ -108,20 +117,28 @@ def get_gifts_by_payment(
     customer_id: int,
     order_id: int,
     payment_id: int,
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id, payment_id=payment_id)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    payment = crud.get_payment(db, payment_id, customer_id=customer_id)
-    if not payment or payment.OrderID != order_id:
+    if not path.payment or path.payment.OrderID != order_id:
         raise HTTPException(status_code=404, detail="Payment not found for this order")
 
-    return [g for g in crud.get_gifts(db, customer_id=customer_id) if g.PaymentID == payment_id]
+    rows = crud.get_gifts_by_payment(
+        db,
+        payment_id,
+        customer_id=customer_id,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "GiftID")
 
 
 @router.post("/customer/{customer_id}/orders/{order_id}/payment/{payment_id}/gift", response_model=Gift)
@@ -135,12 +152,11 @@ def create_gift_for_payment(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id, payment_id=payment_id)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    payment = crud.get_payment(db, payment_id, customer_id=customer_id)
-    if not payment or payment.OrderID != order_id:
+    if not path.payment or path.payment.OrderID != order_id:
         raise HTTPException(status_code=404, detail="Payment not found for this order")
 
     return crud.create_gift(
@@ -165,16 +181,14 @@ def update_gift_for_payment(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id, payment_id=payment_id, gift_id=gift_id)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    payment = crud.get_payment(db, payment_id, customer_id=customer_id)
-    if not payment or payment.OrderID != order_id:
+    if not path.payment or path.payment.OrderID != order_id:
         raise HTTPException(status_code=404, detail="Payment not found for this order")
 
-    db_gift = crud.get_gift(db, gift_id, customer_id=customer_id)
-    if not db_gift or db_gift.PaymentID != payment_id:
+    if not path.gift or path.gift.PaymentID != payment_id:
         raise HTTPException(status_code=404, detail="Gift not found for this payment")
 
     return crud.update_gift(
@@ -196,16 +210,14 @@ def delete_gift_for_payment(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id, payment_id=payment_id, gift_id=gift_id)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    payment = crud.get_payment(db, payment_id, customer_id=customer_id)
-    if not payment or payment.OrderID != order_id:
+    if not path.payment or path.payment.OrderID != order_id:
         raise HTTPException(status_code=404, detail="Payment not found for this order")
 
-    db_gift = crud.get_gift(db, gift_id, customer_id=customer_id)
-    if not db_gift or db_gift.PaymentID != payment_id:
+    if not path.gift or path.gift.PaymentID != payment_id:
         raise HTTPException(status_code=404, detail="Gift not found for this payment")
 
     if not crud.delete_gift(db, gift_id, customer_id=customer_id):
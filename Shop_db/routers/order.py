@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
@@ -9,6 +9,7 @@ import crud
 import models
 from database import get_db
 from .customer import ensure_customer_scope, get_current_user, is_admin
+from .pagination import PageParams, paginate
 
 router = APIRouter()
 
@@ -29,10 +30,18 @@ class Config:
 # ---------- ROUTES ----------
 @router.get("/order", response_model=List[Order])
 def read_orders(
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
-    return crud.get_orders(db, customer_id=current_user.CustomerID)
+    rows = crud.get_orders(
+        db,
+        customer_id=current_user.CustomerID,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "OrderID")
 
 
 @router.get("/order/{order_id}", response_model=Order)
@@ -104,11 +113,14 @@ def delete_order(
 @router.get("/customer/{customer_id}/orders")
 def get_orders_by_customer(
     customer_id: int,
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
     ensure_customer_scope(customer_id, current_user)
-    return crud.get_orders(db, customer_id=customer_id)
+    rows = crud.get_orders(db, customer_id=customer_id, after_id=page.after_id, limit=page.fetch_size)
+    return paginate(response, rows, page, "OrderID")
 
 
 @router.post("/customer/{customer_id}/orders", response_model=Order)
@@ -140,8 +152,8 @@ def update_order_for_customer(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    db_order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not db_order:
+    path = crud.resolve_order_path(db, customer_id, order_id)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
     update_data = order.dict(exclude_unset=True)
@@ -164,8 +176,8 @@ def delete_order_for_customer(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    db_order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not db_order:
+    path = crud.resolve_order_path(db, customer_id, order_id)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
     crud.delete_order(db, order_id, customer_id=customer_id)
@@ -1,6 +1,6 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
@@ -8,6 +8,7 @@ import crud
 import models
 from database import get_db
 from .customer import ensure_customer_scope, get_current_user
+from .pagination import PageParams, paginate
 
 router = APIRouter()
 
@@ -29,10 +30,18 @@ class OrderDetail(BaseModel):
 # ---------- ROUTES ----------
 @router.get("/orderdetail", response_model=List[OrderDetail])
 def read_details(
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
-    return crud.get_order_details(db, customer_id=current_user.CustomerID)
+    rows = crud.get_order_details(
+        db,
+        customer_id=current_user.CustomerID,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "OrderDetailID")
 
 
 @router.get("/orderdetail/{orderdetail_id}", response_model=OrderDetail)
@@ -114,16 +123,25 @@ def delete_detail(
 def get_details_by_order(
     customer_id: int,
     order_id: int,
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    return [d for d in crud.get_order_details(db, customer_id=customer_id) if d.OrderID == order_id]
+    rows = crud.get_order_details_by_order(
+        db,
+        order_id,
+        customer_id=customer_id,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "OrderDetailID")
 
 
 @router.post("/customer/{customer_id}/orders/{order_id}/orderdetail", response_model=OrderDetail)
@@ -136,9 +154,8 @@ def create_detail_for_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    product = crud.get_product(db, detail.ProductID)
-    if not order or not product:
+    path = crud.resolve_order_path(db, customer_id, order_id, product_id=detail.ProductID)
+    if not path.order or not path.product:
         raise HTTPException(status_code=404, detail="Order or Product not found for this customer")
 
     return crud.create_order_detail(
@@ -161,17 +178,20 @@ def update_detail_for_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    db_detail = crud.get_order_detail(db, detail_id, customer_id=customer_id)
-    if not order or not db_detail or db_detail.OrderID != order.OrderID:
-        raise HTTPException(status_code=404, detail="OrderDetail not found for this customer and order")
-
     update_data = detail.dict(by_alias=True, exclude_unset=True)
 
-    if "ProductID" in update_data:
-        product = crud.get_product(db, update_data["ProductID"])
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
+    path = crud.resolve_order_path(
+        db,
+        customer_id,
+        order_id,
+        detail_id=detail_id,
+        product_id=update_data.get("ProductID"),
+    )
+    if not path.order or not path.detail or path.detail.OrderID != path.order.OrderID:
+        raise HTTPException(status_code=404, detail="OrderDetail not found for this customer and order")
+
+    if "ProductID" in update_data and not path.product:
+        raise HTTPException(status_code=404, detail="Product not found")
 
     return crud.update_order_detail(db, detail_id, customer_id=customer_id, **update_data)
 
@@ -186,9 +206,8 @@ def delete_detail_for_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    db_detail = crud.get_order_detail(db, detail_id, customer_id=customer_id)
-    if not order or not db_detail or db_detail.OrderID != order.OrderID:
+    path = crud.resolve_order_path(db, customer_id, order_id, detail_id=detail_id)
+    if not path.order or not path.detail or path.detail.OrderID != path.order.OrderID:
         raise HTTPException(status_code=404, detail="OrderDetail not found for this customer and order")
 
     if not crud.delete_order_detail(db, detail_id, customer_id=customer_id):
@@ -0,0 +1,51 @@
+import base64
+import binascii
+import json
+import os
+
+from fastapi import HTTPException, Query, Response
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(last_id: int) -> str:
+    raw = json.dumps({"after": last_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> int | None:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        after_id = payload["after"]
+    except (binascii.Error, ValueError, TypeError, KeyError, UnicodeEncodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(after_id, int) or isinstance(after_id, bool):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after_id
+
+
+class PageParams:
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+        cursor: str | None = Query(None),
+    ):
+        self.limit = min(limit, MAX_PAGE_SIZE)
+        self.after_id = decode_cursor(cursor)
+
+    @property
+    def fetch_size(self) -> int:
+        # One extra row tells us whether another page exists without a COUNT(*).
+        return self.limit + 1
+
+
+def paginate(response: Response, rows: list, page: PageParams, key: str) -> list:
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(rows[-1], key))
+    return rows
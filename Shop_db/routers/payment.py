@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
@@ -9,6 +9,7 @@ import crud
 import models
 from database import get_db
 from .customer import ensure_customer_scope, get_current_user
+from .pagination import PageParams, paginate
 
 router = APIRouter()
 
@@ -31,10 +32,18 @@ class Payment(BaseModel):
 # ---------- ROUTES ----------
 @router.get("/payment", response_model=List[Payment])
 def read_payments(
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
-    return crud.get_payments(db, customer_id=current_user.CustomerID)
+    rows = crud.get_payments(
+        db,
+        customer_id=current_user.CustomerID,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "PaymentID")
 
 
 @router.get("/payment/{payment_id}", response_model=Payment)
@@ -110,15 +119,14 @@ def get_payment_by_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id, with_payment=True)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    payment = db.query(models.Payment).filter(models.Payment.OrderID == order_id).first()
-    if not payment:
+    if not path.payment:
         raise HTTPException(status_code=404, detail="Payment not found for this order")
 
-    return payment
+    return path.payment
 
 
 @router.post("/customer/{customer_id}/orders/{order_id}/payment", response_model=Payment)
@@ -131,8 +139,8 @@ def create_payment_for_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
     return crud.create_payment(
@@ -154,11 +162,11 @@ def update_payment_for_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id, with_payment=True)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    payment_record = db.query(models.Payment).filter(models.Payment.OrderID == order_id).first()
+    payment_record = path.payment
     if not payment_record:
         raise HTTPException(status_code=404, detail="Payment not found for this order")
 
@@ -179,11 +187,11 @@ def delete_payment_for_order(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    if not order:
+    path = crud.resolve_order_path(db, customer_id, order_id, with_payment=True)
+    if not path.order:
         raise HTTPException(status_code=404, detail="Order not found for this customer")
 
-    payment_record = db.query(models.Payment).filter(models.Payment.OrderID == order_id).first()
+    payment_record = path.payment
     if not payment_record:
         raise HTTPException(status_code=404, detail="Payment not found for this order")
 
@@ -1,6 +1,6 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel, condecimal, constr
 from sqlalchemy.orm import Session
 
@@ -8,6 +8,7 @@ import crud
 import models
 from database import get_db
 from .customer import ensure_customer_scope, ensure_seller_or_admin, get_current_user, is_admin, is_seller
+from .pagination import PageParams, paginate
 
 router = APIRouter()
 
@@ -33,14 +34,21 @@ class ProductRead(ProductBase):
 # ---------- ROUTES ----------
 @router.get("/product", response_model=List[ProductRead])
 def read_products(
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
-    if is_admin(current_user):
-        return crud.get_products(db)
-    if is_seller(db, current_user):
-        return crud.get_products(db, owner_customer_id=current_user.CustomerID)
-    return crud.get_products(db)
+    owner_scope = None
+    if not is_admin(current_user) and is_seller(db, current_user):
+        owner_scope = current_user.CustomerID
+    rows = crud.get_products(
+        db,
+        owner_customer_id=owner_scope,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "ProductID")
 
 
 @router.get("/product/{product_id}", response_model=ProductRead)
@@ -77,7 +85,6 @@ def create_product(
         product.SupplierID,
         owner_customer_id=owner_scope if is_admin(current_user) else current_user.CustomerID,
     )
-    db.refresh(new_product)
     return new_product
 
 
@@ -107,7 +114,6 @@ def update_product(
         owner_customer_id=owner_scope,
         **update_data,
     )
-    db.refresh(updated)
     return ProductRead.from_orm(updated).model_dump()
 
 
@@ -135,17 +141,15 @@ def get_product_by_order_detail(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    detail = crud.get_order_detail(db, detail_id, customer_id=customer_id)
+    path = crud.resolve_order_path(db, customer_id, order_id, detail_id=detail_id, with_product=True)
 
-    if not order or not detail or detail.OrderID != order_id:
+    if not path.order or not path.detail or path.detail.OrderID != order_id:
         raise HTTPException(status_code=404, detail="Customer, Order, or OrderDetail not found")
 
-    product = crud.get_product(db, detail.ProductID)
-    if not product:
+    if not path.product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    return product
+    return path.product
 
 
 @router.post("/customer/{customer_id}/orders/{order_id}/orderdetail/{detail_id}/product", response_model=ProductRead)
@@ -161,26 +165,30 @@ def create_product_for_order_detail(
     ensure_seller_or_admin(db, current_user)
     owner_scope = None if is_admin(current_user) else current_user.CustomerID
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    detail = crud.get_order_detail(db, detail_id, customer_id=customer_id)
-
-    if not order or not detail or detail.OrderID != order_id:
-        raise HTTPException(status_code=404, detail="Customer, Order, or OrderDetail not found")
-
-    if product.SupplierID is not None:
-        supplier = crud.get_supplier(db, product.SupplierID, owner_customer_id=owner_scope)
-        if not supplier:
-            raise HTTPException(status_code=404, detail="Supplier not found")
-
-    new_product = crud.create_product(
+    path = crud.resolve_order_path(
         db,
-        product.ProductName,
-        product.Price,
-        product.SupplierID,
-        owner_customer_id=owner_scope if is_admin(current_user) else current_user.CustomerID,
+        customer_id,
+        order_id,
+        detail_id=detail_id,
+        supplier_id=product.SupplierID,
+        owner_customer_id=owner_scope,
     )
 
-    crud.update_order_detail(db, detail_id, customer_id=customer_id, ProductID=new_product.ProductID)
+    if not path.order or not path.detail or path.detail.OrderID != order_id:
+        raise HTTPException(status_code=404, detail="Customer, Order, or OrderDetail not found")
+
+    if product.SupplierID is not None and not path.supplier:
+        raise HTTPException(status_code=404, detail="Supplier not found")
+
+    with crud.unit_of_work(db):
+        new_product = crud.create_product(
+            db,
+            product.ProductName,
+            product.Price,
+            product.SupplierID,
+            owner_customer_id=owner_scope if is_admin(current_user) else current_user.CustomerID,
+        )
+        path.detail.ProductID = new_product.ProductID
     return new_product
 
 
@@ -197,22 +205,27 @@ def update_product_for_order_detail(
     ensure_seller_or_admin(db, current_user)
     owner_scope = None if is_admin(current_user) else current_user.CustomerID
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    detail = crud.get_order_detail(db, detail_id, customer_id=customer_id)
+    update_data = product.dict(exclude_unset=True)
 
-    if not order or not detail or detail.OrderID != order_id:
+    path = crud.resolve_order_path(
+        db,
+        customer_id,
+        order_id,
+        detail_id=detail_id,
+        with_product=True,
+        supplier_id=update_data.get("SupplierID"),
+        owner_customer_id=owner_scope,
+    )
+
+    if not path.order or not path.detail or path.detail.OrderID != order_id:
         raise HTTPException(status_code=404, detail="Customer, Order, or OrderDetail not found")
 
-    db_product = crud.get_product(db, detail.ProductID, owner_customer_id=owner_scope)
+    db_product = path.product
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    update_data = product.dict(exclude_unset=True)
-
-    if "SupplierID" in update_data and update_data["SupplierID"] is not None:
-        supplier = crud.get_supplier(db, update_data["SupplierID"], owner_customer_id=owner_scope)
-        if not supplier:
-            raise HTTPException(status_code=404, detail="Supplier not found")
+    if update_data.get("SupplierID") is not None and not path.supplier:
+        raise HTTPException(status_code=404, detail="Supplier not found")
 
     updated = crud.update_product(
         db,
@@ -235,19 +248,25 @@ def delete_product_for_order_detail(
     ensure_seller_or_admin(db, current_user)
     owner_scope = None if is_admin(current_user) else current_user.CustomerID
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    detail = crud.get_order_detail(db, detail_id, customer_id=customer_id)
+    path = crud.resolve_order_path(
+        db,
+        customer_id,
+        order_id,
+        detail_id=detail_id,
+        with_product=True,
+        owner_customer_id=owner_scope,
+    )
 
-    if not order or not detail or detail.OrderID != order_id:
+    if not path.order or not path.detail or path.detail.OrderID != order_id:
         raise HTTPException(status_code=404, detail="Customer, Order, or OrderDetail not found")
 
-    db_product = crud.get_product(db, detail.ProductID, owner_customer_id=owner_scope)
+    db_product = path.product
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    crud.update_order_detail(db, detail_id, customer_id=customer_id, ProductID=None)
-
-    if not crud.delete_product(db, db_product.ProductID, owner_customer_id=owner_scope):
-        raise HTTPException(status_code=404, detail="Product not found")
+    with crud.unit_of_work(db):
+        path.detail.ProductID = None
+        if not crud.delete_product(db, db_product.ProductID, owner_customer_id=owner_scope):
+            raise HTTPException(status_code=404, detail="Product not found")
 
     return {"message": "Product deleted successfully"}
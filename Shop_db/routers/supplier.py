@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel, constr
 from sqlalchemy.orm import Session
 
@@ -9,6 +9,7 @@ import crud
 import models
 from database import get_db
 from .customer import ensure_customer_scope, ensure_seller_or_admin, get_current_user, is_admin
+from .pagination import PageParams, paginate
 from .product import ProductRead
 
 router = APIRouter()
@@ -34,11 +35,19 @@ class SupplierRead(SupplierBase):
 # ---------- ROUTES ----------
 @router.get("/supplier", response_model=List[SupplierRead])
 def read_suppliers(
+    response: Response,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: models.Customer = Depends(get_current_user),
 ):
     owner_scope = None if is_admin(current_user) else current_user.CustomerID
-    return crud.get_suppliers(db, owner_customer_id=owner_scope)
+    rows = crud.get_suppliers(
+        db,
+        owner_customer_id=owner_scope,
+        after_id=page.after_id,
+        limit=page.fetch_size,
+    )
+    return paginate(response, rows, page, "SupplierID")
 
 
 @router.get("/supplier/{supplier_id}", response_model=SupplierRead)
@@ -75,7 +84,6 @@ def create_supplier(
         role="seller",
         owner_customer_id=current_user.CustomerID,
     )
-    db.refresh(new_supplier)
     return new_supplier
 
 
@@ -131,21 +139,25 @@ def get_supplier_by_product(
 ):
     ensure_customer_scope(customer_id, current_user)
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    detail = crud.get_order_detail(db, detail_id, customer_id=customer_id)
-    product = crud.get_product(db, product_id)
+    path = crud.resolve_order_path(
+        db,
+        customer_id,
+        order_id,
+        detail_id=detail_id,
+        product_id=product_id,
+        with_supplier=True,
+    )
 
-    if not order or not detail or not product:
+    if not path.order or not path.detail or not path.product:
         raise HTTPException(status_code=404, detail="Resource not found")
 
-    if detail.OrderID != order.OrderID or detail.ProductID != product.ProductID:
+    if path.detail.OrderID != path.order.OrderID or path.detail.ProductID != path.product.ProductID:
         raise HTTPException(status_code=400, detail="Mismatched Customer, Order, OrderDetail, or Product")
 
-    supplier = crud.get_supplier(db, product.SupplierID)
-    if not supplier:
+    if not path.supplier:
         raise HTTPException(status_code=404, detail="Supplier not found")
 
-    return supplier
+    return path.supplier
 
 
 @router.post(
@@ -169,29 +181,33 @@ def create_supplier_for_product(
         )
     owner_scope = None
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    detail = crud.get_order_detail(db, detail_id, customer_id=customer_id)
-    product = crud.get_product(db, product_id, owner_customer_id=owner_scope)
+    path = crud.resolve_order_path(
+        db,
+        customer_id,
+        order_id,
+        detail_id=detail_id,
+        product_id=product_id,
+        owner_customer_id=owner_scope,
+    )
+    product = path.product
 
-    if not order or not detail or not product:
+    if not path.order or not path.detail or not product:
         raise HTTPException(status_code=404, detail="Resource not found")
 
-    if detail.OrderID != order.OrderID or detail.ProductID != product.ProductID:
+    if path.detail.OrderID != path.order.OrderID or path.detail.ProductID != product.ProductID:
         raise HTTPException(status_code=400, detail="Mismatched Customer, Order, OrderDetail, or Product")
 
-    new_supplier = crud.create_supplier(
-        db,
-        supplier_name=supplier.SupplierName,
-        address=supplier.Address,
-        phone=supplier.Phone,
-        delivery_date=supplier.DeliveryDate,
-        role="seller",
-        owner_customer_id=current_user.CustomerID,
-    )
-
-    product.SupplierID = new_supplier.SupplierID
-    db.commit()
-    db.refresh(new_supplier)
+    with crud.unit_of_work(db):
+        new_supplier = crud.create_supplier(
+            db,
+            supplier_name=supplier.SupplierName,
+            address=supplier.Address,
+            phone=supplier.Phone,
+            delivery_date=supplier.DeliveryDate,
+            role="seller",
+            owner_customer_id=current_user.CustomerID,
+        )
+        product.SupplierID = new_supplier.SupplierID
     return new_supplier
 
 
@@ -213,10 +229,16 @@ def update_supplier_for_product(
     ensure_seller_or_admin(db, current_user)
     owner_scope = None if is_admin(current_user) else current_user.CustomerID
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    detail = crud.get_order_detail(db, detail_id, customer_id=customer_id)
-    product = crud.get_product(db, product_id, owner_customer_id=owner_scope)
-    db_supplier = crud.get_supplier(db, supplier_id, owner_customer_id=owner_scope)
+    path = crud.resolve_order_path(
+        db,
+        customer_id,
+        order_id,
+        detail_id=detail_id,
+        product_id=product_id,
+        supplier_id=supplier_id,
+        owner_customer_id=owner_scope,
+    )
+    order, detail, product, db_supplier = path.order, path.detail, path.product, path.supplier
 
     if not order or not detail or not product or not db_supplier:
         raise HTTPException(status_code=404, detail="Resource not found")
@@ -250,10 +272,16 @@ def delete_supplier_for_product(
     ensure_seller_or_admin(db, current_user)
     owner_scope = None if is_admin(current_user) else current_user.CustomerID
 
-    order = crud.get_order(db, order_id, customer_id=customer_id)
-    detail = crud.get_order_detail(db, detail_id, customer_id=customer_id)
-    product = crud.get_product(db, product_id, owner_customer_id=owner_scope)
-    db_supplier = crud.get_supplier(db, supplier_id, owner_customer_id=owner_scope)
+    path = crud.resolve_order_path(
+        db,
+        customer_id,
+        order_id,
+        detail_id=detail_id,
+        product_id=product_id,
+        supplier_id=supplier_id,
+        owner_customer_id=owner_scope,
+    )
+    order, detail, product, db_supplier = path.order, path.detail, path.product, path.supplier
 
     if not order or not detail or not product or not db_supplier:
         raise HTTPException(status_code=404, detail="Resource not found")
@@ -0,0 +1,214 @@
+import argparse
+import csv
+import os
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, exists, func, insert, select, update
+from sqlalchemy import DECIMAL, DateTime, Enum
+from sqlalchemy.orm import Session
+
+import crud
+import models
+import order_totals
+import product_sales
+from database import SessionLocal
+
+SEED_DIR = Path(os.getenv("SEED_DIR", Path(__file__).resolve().parent.parent / "Додаткові завдання"))
+SEED_CHUNK_SIZE = int(os.getenv("SEED_CHUNK_SIZE", "5000"))
+
+# entity -> (file, model), in foreign-key order.
+SEED_FILES = {
+    "customer": ("customers_updated.csv", models.Customer),
+    "supplier": ("supplier_updated.csv", models.Supplier),
+    "product": ("products_updated.csv", models.Product),
+    "order": ("orders_updated.csv", models.Orders),
+    "orderdetail": ("order_details_updated.csv", models.OrderDetail),
+    "courier": ("couriers_updated.csv", models.Courier),
+    "payment": ("payments_updated.csv", models.Payment),
+    "gift": ("gifts_updated.csv", models.Gifts),
+}
+
+ENUM_ALIASES = {
+    models.GiftUnit: {"%": "Percent", "percent": "Percent", "$": "USD", "usd": "USD"},
+}
+
+# The seed files still carry Orders.ShippingAddress, which now lives on
+# OrderDetail. Addresses are parked here while orders load and copied onto the
+# details afterwards, so nothing is held in memory between files.
+_staging_metadata = MetaData()
+order_addresses = Table(
+    "import_order_addresses",
+    _staging_metadata,
+    Column("OrderID", Integer, primary_key=True),
+    Column("ShippingAddress", String(200)),
+)
+
+
+def _enum_value(column_type: Enum, value: str) -> str:
+    enum_cls = column_type.enum_class
+    if value in enum_cls.__members__:
+        return value
+    alias = ENUM_ALIASES.get(enum_cls, {}).get(value.lower())
+    if alias is None:
+        raise ValueError(f"Invalid {enum_cls.__name__} '{value}'")
+    return alias
+
+
+def _parse_datetime(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    # The bundled files have some unpadded dates such as 2025-05-6; strptime
+    # accepts those.
+    for pattern in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, pattern)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid datetime '{value}'")
+
+
+def _converter(column):
+    column_type = column.type
+    if isinstance(column_type, Enum) and column_type.enum_class is not None:
+        return lambda value: _enum_value(column_type, value)
+    if isinstance(column_type, Integer):
+        return int
+    if isinstance(column_type, DECIMAL):
+        return Decimal
+    if isinstance(column_type, DateTime):
+        return _parse_datetime
+    return str
+
+
+def _read_chunks(path: Path, model, chunk_size: int):
+    columns = model.__table__.columns
+    with path.open(newline="", encoding="utf-8-sig") as handle:
+        reader = csv.DictReader(handle)
+        converters = {name: _converter(columns[name]) for name in reader.fieldnames if name in columns}
+        extra = [name for name in reader.fieldnames if name not in columns]
+        rows, extras = [], []
+        for row in reader:
+            try:
+                rows.append(
+                    {
+                        name: convert(row[name]) if row[name] not in ("", None) else None
+                        for name, convert in converters.items()
+                    }
+                )
+            except (ValueError, InvalidOperation) as exc:
+                raise ValueError(f"{path.name} line {reader.line_num}: {exc}") from exc
+            extras.append({name: row[name] or None for name in extra})
+            if len(rows) >= chunk_size:
+                yield rows, extras
+                rows, extras = [], []
+        if rows:
+            yield rows, extras
+
+
+def _copy_shipping_addresses(db: Session, chunk_size: int) -> None:
+    detail = models.OrderDetail.__table__
+    low, high = db.execute(select(func.min(detail.c.OrderDetailID), func.max(detail.c.OrderDetailID))).one()
+    if low is None:
+        return
+    address = (
+        select(order_addresses.c.ShippingAddress)
+        .where(order_addresses.c.OrderID == detail.c.OrderID)
+        .scalar_subquery()
+    )
+    for start in range(low, high + 1, chunk_size):
+        db.execute(
+            update(detail)
+            .where(
+                detail.c.OrderDetailID.between(start, start + chunk_size - 1),
+                detail.c.ShippingAddress.is_(None),
+                exists().where(order_addresses.c.OrderID == detail.c.OrderID),
+            )
+            .values(ShippingAddress=address)
+        )
+        crud.mark_written(db, detail)
+        db.commit()
+
+
+def import_file(db: Session, path: Path, model, chunk_size: int = SEED_CHUNK_SIZE) -> dict:
+    table = model.__table__
+    started = time.perf_counter()
+    count = 0
+    for rows, extras in _read_chunks(path, model, chunk_size):
+        db.execute(insert(table), rows)
+        if model is models.Orders and "ShippingAddress" in extras[0]:
+            db.execute(
+                insert(order_addresses),
+                [
+                    {"OrderID": row["OrderID"], "ShippingAddress": extra["ShippingAddress"]}
+                    for row, extra in zip(rows, extras)
+                ],
+            )
+        crud.mark_inserted(db, table)
+        db.commit()
+        count += len(rows)
+    elapsed = time.perf_counter() - started
+    return {
+        "table": table.name,
+        "file": path.name,
+        "rows": count,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(count / elapsed, 1) if elapsed else float(count),
+    }
+
+
+def import_directory(
+    db: Session,
+    directory: Path = SEED_DIR,
+    entities: list[str] | None = None,
+    chunk_size: int = SEED_CHUNK_SIZE,
+) -> list[dict]:
+    unknown = set(entities or ()) - SEED_FILES.keys()
+    if unknown:
+        raise ValueError(f"Unknown seed entities: {', '.join(sorted(unknown))}")
+
+    order_addresses.drop(db.connection(), checkfirst=True)
+    order_addresses.create(db.connection())
+    db.commit()
+    report = []
+    try:
+        for entity, (filename, model) in SEED_FILES.items():
+            path = Path(directory) / filename
+            if (entities and entity not in entities) or not path.exists():
+                continue
+            report.append(import_file(db, path, model, chunk_size))
+            if model is models.OrderDetail:
+                _copy_shipping_addresses(db, chunk_size)
+        if report:
+            # Rows were inserted with plain INSERTs, so recompute the derived
+            # tables in one pass.
+            order_totals.rebuild(db, chunk_size)
+            product_sales.rebuild(db, chunk_size)
+    finally:
+        db.rollback()
+        order_addresses.drop(db.connection(), checkfirst=True)
+        db.commit()
+        db.info.pop(crud.ROLE_CACHE_KEY, None)
+        db.info.pop(crud.SELLER_CACHE_KEY, None)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load the *_updated.csv seed files into the database.")
+    parser.add_argument("directory", nargs="?", default=SEED_DIR, type=Path)
+    parser.add_argument("--only", nargs="+", choices=list(SEED_FILES), help="entities to load")
+    parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        report = import_directory(db, args.directory, args.only, args.chunk_size)
+    for entry in report:
+        print(f"{entry['table']:<12} {entry['rows']:>10} rows  {entry['seconds']:>8}s  {entry['rows_per_sec']:>10} rows/s")
+
+
+if __name__ == "__main__":
+    main()
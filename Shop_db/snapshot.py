@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import DECIMAL, Date, DateTime, Enum, Integer, LargeBinary, select
+from sqlalchemy.orm import Session
+
+import models
+from database import Base
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed to write snapshots
+    pa = pq = None
+
+SNAPSHOT_DIR = Path(os.getenv("SNAPSHOT_DIR", Path(__file__).resolve().parent.parent / "snapshots"))
+SNAPSHOT_CHUNK_SIZE = int(os.getenv("SNAPSHOT_CHUNK_SIZE", "50000"))
+# Incremental runs re-export this many ids below each watermark. Ids are taken
+# at insert but become visible at commit, so a transaction that commits after
+# a snapshot can add rows below its watermark; with a margin those rows are
+# picked up by the next run, and consumers dedupe the overlap on the key.
+SNAPSHOT_WATERMARK_MARGIN = int(os.getenv("SNAPSHOT_WATERMARK_MARGIN", "0"))
+WATERMARKS_FILE = "watermarks.json"
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+EXCLUDED_COLUMNS = {"password_hash"}
+
+# OrderTotals joined to its order, as the /analytics/order-totals rows.
+ORDER_TOTALS_VIEW = "OrderTotalsView"
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def _arrow_type(column):
+    column_type = column.type
+    if isinstance(column_type, Enum):
+        return pa.dictionary(pa.int8(), pa.string())
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, DECIMAL):
+        return pa.decimal128(column_type.precision, column_type.scale)
+    if isinstance(column_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column_type, Date):
+        return pa.date32()
+    if isinstance(column_type, LargeBinary):
+        return pa.binary()
+    return pa.string()
+
+
+def _arrow_array(values, arrow_type):
+    if pa.types.is_dictionary(arrow_type):
+        values = [None if value is None else getattr(value, "value", value) for value in values]
+        return pa.array(values, pa.string()).dictionary_encode().cast(arrow_type)
+    return pa.array(values, arrow_type)
+
+
+def sources() -> dict:
+    # name -> (columns, FROM clause, incremental key or None). Tables keyed on
+    # more than one column (the daily rollups) have no id watermark and are
+    # always exported in full.
+    result = {}
+    for table in Base.metadata.sorted_tables:
+        keys = list(table.primary_key)
+        key = keys[0] if len(keys) == 1 and isinstance(keys[0].type, Integer) else None
+        columns = [column for column in table.columns if column.name not in EXCLUDED_COLUMNS]
+        result[table.name] = (columns, table, key)
+    orders, totals = models.Orders.__table__, models.OrderTotals.__table__
+    result[ORDER_TOTALS_VIEW] = (
+        [orders.c.OrderID, orders.c.OrderDate, orders.c.CustomerID, orders.c.Status]
+        + [column for column in totals.columns if column.name != "OrderID"],
+        orders.join(totals, totals.c.OrderID == orders.c.OrderID),
+        orders.c.OrderID,
+    )
+    return result
+
+
+def export_source(
+    db: Session, columns, from_clause, key, path: Path, fmt: str = "parquet", after_id=None, margin: int = 0
+) -> dict:
+    # Streams the rows in SNAPSHOT_CHUNK_SIZE partitions, one record batch each.
+    # The watermark never moves back, even when only margin rows were exported.
+    schema = pa.schema([pa.field(column.name, _arrow_type(column)) for column in columns])
+    statement = select(*columns).select_from(from_clause)
+    if key is not None:
+        if after_id is not None:
+            statement = statement.where(key > after_id - margin)
+        statement = statement.order_by(key)
+    key_position = columns.index(key) if key is not None else None
+
+    rows, last_id = 0, after_id
+    result = db.execute(statement.execution_options(stream_results=True, yield_per=SNAPSHOT_CHUNK_SIZE))
+    writer = pq.ParquetWriter(path, schema) if fmt == "parquet" else pa.ipc.new_file(path, schema)
+    try:
+        for partition in result.partitions():
+            arrays = [_arrow_array(values, field.type) for values, field in zip(zip(*partition), schema)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            rows += len(partition)
+            if key_position is not None:
+                last_id = max(partition[-1][key_position], last_id or 0)
+    finally:
+        writer.close()
+    return {"file": path.name, "rows": rows, "watermark": last_id}
+
+
+def _load_watermarks(directory: Path) -> dict:
+    path = directory / WATERMARKS_FILE
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _write_json(path: Path, data) -> None:
+    temporary = path.with_suffix(".tmp")
+    temporary.write_text(json.dumps(data, indent=2))
+    os.replace(temporary, path)
+
+
+def export_snapshot(
+    db: Session,
+    directory: Path = SNAPSHOT_DIR,
+    incremental: bool = False,
+    fmt: str = "parquet",
+    names: list[str] | None = None,
+    margin: int = SNAPSHOT_WATERMARK_MARGIN,
+) -> list[dict]:
+    # Writes one file per source into a new <directory>/<timestamp> folder. All
+    # sources are read in the session's single transaction. Incremental runs
+    # export only rows with ids above the last watermark, so they carry new
+    # rows but not updates or deletes of older ones; a full run resets the
+    # watermarks. Without a margin they also miss rows whose transaction
+    # committed after the previous run but took a lower id (see
+    # SNAPSHOT_WATERMARK_MARGIN).
+    available_sources = sources()
+    unknown = set(names or ()) - available_sources.keys()
+    if unknown:
+        raise ValueError(f"Unknown snapshot sources: {', '.join(sorted(unknown))}")
+
+    directory = Path(directory)
+    target = directory / datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    target.mkdir(parents=True)
+    watermarks = _load_watermarks(directory)
+    report = []
+    for name, (columns, from_clause, key) in available_sources.items():
+        if names and name not in names:
+            continue
+        started = time.perf_counter()
+        after_id = watermarks.get(name) if incremental and key is not None else None
+        path = target / f"{name}{FORMATS[fmt]}"
+        entry = export_source(db, columns, from_clause, key, path, fmt, after_id, margin)
+        if entry["watermark"] is not None:
+            watermarks[name] = entry["watermark"]
+        elif not incremental:
+            watermarks.pop(name, None)
+        elapsed = round(time.perf_counter() - started, 3)
+        report.append({"name": name, "incremental": after_id is not None, **entry, "seconds": elapsed})
+    db.rollback()
+
+    # The manifest marks the folder complete; watermarks only advance after it.
+    manifest = {"format": fmt, "incremental": incremental, "margin": margin if incremental else 0, "sources": report}
+    _write_json(target / "manifest.json", manifest)
+    _write_json(directory / WATERMARKS_FILE, watermarks)
+    return report
+
+
+def main() -> None:
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Write typed Parquet/Arrow snapshots of the ShopDB tables.")
+    parser.add_argument("directory", nargs="?", default=SNAPSHOT_DIR, type=Path)
+    parser.add_argument("--incremental", action="store_true", help="only rows above the last watermarks")
+    parser.add_argument("--format", choices=list(FORMATS), default="parquet")
+    parser.add_argument("--only", nargs="+", help="tables to export")
+    parser.add_argument(
+        "--margin",
+        type=int,
+        default=SNAPSHOT_WATERMARK_MARGIN,
+        help="with --incremental, also re-export this many ids below each watermark",
+    )
+    args = parser.parse_args()
+    if not available():
+        parser.error("pyarrow is required: pip install pyarrow")
+
+    with SessionLocal() as db:
+        report = export_snapshot(db, args.directory, args.incremental, args.format, args.only, args.margin)
+    for entry in report:
+        print(f"{entry['name']:<22} {entry['rows']:>10} rows  {entry['seconds']:>8}s  -> {entry['file']}")
+
+
+if __name__ == "__main__":
+    main()
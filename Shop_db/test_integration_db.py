@@ -1,9 +1,13 @@
+import json
 import random
+from contextlib import contextmanager
 from datetime import datetime
 
+import jwt
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.exc import TimeoutError as SQLAlchemyTimeoutError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
@@ -28,6 +32,8 @@ database.engine = engine
 database.SessionLocal = TestingSessionLocal
 
 from main import app
+from routers import customer as customer_router
+from routers.customer import user_cache
 
 Base.metadata.create_all(bind=engine)
 
@@ -115,6 +121,34 @@ def _require_state(key: str):
     return STATE[key]
 
 
+@contextmanager
+def _count_queries():
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+
+@contextmanager
+def _count_commits():
+    commits = []
+
+    def _record(conn):
+        commits.append(conn)
+
+    event.listen(engine, "commit", _record)
+    try:
+        yield commits
+    finally:
+        event.remove(engine, "commit", _record)
+
+
 def test_create_supplier(client):
     supplier = client.post(
         "/supplier",
@@ -414,3 +448,1486 @@ def test_seller_can_view_only_own_products_in_get_endpoints(client):
 
     seller_one_foreign_product = client.get(f"/product/{seller_two_product_id}", headers=seller_one_headers)
     assert seller_one_foreign_product.status_code == 404
+
+
+def test_list_endpoints_use_keyset_pagination(client):
+    customer = _register_customer(client, username=f"pager_{random.randint(1, 1_000_000)}")
+    created_ids = []
+    for _ in range(3):
+        order = client.post(
+            "/order",
+            json={
+                "OrderDate": datetime.now().isoformat(),
+                "Status": "Pending",
+                "CustomerID": customer["CustomerID"],
+            },
+        ).json()
+        created_ids.append(order["OrderID"])
+
+    seen_ids = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(f"/customer/{customer['CustomerID']}/orders", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 2
+        seen_ids.extend(order["OrderID"] for order in page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert seen_ids == sorted(seen_ids)
+    assert set(created_ids).issubset(seen_ids)
+
+    first_page = client.get("/order", params={"limit": 1})
+    assert first_page.status_code == 200
+    assert len(first_page.json()) == 1
+    assert first_page.headers.get("X-Next-Cursor")
+
+    invalid_cursor = client.get("/order", params={"cursor": "not-a-cursor"})
+    assert invalid_cursor.status_code == 400
+
+
+def test_export_streams_ndjson_and_csv(client):
+    order_id = _require_state("order_id")
+
+    ndjson_response = client.get("/export/order", params={"format": "ndjson"})
+    assert ndjson_response.status_code == 200
+    assert ndjson_response.headers["content-type"].startswith("application/x-ndjson")
+    exported_orders = [json.loads(line) for line in ndjson_response.text.splitlines()]
+    assert any(order["OrderID"] == order_id for order in exported_orders)
+    assert all(order["Status"] in {"Pending", "Shipped", "Completed", "Cancelled"} for order in exported_orders)
+
+    csv_response = client.get("/export/orderdetail", params={"format": "csv"})
+    assert csv_response.status_code == 200
+    lines = csv_response.text.splitlines()
+    assert lines[0] == "OrderDetailID,OrderID,ProductID,Quantity,ShippingAddress"
+    assert len(lines) >= 3
+
+    customers = client.get("/export/customer").text
+    assert "password_hash" not in customers
+
+    buyer = _register_customer(client, username=f"export_buyer_{random.randint(1, 1_000_000)}")
+    buyer_token = _login_customer(client, buyer["Name"], buyer["Password"])
+    buyer_orders = client.get(
+        "/export/order",
+        headers={"Authorization": f"Bearer {buyer_token}"},
+    )
+    assert buyer_orders.status_code == 200
+    assert buyer_orders.text == ""
+
+    assert client.get("/export/unknown").status_code == 404
+    assert client.get("/export/order", params={"format": "xml"}).status_code == 400
+
+
+def test_hierarchical_routes_resolve_path_in_one_query(client):
+    customer_id = _require_state("customer_id")
+    order_id = _require_state("order_id")
+    supplier_id = _require_state("supplier_id")
+    product_ids = _require_state("product_ids")
+
+    details = client.get(f"/customer/{customer_id}/orders/{order_id}/orderdetail").json()
+    detail = next(d for d in details if d["ProductID"] == product_ids[0])
+    base = f"/customer/{customer_id}/orders/{order_id}/orderdetail/{detail['OrderDetailID']}"
+
+    with _count_queries() as statements:
+        supplier = client.get(f"{base}/product/{product_ids[0]}/supplier")
+
+    assert supplier.status_code == 200
+    assert supplier.json()["SupplierID"] == supplier_id
+    assert len([s for s in statements if "path_anchor" in s]) == 1
+
+    mismatched = client.get(f"{base}/product/{product_ids[1]}/supplier")
+    assert mismatched.status_code == 400
+
+    missing_detail = client.get(
+        f"/customer/{customer_id}/orders/{order_id}/orderdetail/999999/product/{product_ids[0]}/supplier"
+    )
+    assert missing_detail.status_code == 404
+
+    product = client.get(f"{base}/product")
+    assert product.status_code == 200
+    assert product.json()["ProductID"] == product_ids[0]
+
+    courier = client.get(f"/customer/{customer_id}/orders/{order_id}/courier")
+    assert courier.status_code == 200
+    assert courier.json()["OrderID"] == order_id
+
+    payment_id = _require_state("payment_id")
+    gifts = client.get(f"/customer/{customer_id}/orders/{order_id}/payment/{payment_id}/gifts")
+    assert gifts.status_code == 200
+    assert all(g["PaymentID"] == payment_id for g in gifts.json())
+
+
+def test_nested_lists_filter_by_parent(client):
+    customer_id = _require_state("customer_id")
+    order_id = _require_state("order_id")
+    product_ids = _require_state("product_ids")
+
+    other_order = client.post(
+        "/order",
+        json={"OrderDate": datetime.now().isoformat(), "Status": "Pending", "CustomerID": customer_id},
+    ).json()
+    client.post(
+        "/orderdetail",
+        json={"OrderID": other_order["OrderID"], "ProductID": product_ids[0], "Quantity": 3},
+    )
+
+    details = client.get(f"/customer/{customer_id}/orders/{order_id}/orderdetail")
+    assert details.status_code == 200
+    assert len(details.json()) == 2
+    assert all(d["OrderID"] == order_id for d in details.json())
+
+    other_details = client.get(f"/customer/{customer_id}/orders/{other_order['OrderID']}/orderdetail").json()
+    assert [d["OrderID"] for d in other_details] == [other_order["OrderID"]]
+
+
+def test_role_lookups_run_once_per_request(client, db_session):
+    customer_id = _require_state("customer_id")
+    order_id = _require_state("order_id")
+
+    db_session.info.clear()
+    user_cache.clear()
+    with _count_queries() as statements:
+        response = client.get(f"/order/{order_id}")
+    assert response.status_code == 200
+    # token -> Customer, then the order itself; the admin scope check is reused
+    assert len(statements) == 2
+
+    db_session.info.clear()
+    user_cache.clear()
+    with _count_queries() as statements:
+        response = client.get(f"/customer/{customer_id}/orders/{order_id}/payment")
+    assert response.status_code == 200
+    assert len(statements) == 2
+
+    seller = _register_customer(client, username=f"seller_count_{random.randint(1, 1_000_000)}", role="seller")
+    seller_headers = {"Authorization": f"Bearer {_login_customer(client, seller['Name'], seller['Password'])}"}
+    supplier_id = client.get("/supplier", headers=seller_headers).json()[0]["SupplierID"]
+    product_id = client.post(
+        "/product",
+        json={"ProductName": "Counted Product", "Price": 15, "SupplierID": supplier_id},
+        headers=seller_headers,
+    ).json()["ProductID"]
+
+    db_session.info.clear()
+    user_cache.clear()
+    with _count_queries() as statements:
+        response = client.get(f"/product/{product_id}", headers=seller_headers)
+    assert response.status_code == 200
+    # token -> Customer, seller profile, product
+    assert len(statements) == 3
+
+    db_session.info.clear()
+    user_cache.clear()
+    with _count_queries() as statements:
+        response = client.get("/product", headers=seller_headers)
+    assert response.status_code == 200
+    assert len(statements) == 3
+    customer_selects = [s for s in statements if 'FROM "Customer"' in s]
+    supplier_selects = [s for s in statements if 'FROM "Supplier"' in s]
+    assert len(customer_selects) == 1
+    assert len(supplier_selects) == 1
+
+
+def test_authenticated_user_cache_hits_and_invalidation(client, db_session):
+    user = _register_customer(client, username=f"cached_{random.randint(1, 1_000_000)}")
+    user_headers = {"Authorization": f"Bearer {_login_customer(client, user['Name'], user['Password'])}"}
+
+    user_cache.clear()
+    client.get(f"/customer/{user['CustomerID']}", headers=user_headers)
+    with _count_queries() as statements:
+        response = client.get(f"/customer/{user['CustomerID']}", headers=user_headers)
+    assert response.status_code == 200
+    # only the handler's own read; the token was resolved from the cache
+    assert len(statements) == 1
+
+    stats = client.get("/admin/auth-cache").json()
+    assert stats["hits"] >= 1
+    assert stats["misses"] >= 1
+
+    promoted = client.put(f"/customer/{user['CustomerID']}", json={"Role": "admin"})
+    assert promoted.status_code == 200
+    admin_only = client.get("/admin/auth-cache", headers=user_headers)
+    assert admin_only.status_code == 200
+
+    demoted = client.put(f"/customer/{user['CustomerID']}", json={"Role": "user"})
+    assert demoted.status_code == 200
+    assert client.get("/admin/auth-cache", headers=user_headers).status_code == 403
+
+    assert client.delete(f"/customer/{user['CustomerID']}").status_code == 200
+    assert client.get(f"/customer/{user['CustomerID']}", headers=user_headers).status_code == 401
+
+
+def test_stateless_mode_trusts_token_claims(client, db_session, monkeypatch):
+    monkeypatch.setattr(customer_router, "AUTH_STATELESS", True)
+    customer_id = _require_state("customer_id")
+    order_id = _require_state("order_id")
+
+    user = _register_customer(client, username=f"stateless_{random.randint(1, 1_000_000)}")
+    user_token = _login_customer(client, user["Name"], user["Password"])
+    user_headers = {"Authorization": f"Bearer {user_token}"}
+    claims = jwt.decode(user_token, options={"verify_signature": False})
+    assert abs(claims["exp"] - claims["iat"] - customer_router.STATELESS_TOKEN_EXPIRE_MINUTES * 60) <= 1
+    assert claims["seller"] is False
+
+    admin_headers = {"Authorization": client.headers["Authorization"]}
+    admin_claims = jwt.decode(admin_headers["Authorization"].split()[1], options={"verify_signature": False})
+    db_session.info.clear()
+    user_cache.clear()
+    with _count_queries() as statements:
+        response = client.get(f"/customer/{customer_id}/orders/{order_id}/payment")
+    assert response.status_code == 200
+    assert admin_claims["role"] == "admin"
+    # no auth or role queries, only the path lookup
+    assert len(statements) == 1
+
+    profile = client.get(f"/customer/{user['CustomerID']}", headers=user_headers)
+    assert profile.status_code == 200
+    assert profile.json()["Email"] == user["Email"]
+
+    assert client.put(f"/customer/{user['CustomerID']}", json={"Role": "admin"}).status_code == 200
+    revoked = client.get(f"/customer/{user['CustomerID']}", headers=user_headers)
+    assert revoked.status_code == 401
+    assert revoked.json()["detail"] == "Token revoked"
+
+
+def test_pool_metrics_track_checkouts_and_timeouts(client):
+    pool_response = client.get("/admin/pool")
+    assert pool_response.status_code == 200
+    assert pool_response.json()["pool_class"] == "StaticPool"
+
+    timed_engine = create_engine(
+        "sqlite://",
+        poolclass=database.TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    held = timed_engine.connect()
+    with pytest.raises(SQLAlchemyTimeoutError):
+        timed_engine.connect()
+    status = database.pool_status(timed_engine)
+    assert status["checked_out"] == 1
+    assert status["overflow"] == 0
+    assert status["checkouts"] == 2
+    assert status["timeouts"] == 1
+    assert status["max_wait_ms"] >= 50
+    held.close()
+    timed_engine.dispose()
+
+
+def test_async_read_routes_on_aiosqlite(tmp_path):
+    pytest.importorskip("aiosqlite")
+    from fastapi import Depends, FastAPI
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    import models
+    from database import get_async_db
+    from routers import async_reads
+    from routers.customer import create_access_token, get_current_user_async
+
+    db_path = tmp_path / "async_shop.db"
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=sync_engine)
+    with sessionmaker(bind=sync_engine)() as session:
+        owner = models.Customer(Name="async_owner", Email="async_owner@example.com", Role="user")
+        other = models.Customer(Name="async_other", Email="async_other@example.com", Role="user")
+        session.add_all([owner, other])
+        session.flush()
+        session.add_all(
+            [
+                models.Orders(OrderDate=datetime.now(), CustomerID=owner.CustomerID, Status="Pending"),
+                models.Orders(OrderDate=datetime.now(), CustomerID=owner.CustomerID, Status="Shipped"),
+                models.Orders(OrderDate=datetime.now(), CustomerID=other.CustomerID, Status="Pending"),
+                models.Product(ProductName="Async Product", Price=12),
+            ]
+        )
+        session.commit()
+        owner_id, owner_name = owner.CustomerID, owner.Name
+    sync_engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    AsyncTestingSession = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as session:
+            yield session
+
+    async_app = FastAPI()
+    async_app.include_router(async_reads.router, dependencies=[Depends(get_current_user_async)])
+    async_app.dependency_overrides[get_async_db] = override_get_async_db
+
+    token = create_access_token({"sub": owner_name, "customer_id": owner_id, "role": "user"})
+    headers = {"Authorization": f"Bearer {token}"}
+    with TestClient(async_app) as async_client:
+        orders = async_client.get("/order", headers=headers, params={"limit": 1})
+        assert orders.status_code == 200
+        assert len(orders.json()) == 1
+        next_page = async_client.get(
+            "/order",
+            headers=headers,
+            params={"limit": 1, "cursor": orders.headers["X-Next-Cursor"]},
+        )
+        assert [o["CustomerID"] for o in orders.json() + next_page.json()] == [owner_id, owner_id]
+        assert "X-Next-Cursor" not in next_page.headers
+
+        products = async_client.get("/product", headers=headers)
+        assert products.status_code == 200
+        assert products.json()[0]["ProductName"] == "Async Product"
+
+        assert async_client.get("/order/3", headers=headers).status_code == 404
+        assert async_client.get("/order", headers={"Authorization": "Bearer broken"}).status_code == 401
+
+
+def test_reads_go_to_replica_until_client_writes(tmp_path, monkeypatch):
+    import models
+    from routers.customer import get_current_user
+
+    engines = {}
+    for name in ("primary", "replica"):
+        engines[name] = create_engine(
+            f"sqlite:///{tmp_path / name}.db", connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(bind=engines[name])
+        with sessionmaker(bind=engines[name])() as session:
+            session.add(models.Customer(CustomerID=1, Name=f"{name}_admin", Email=f"{name}@example.com", Role="admin"))
+            session.commit()
+
+    RoutingSessionLocal = sessionmaker(
+        class_=database.RoutingSession,
+        bind=engines["primary"],
+        replica_bind=engines["replica"],
+        autoflush=False,
+    )
+    monkeypatch.setattr(database, "SessionLocal", RoutingSessionLocal)
+    database.recent_writers.clear()
+
+    admin = models.Customer(CustomerID=1, Name="primary_admin", Role="admin")
+    app.dependency_overrides[get_current_user] = lambda: admin
+    try:
+        with TestClient(app, headers={"Authorization": "Bearer writer"}) as c:
+            assert [row["Name"] for row in c.get("/customer").json()] == ["replica_admin"]
+
+            created = c.post(
+                "/order",
+                json={"OrderDate": datetime.now().isoformat(), "Status": "Pending", "CustomerID": 1},
+            )
+            assert created.status_code == 200
+            # Read-your-writes: the client that just wrote is pinned to the primary.
+            assert [row["OrderID"] for row in c.get("/order").json()] == [created.json()["OrderID"]]
+
+            # Other clients, even from the same address, still read the replica.
+            assert c.get("/order", headers={"Authorization": "Bearer reader"}).json() == []
+            database.recent_writers.clear()
+            assert c.get("/order").json() == []
+    finally:
+        app.dependency_overrides.clear()
+        database.recent_writers.clear()
+        for bind in engines.values():
+            bind.dispose()
+
+
+def test_unit_of_work_commits_multi_entity_flows_once(client, db_session):
+    import crud
+    import models
+
+    with _count_commits() as commits:
+        seller = _register_customer(client, username=f"uow_seller_{random.randint(1, 1_000_000)}", role="seller")
+    assert len(commits) == 1
+    supplier = db_session.query(models.Supplier).filter(models.Supplier.OwnerCustomerID == seller["CustomerID"]).one()
+    assert supplier.SupplierName == seller["Name"]
+
+    with pytest.raises(RuntimeError):
+        with crud.unit_of_work(db_session):
+            product = crud.create_product(db_session, "Rolled back product", 5)
+            assert product.ProductID is not None
+            crud.update_supplier(db_session, supplier.SupplierID, Address="Nowhere")
+            raise RuntimeError("abort")
+    assert db_session.query(models.Product).filter(models.Product.ProductName == "Rolled back product").count() == 0
+    db_session.refresh(supplier)
+    assert supplier.Address is None
+
+
+def test_checkout_creates_complete_order_in_one_transaction(client, db_session):
+    import models
+
+    prices = {}
+    for name, price in (("Checkout Phone", 100), ("Checkout Case", 7.5)):
+        product = client.post("/product", json={"ProductName": name, "Price": price}).json()
+        prices[product["ProductID"]] = price
+    phone_id, case_id = prices
+
+    with _count_commits() as commits:
+        response = client.post(
+            "/checkout",
+            json={
+                "ShippingAddress": "Kyiv, Khreshchatyk 1",
+                "lines": [{"ProductID": phone_id, "Quantity": 2}, {"ProductID": case_id, "Quantity": 4}],
+                "courier": {"Name": "Nova Poshta", "Country": "UA", "Price": 3},
+                "gifts": [{"Amount": 10, "Type": "Certificate", "Unit": "Percent"}],
+                "PaymentStatus": "Paid",
+            },
+        )
+    assert response.status_code == 200
+    assert len(commits) == 1
+    result = response.json()
+    assert result["Amount"] == 230
+    assert result["PaymentStatus"] == "Paid"
+    assert len(result["OrderDetailIDs"]) == 2 and len(result["GiftIDs"]) == 1
+
+    details = client.get(f"/orderdetail/{result['OrderDetailIDs'][0]}").json()
+    assert details["ShippingAddress"] == "Kyiv, Khreshchatyk 1"
+    assert client.get(f"/courier/{result['CourierID']}").json()["OrderID"] == result["OrderID"]
+
+    orders_before = db_session.query(models.Orders).count()
+    missing = client.post("/checkout", json={"lines": [{"ProductID": phone_id}, {"ProductID": 999_999}]})
+    assert missing.status_code == 404
+    assert db_session.query(models.Orders).count() == orders_before
+
+
+def test_bulk_insert_returns_ids_and_per_row_errors(client, db_session, monkeypatch):
+    import models
+    from routers import bulk as bulk_router
+
+    suffix = random.randint(1, 1_000_000)
+    products = client.post(
+        "/product/bulk",
+        json=[
+            {"ProductName": f"Bulk A {suffix}", "Price": 3},
+            {"ProductName": "x", "Price": 3},
+            {"ProductName": f"Bulk B {suffix}", "Price": 4, "SupplierID": 999_999},
+            {"ProductName": f"Bulk C {suffix}", "Price": 5},
+        ],
+    )
+    assert products.status_code == 200
+    result = products.json()
+    assert result["created"] == 2
+    assert [error["index"] for error in result["errors"]] == [1, 2]
+    assert result["errors"][1]["detail"] == "Supplier not found"
+    names = [db_session.get(models.Product, pid).ProductName for pid in result["ids"] if pid is not None]
+    assert names == [f"Bulk A {suffix}", f"Bulk C {suffix}"]
+
+    # Duplicate emails are rejected by the database; only that row fails.
+    email = f"bulk_{suffix}@example.com"
+    customers = client.post(
+        "/customer/bulk",
+        json=[
+            {"Name": f"bulk_{suffix}", "Email": email},
+            {"Name": f"bulk_dup_{suffix}", "Email": email},
+            {"Name": f"bulk_other_{suffix}", "Email": f"other_{suffix}@example.com"},
+        ],
+    ).json()
+    assert customers["created"] == 2
+    assert customers["ids"][1] is None and customers["errors"][0]["index"] == 1
+
+    seller = _register_customer(client, username=f"bulk_seller_{suffix}", role="seller")
+    seller_token = _login_customer(client, seller["Name"], seller["Password"])
+    seller_headers = {"Authorization": f"Bearer {seller_token}"}
+    assert client.post("/supplier/bulk", json=[{"SupplierName": "Nope"}], headers=seller_headers).status_code == 403
+    own = client.post("/product/bulk", json=[{"ProductName": "Seller bulk", "Price": 9}], headers=seller_headers).json()
+    assert db_session.get(models.Product, own["ids"][0]).OwnerCustomerID == seller["CustomerID"]
+
+    foreign_order = client.post(
+        "/order", json={"OrderDate": datetime.now().isoformat(), "CustomerID": customers["ids"][0]}
+    ).json()
+    details = client.post(
+        "/orderdetail/bulk",
+        json=[{"OrderID": foreign_order["OrderID"], "ProductID": result["ids"][0], "Quantity": 1}],
+        headers=seller_headers,
+    ).json()
+    assert details["errors"] == [{"index": 0, "detail": "Order or Product not found"}]
+
+    orders_before = db_session.query(models.Orders).count()
+    monkeypatch.setattr(bulk_router, "BULK_CHUNK_SIZE", 2)
+    orders = client.post(
+        "/order/bulk",
+        json=[{"OrderDate": datetime.now().isoformat(), "Status": "Shipped"} for _ in range(5)],
+    ).json()
+    assert orders["created"] == 5 and len(set(orders["ids"])) == 5
+    assert db_session.query(models.Orders).count() == orders_before + 5
+    assert client.post("/nothing/bulk", json=[]).status_code == 404
+
+
+def test_seed_import_loads_bundled_csvs(tmp_path, client):
+    import models
+    import seed
+
+    seed_engine = create_engine(f"sqlite:///{tmp_path / 'seed.db'}")
+    Base.metadata.create_all(bind=seed_engine)
+    with sessionmaker(bind=seed_engine)() as session:
+        report = seed.import_directory(session, seed.SEED_DIR, chunk_size=4)
+        assert [entry["table"] for entry in report] == [
+            "Customer", "Supplier", "Product", "Orders", "OrderDetail", "Courier", "Payment", "Gifts",
+        ]
+        assert {entry["table"]: entry["rows"] for entry in report}["Orders"] == 15
+        assert all(entry["rows_per_sec"] > 0 for entry in report)
+
+        assert session.query(models.Gifts).filter(models.Gifts.Unit == models.GiftUnit.Percent).count() > 0
+        detail = session.query(models.OrderDetail).filter(models.OrderDetail.OrderID == 1).first()
+        assert detail.ShippingAddress == "49190 Patel Shore Caseymouth MT 64752"
+        assert session.query(models.Customer).filter(models.Customer.Role == "user").count() == 15
+        assert not seed_engine.dialect.has_table(session.connection(), "import_order_addresses")
+    seed_engine.dispose()
+
+    assert client.post("/admin/import", params={"only": "nothing"}).status_code == 400
+
+
+def test_bulk_update_and_delete_by_filter_respect_scope(client, db_session):
+    import models
+
+    suffix = random.randint(1, 1_000_000)
+    user = _register_customer(client, username=f"bulk_mut_{suffix}")
+    other = _register_customer(client, username=f"bulk_mut_other_{suffix}")
+    user_headers = {"Authorization": f"Bearer {_login_customer(client, user['Name'], user['Password'])}"}
+
+    marker = datetime(2031, 1, 1)
+    orders = client.post(
+        "/order/bulk",
+        json=[
+            {"OrderDate": marker.isoformat(), "CustomerID": customer_id, "Status": status}
+            for customer_id in (user["CustomerID"], other["CustomerID"])
+            for status in ("Pending", "Pending", "Cancelled")
+        ],
+    ).json()
+    user_orders = orders["ids"][:3]
+    product = client.post("/product", json={"ProductName": f"Bulk mut {suffix}", "Price": 10}).json()
+    client.post(
+        "/orderdetail/bulk",
+        json=[{"OrderID": order_id, "ProductID": product["ProductID"], "Quantity": 1} for order_id in orders["ids"]],
+    )
+
+    with _count_queries() as statements:
+        shipped = client.patch(
+            "/order/bulk",
+            json={"filter": {"OrderDate": marker.isoformat(), "Status": "Pending"}, "values": {"Status": "Shipped"}},
+            headers=user_headers,
+        )
+    assert shipped.json() == {"updated": 2}
+    assert sum(statement.lstrip().upper().startswith("UPDATE") for statement in statements) == 1
+    statuses = {
+        order.OrderID: order.Status.value
+        for order in db_session.query(models.Orders).filter(models.Orders.OrderID.in_(orders["ids"]))
+    }
+    assert [statuses[order_id] for order_id in orders["ids"]] == [
+        "Shipped", "Shipped", "Cancelled", "Pending", "Pending", "Cancelled",
+    ]
+
+    quantities = client.patch(
+        "/orderdetail/bulk",
+        json={"filter": {"OrderID__in": orders["ids"]}, "values": {"Quantity": 5}},
+        headers=user_headers,
+    )
+    assert quantities.json() == {"updated": 3}
+
+    deleted = client.request(
+        "DELETE",
+        "/orderdetail/bulk",
+        json={"filter": {"OrderID__in": orders["ids"], "Quantity__gte": 5}},
+        headers=user_headers,
+    )
+    assert deleted.json() == {"deleted": 3}
+    purged = client.request(
+        "DELETE", "/order/bulk", json={"filter": {"OrderDate": marker.isoformat(), "Status": "Cancelled"}}, headers=user_headers
+    )
+    assert purged.json() == {"deleted": 1}
+    assert db_session.query(models.Orders).filter(models.Orders.OrderID == user_orders[2]).count() == 0
+
+    assert client.patch("/order/bulk", json={"filter": {}, "values": {"Status": "Shipped"}}).status_code == 400
+    assert client.patch(
+        "/order/bulk", json={"filter": {"Status": "Pending"}, "values": {"CustomerID": 1}}
+    ).status_code == 400
+    assert client.patch(
+        "/order/bulk", json={"filter": {"Status": "Nope"}, "values": {"Status": "Shipped"}}
+    ).status_code == 400
+    assert client.patch(
+        "/product/bulk", json={"filter": {"Price__gt": 0}, "values": {"Price": 1}}, headers=user_headers
+    ).status_code == 403
+
+
+def test_random_order_generator_builds_complete_orders_in_bulk(client, db_session):
+    import generator
+    import models
+
+    client.post("/product", json={"ProductName": "Generator product", "Price": 20})
+    generator.product_ids.invalidate()
+    customer = _register_customer(client, username=f"gen_{random.randint(1, 1_000_000)}")
+
+    with _count_commits() as commits:
+        with _count_queries() as statements:
+            response = client.post(
+                "/analytics/create-random-orders", params={"count": 40, "customer_id": customer["CustomerID"]}
+            )
+    assert response.status_code == 200
+    assert response.json()["created"] == 40
+    assert len(commits) == 1
+    assert not any("random()" in statement.lower() for statement in statements)
+
+    first, last = response.json()["first_order_id"], response.json()["last_order_id"]
+    orders = db_session.query(models.Orders).filter(models.Orders.OrderID.between(first, last)).all()
+    assert len(orders) == 40 and {order.CustomerID for order in orders} == {customer["CustomerID"]}
+    for order in orders:
+        assert 1 <= len(order.details) <= 3
+        assert order.courier is not None and order.courier.Country == "Ukraine"
+        expected = sum(detail.product.Price * detail.Quantity for detail in order.details)
+        assert order.payment.Amount == expected and order.payment.Status.value == "Paid"
+
+    single = client.post(f"/analytics/create-random-order/{customer['CustomerID']}").json()
+    assert single["order"]["ShippingAddress"].startswith("Street_")
+
+
+def test_order_totals_are_maintained_incrementally(client, db_session):
+    import models
+    import order_totals
+
+    suffix = random.randint(1, 1_000_000)
+    phone = client.post("/product", json={"ProductName": f"Totals phone {suffix}", "Price": 100}).json()
+    case = client.post("/product", json={"ProductName": f"Totals case {suffix}", "Price": 10}).json()
+    user = _register_customer(client, username=f"totals_{suffix}")
+    user_headers = {"Authorization": f"Bearer {_login_customer(client, user['Name'], user['Password'])}"}
+
+    order = client.post(
+        "/checkout",
+        json={
+            "CustomerID": user["CustomerID"],
+            "lines": [{"ProductID": phone["ProductID"], "Quantity": 2}, {"ProductID": case["ProductID"], "Quantity": 1}],
+            "courier": {"Name": "Totals courier", "Price": 5},
+            "gifts": [{"Amount": 10, "Type": "Certificate", "Unit": "Percent"}],
+        },
+    ).json()
+
+    def totals():
+        db_session.expire_all()
+        row = db_session.get(models.OrderTotals, order["OrderID"])
+        return float(row.ProductsTotal), float(row.CourierPrice), float(row.GiftAmount), float(row.TotalToPay)
+
+    assert totals() == (210, 5, 21, 194)
+
+    client.post("/gift", json={"Amount": 4, "Type": "Gift", "Unit": "USD", "PaymentID": order["PaymentID"]})
+    assert totals() == (210, 5, 25, 190)
+
+    client.put(f"/product/{case['ProductID']}", json={"ProductName": case["ProductName"], "Price": 30})
+    assert totals() == (230, 5, 27, 208)
+
+    client.delete(f"/orderdetail/{order['OrderDetailIDs'][0]}")
+    assert totals() == (30, 5, 7, 28)
+
+    client.patch(
+        "/orderdetail/bulk",
+        json={"filter": {"OrderID": order["OrderID"]}, "values": {"Quantity": 3}},
+    )
+    assert totals() == (90, 5, 13, 82)
+
+    expected = {row.OrderID: row.TotalToPay for row in db_session.query(models.OrderTotals)}
+    assert order_totals.rebuild(db_session, chunk_size=3) == len(expected)
+    assert {row.OrderID: row.TotalToPay for row in db_session.query(models.OrderTotals)} == expected
+
+    own = client.get("/analytics/order-totals", headers=user_headers)
+    assert own.status_code == 200
+    assert [row["OrderID"] for row in own.json()] == [order["OrderID"]]
+    assert own.json()[0]["TotalToPay"] == 82
+
+    first_page = client.get("/analytics/order-totals", params={"limit": 1})
+    assert len(first_page.json()) == 1 and first_page.headers.get("X-Next-Cursor")
+
+
+def test_top_products_are_served_from_daily_rollup(client, db_session):
+    import models
+    import product_sales
+
+    suffix = random.randint(1, 1_000_000)
+    seller = _register_customer(client, username=f"top_seller_{suffix}", role="seller")
+    seller_headers = {"Authorization": f"Bearer {_login_customer(client, seller['Name'], seller['Password'])}"}
+    cheap = client.post("/product", json={"ProductName": f"Top cheap {suffix}", "Price": 5}, headers=seller_headers).json()
+    dear = client.post("/product", json={"ProductName": f"Top dear {suffix}", "Price": 50}).json()
+    buyers = [_register_customer(client, username=f"top_buyer_{suffix}_{n}")["CustomerID"] for n in range(2)]
+
+    day_one, day_two = datetime(2032, 3, 1, 10), datetime(2032, 3, 2, 18)
+    for buyer, when, lines in (
+        (buyers[0], day_one, [(cheap, 2), (dear, 1)]),
+        (buyers[1], day_one, [(cheap, 1)]),
+        (buyers[0], day_two, [(cheap, 4), (cheap, 1)]),
+    ):
+        client.post(
+            "/checkout",
+            json={
+                "CustomerID": buyer,
+                "OrderDate": when.isoformat(),
+                "lines": [{"ProductID": product["ProductID"], "Quantity": quantity} for product, quantity in lines],
+            },
+        )
+    late = client.post("/order", json={"OrderDate": day_two.isoformat(), "CustomerID": buyers[1]}).json()
+    client.post(
+        "/orderdetail/bulk",
+        json=[{"OrderID": late["OrderID"], "ProductID": dear["ProductID"], "Quantity": 3}],
+    )
+
+    def top(**params):
+        response = client.get("/analytics/products/top", params={"from": "2032-03-01", "to": "2032-03-31", **params})
+        assert response.status_code == 200
+        return response
+
+    rows = top().json()
+    assert [(r["ProductID"], r["TotalOrders"], r["TotalCustomers"], r["TotalQuantity"], r["TotalSales"]) for r in rows] == [
+        (dear["ProductID"], 2, 2, 4, 200),
+        (cheap["ProductID"], 3, 2, 8, 40),
+    ]
+    assert [r["TotalSales"] for r in top(to="2032-03-01").json()] == [50, 15]
+
+    first = top(limit=1)
+    assert [r["Rank"] for r in first.json()] == [1]
+    second = top(limit=1, cursor=first.headers["X-Next-Cursor"])
+    assert [r["ProductID"] for r in second.json()] == [cheap["ProductID"]]
+    assert "X-Next-Cursor" not in second.headers
+
+    # Edits recompute the affected products; price changes apply on read.
+    moved = client.patch(
+        "/order/bulk",
+        json={"filter": {"OrderID": late["OrderID"]}, "values": {"OrderDate": datetime(2032, 4, 1).isoformat()}},
+    )
+    assert moved.json() == {"updated": 1}
+    client.put(f"/product/{cheap['ProductID']}", json={"ProductName": cheap["ProductName"], "Price": 10}, headers=seller_headers)
+    rows = top().json()
+    assert [(r["ProductID"], r["TotalOrders"], r["TotalSales"]) for r in rows] == [
+        (cheap["ProductID"], 3, 80),
+        (dear["ProductID"], 1, 50),
+    ]
+
+    expected = {(r.Day, r.ProductID): (r.OrderCount, r.Quantity) for r in db_session.query(models.ProductDailySales)}
+    product_sales.rebuild(db_session, chunk_size=7)
+    assert {(r.Day, r.ProductID): (r.OrderCount, r.Quantity) for r in db_session.query(models.ProductDailySales)} == expected
+
+    own = client.get("/analytics/products/top", params={"from": "2032-03-01"}, headers=seller_headers).json()
+    assert [r["ProductID"] for r in own] == [cheap["ProductID"]]
+    buyer = _register_customer(client, username=f"top_user_{suffix}")
+    buyer_headers = {"Authorization": f"Bearer {_login_customer(client, buyer['Name'], buyer['Password'])}"}
+    assert client.get("/analytics/products/top", headers=buyer_headers).status_code == 403
+    assert client.get("/analytics/products/top", params={"from": "2032-04-01", "to": "2032-03-01"}).status_code == 400
+
+
+def test_revenue_series_is_bucketed_in_sql(client):
+    suffix = random.randint(1, 1_000_000)
+    supplier = client.post("/supplier", json={"SupplierName": f"Revenue supplier {suffix}"}).json()
+    product = client.post(
+        "/product", json={"ProductName": f"Revenue product {suffix}", "Price": 10, "SupplierID": supplier["SupplierID"]}
+    ).json()
+    buyer = _register_customer(client, username=f"revenue_{suffix}")
+    buyer_headers = {"Authorization": f"Bearer {_login_customer(client, buyer['Name'], buyer['Password'])}"}
+
+    # 2033-01-03 is a Monday; 2033-01-09 a Sunday of the same week.
+    for when, quantity in (
+        (datetime(2033, 1, 3, 9), 1),
+        (datetime(2033, 1, 9, 23), 2),
+        (datetime(2033, 1, 10, 1), 3),
+        (datetime(2033, 2, 1, 12), 4),
+    ):
+        client.post(
+            "/checkout",
+            json={
+                "CustomerID": buyer["CustomerID"],
+                "OrderDate": when.isoformat(),
+                "lines": [{"ProductID": product["ProductID"], "Quantity": quantity}],
+            },
+        )
+
+    def series(**params):
+        response = client.get("/analytics/revenue", params={"from": "2033-01-01", "to": "2033-02-28", **params})
+        assert response.status_code == 200
+        return [(point["period"], point.get("group"), point["orders"], point["revenue"]) for point in response.json()["series"]]
+
+    assert series(bucket="week") == [
+        ("2033-01-03", None, 2, 30),
+        ("2033-01-10", None, 1, 30),
+        ("2033-01-31", None, 1, 40),
+    ]
+    assert series(bucket="month") == [("2033-01-01", None, 3, 60), ("2033-02-01", None, 1, 40)]
+    assert series(to="2033-01-09") == [("2033-01-03", None, 1, 10), ("2033-01-09", None, 1, 20)]
+    assert series(bucket="month", group_by="supplier") == [
+        ("2033-01-01", supplier["SupplierName"], 3, 60),
+        ("2033-02-01", supplier["SupplierName"], 1, 40),
+    ]
+    assert series(bucket="month", group_by="status")[0][1] == "Pending"
+    assert series(bucket="month", group_by="country")[0][1] == "UA"
+
+    own = client.get("/analytics/revenue", params={"bucket": "month", "from": "2033-01-01"}, headers=buyer_headers)
+    assert [point["revenue"] for point in own.json()["series"]] == [60, 40]
+    assert client.get("/analytics/revenue", params={"bucket": "year"}).status_code == 422
+
+
+def test_orders_summary_filters_before_grouping_and_paginates(client):
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"Summary product {suffix}", "Price": 4}).json()
+    buyer = _register_customer(client, username=f"summary_{suffix}")
+    buyer_headers = {"Authorization": f"Bearer {_login_customer(client, buyer['Name'], buyer['Password'])}"}
+
+    order_ids = []
+    for day, quantity in ((1, 1), (2, 2), (3, 3), (20, 4)):
+        order = client.post(
+            "/checkout",
+            json={
+                "CustomerID": buyer["CustomerID"],
+                "OrderDate": datetime(2034, 6, day, 12).isoformat(),
+                "lines": [{"ProductID": product["ProductID"], "Quantity": quantity}],
+            },
+        ).json()
+        order_ids.append(order["OrderID"])
+    client.patch("/order/bulk", json={"filter": {"OrderID": order_ids[1]}, "values": {"Status": "Shipped"}})
+
+    params = {"from": "2034-06-01", "to": "2034-06-10"}
+    first = client.get("/analytics/orders-summary", params={**params, "limit": 2})
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "application/json"
+    rows = first.json()["order_summary"]
+    assert [(r["OrderID"], r["total_amount"], r["CustomerName"]) for r in rows] == [
+        (order_ids[0], 4, buyer["Name"]),
+        (order_ids[1], 8, buyer["Name"]),
+    ]
+    second = client.get(
+        "/analytics/orders-summary", params={**params, "limit": 2, "cursor": first.headers["X-Next-Cursor"]}
+    )
+    assert [r["OrderID"] for r in second.json()["order_summary"]] == [order_ids[2]]
+    assert "X-Next-Cursor" not in second.headers
+
+    shipped = client.get("/analytics/orders-summary", params={"from": "2034-06-01", "status": "Shipped"}).json()
+    assert [(r["OrderID"], r["Status"]) for r in shipped["order_summary"]] == [(order_ids[1], "Shipped")]
+
+    own = client.get("/analytics/orders-summary", headers=buyer_headers).json()["order_summary"]
+    assert [r["OrderID"] for r in own] == order_ids
+    assert client.get("/analytics/orders-summary", params={"status": "Lost"}).status_code == 422
+    assert client.get("/analytics/orders-summary", params={"from": "2034-06-10", "to": "2034-06-01"}).status_code == 400
+
+
+def test_analytics_results_are_cached_until_a_table_they_read_changes(client, db_session):
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"Cached product {suffix}", "Price": 3}).json()
+    buyer = _register_customer(client, username=f"cached_{suffix}")
+    buyer_headers = {"Authorization": f"Bearer {_login_customer(client, buyer['Name'], buyer['Password'])}"}
+    order = client.post(
+        "/checkout",
+        json={
+            "CustomerID": buyer["CustomerID"],
+            "OrderDate": datetime(2035, 1, 5).isoformat(),
+            "lines": [{"ProductID": product["ProductID"], "Quantity": 2}],
+        },
+    ).json()
+    params = {"from": "2035-01-01", "to": "2035-01-31"}
+
+    first = client.get("/analytics/orders-summary", params=params)
+    with _count_queries() as statements:
+        again = client.get("/analytics/orders-summary", params=params)
+        revenue = client.get("/analytics/revenue", params=params)
+        revenue_again = client.get("/analytics/revenue", params=params)
+    assert again.content == first.content
+    assert revenue_again.json() == revenue.json()
+    selects = [statement for statement in statements if "OrderDetail" in statement]
+    assert len(selects) == 1, "only the first revenue call should aggregate"
+
+    # Scope is part of the key: the buyer gets their own result, not the admin's.
+    own = client.get("/analytics/revenue", params=params, headers=buyer_headers).json()
+    assert own["series"][0]["revenue"] == 6
+
+    # A committed write to a table the endpoint reads invalidates it.
+    client.put(f"/product/{product['ProductID']}", json={"ProductName": product["ProductName"], "Price": 5})
+    assert client.get("/analytics/revenue", params=params).json()["series"][0]["revenue"] == 10
+    summary = client.get("/analytics/orders-summary", params=params).json()["order_summary"]
+    assert [(r["OrderID"], r["total_amount"]) for r in summary] == [(order["OrderID"], 10)]
+
+    # Writes to unrelated tables keep the entry.
+    client.post("/courier", json={"Name": "Unrelated", "Country": "UA", "OrderID": order["OrderID"]})
+    with _count_queries() as statements:
+        client.get("/analytics/revenue", params=params)
+    assert not any("OrderDetail" in statement for statement in statements)
+
+    assert client.get("/admin/analytics-cache").json()["hits"] > 0
+
+
+def test_columnar_engine_matches_sql_and_appends_new_rows(client, monkeypatch):
+    pytest.importorskip("numpy")
+    import columnar
+    from routers import analytics as analytics_router
+
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"Columnar product {suffix}", "Price": 12.34}).json()
+    buyer = _register_customer(client, username=f"columnar_{suffix}")
+    buyer_headers = {"Authorization": f"Bearer {_login_customer(client, buyer['Name'], buyer['Password'])}"}
+    for day, quantity in ((4, 1), (12, 3)):
+        client.post(
+            "/checkout",
+            json={
+                "CustomerID": buyer["CustomerID"],
+                "OrderDate": datetime(2036, 2, day, 8).isoformat(),
+                "lines": [{"ProductID": product["ProductID"], "Quantity": quantity}],
+            },
+        )
+
+    def results(engine, headers=None):
+        monkeypatch.setattr(analytics_router, "ANALYTICS_ENGINE", engine)
+        analytics_router.analytics_cache.clear()
+        out = {}
+        for by in ("status", "country", "supplier", "customer", "product"):
+            rows = client.get("/analytics/breakdown", params={"by": by}, headers=headers).json()["rows"]
+            out[by] = {row["group"]: (row["orders"], row["quantity"], row["revenue"]) for row in rows}
+        for bucket in ("day", "week", "month"):
+            params = {"bucket": bucket, "group_by": "status", "from": "2036-02-01", "to": "2036-02-29"}
+            series = client.get("/analytics/revenue", params=params, headers=headers).json()["series"]
+            out[bucket] = sorted((p["period"], p["group"], p["orders"], p["quantity"], p["revenue"]) for p in series)
+        return out
+
+    columnar.store.invalidate()
+    assert results("columnar") == results("sql")
+    assert results("columnar", buyer_headers) == results("sql", buyer_headers)
+    weeks = results("columnar")["week"]
+    assert [(period, revenue) for period, _, _, _, revenue in weeks] == [("2036-02-04", 12.34), ("2036-02-11", 37.02)]
+
+    # New orders are appended to the loaded columns; a rewrite reloads them.
+    monkeypatch.setattr(analytics_router, "ANALYTICS_ENGINE", "columnar")
+    loaded_orders, loaded_at = columnar.store.orders["id"], columnar.store._loaded_at
+    client.post(
+        "/checkout",
+        json={"CustomerID": buyer["CustomerID"], "lines": [{"ProductID": product["ProductID"], "Quantity": 2}]},
+    )
+    customers = client.get("/analytics/breakdown", params={"by": "customer"}).json()["rows"]
+    assert {row["group"]: row["orders"] for row in customers}[buyer["CustomerID"]] == 3
+    assert len(columnar.store.orders["id"]) == len(loaded_orders) + 1
+    assert columnar.store._loaded_at == loaded_at
+
+    client.patch("/order/bulk", json={"filter": {"CustomerID": buyer["CustomerID"]}, "values": {"Status": "Shipped"}})
+    statuses = client.get("/analytics/breakdown", params={"by": "status"}, headers=buyer_headers).json()["rows"]
+    assert [(row["group"], row["orders"]) for row in statuses] == [("Shipped", 3)]
+    assert client.get("/analytics/breakdown", params={"by": "nothing"}).status_code == 422
+
+
+def test_cohorts_and_lifetime_value_come_from_customer_rollups(client, db_session):
+    import models
+    import order_totals
+
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"Cohort product {suffix}", "Price": 10}).json()
+    first = _register_customer(client, username=f"cohort_a_{suffix}")
+    second = _register_customer(client, username=f"cohort_b_{suffix}")
+
+    def buy(customer, when, quantity, gifts=()):
+        return client.post(
+            "/checkout",
+            json={
+                "CustomerID": customer["CustomerID"],
+                "OrderDate": when.isoformat(),
+                "lines": [{"ProductID": product["ProductID"], "Quantity": quantity}],
+                "gifts": list(gifts),
+            },
+        ).json()
+
+    buy(first, datetime(2037, 1, 10), 2)
+    buy(first, datetime(2037, 3, 5), 1, [{"Amount": 3, "Type": "Gift", "Unit": "USD"}])
+    buy(second, datetime(2037, 1, 20), 5)
+    moved = buy(second, datetime(2037, 2, 1), 1)
+
+    def ltv(customer):
+        db_session.expire_all()
+        return db_session.get(models.CustomerTotals, customer["CustomerID"])
+
+    assert (ltv(first).OrderCount, float(ltv(first).LifetimeValue)) == (2, 27)
+    assert ltv(first).CohortMonth.isoformat() == "2037-01-01"
+    assert (ltv(second).OrderCount, float(ltv(second).LifetimeValue)) == (2, 60)
+
+    cohorts = client.get("/analytics/cohorts", params={"from": "2037-01-01", "to": "2037-12-31", "periods": 3}).json()
+    assert [(c["cohort"], c["customers"], c["lifetime_value"]) for c in cohorts["cohorts"]] == [("2037-01-01", 2, 87)]
+    assert [(p["offset"], p["customers"], p["retention"], p["value"]) for p in cohorts["cohorts"][0]["periods"]] == [
+        (0, 2, 1.0, 70),
+        (1, 1, 0.5, 10),
+        (2, 1, 0.5, 7),
+    ]
+
+    # Moving an order to another customer refreshes both customers.
+    client.put(f"/order/{moved['OrderID']}", json={"CustomerID": first["CustomerID"]})
+    assert (ltv(first).OrderCount, float(ltv(first).LifetimeValue)) == (3, 37)
+    assert (ltv(second).OrderCount, float(ltv(second).LifetimeValue)) == (1, 50)
+
+    ranked = client.get("/analytics/customers/ltv", params={"limit": 1000}).json()
+    positions = {row["CustomerID"]: row for row in ranked}
+    assert positions[second["CustomerID"]]["Rank"] < positions[first["CustomerID"]]["Rank"]
+    assert [row["LifetimeValue"] for row in ranked] == sorted((row["LifetimeValue"] for row in ranked), reverse=True)
+
+    first_headers = {"Authorization": f"Bearer {_login_customer(client, first['Name'], first['Password'])}"}
+    own = client.get("/analytics/customers/ltv", headers=first_headers).json()
+    assert [(row["CustomerID"], row["LifetimeValue"]) for row in own] == [(first["CustomerID"], 37)]
+    assert client.get("/analytics/cohorts", headers=first_headers).status_code == 403
+
+    expected = {(r.CustomerID, r.Month): (r.OrderCount, r.Value) for r in db_session.query(models.CustomerMonthly)}
+    order_totals.rebuild(db_session, chunk_size=5)
+    assert {(r.CustomerID, r.Month): (r.OrderCount, r.Value) for r in db_session.query(models.CustomerMonthly)} == expected
+
+
+def test_hyperloglog_estimates_stay_within_the_error_bound():
+    from hll import HyperLogLog, relative_error
+
+    small, large, other = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for value in range(50):
+        small.add(value)
+    for value in range(20_000):
+        (large if value % 2 else other).add(value)
+    large.update(other)
+    assert small.count() == 50
+    assert abs(large.count() - 20_000) / 20_000 < 3 * relative_error()
+    for sketch in (small, large):
+        assert HyperLogLog.from_bytes(sketch.to_bytes()).registers == sketch.registers
+
+
+def test_approximate_product_customers_merge_daily_sketches(client, db_session):
+    import models
+    import product_sales
+
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"Sketch product {suffix}", "Price": 3}).json()
+    buyers = [_register_customer(client, username=f"sketch_buyer_{suffix}_{n}")["CustomerID"] for n in range(3)]
+    orders = []
+    for buyer, day in ((buyers[0], 1), (buyers[1], 1), (buyers[0], 2), (buyers[2], 3)):
+        orders.append(
+            client.post(
+                "/checkout",
+                json={
+                    "CustomerID": buyer,
+                    "OrderDate": datetime(2034, 5, day, 12).isoformat(),
+                    "lines": [{"ProductID": product["ProductID"], "Quantity": 1}],
+                },
+            ).json()
+        )
+
+    def customers(mode, **params):
+        rows = client.get(
+            "/analytics/products/top",
+            params={"from": "2034-05-01", "to": "2034-05-31", "customers": mode, "limit": 1000, **params},
+        ).json()
+        return {r["ProductID"]: r["TotalCustomers"] for r in rows}[product["ProductID"]]
+
+    assert customers("approx") == customers("exact") == 3
+    assert customers("approx", to="2034-05-02") == 2
+
+    # Sketches cannot forget a customer, so edits recompute the product.
+    client.put(f"/order/{orders[3]['OrderID']}", json={"CustomerID": buyers[1]})
+    assert customers("approx") == customers("exact") == 2
+
+    expected = {
+        (r.Day, r.ProductID): r.Sketch
+        for r in db_session.query(models.ProductDailyCustomers).filter_by(ProductID=product["ProductID"])
+    }
+    assert len(expected) == 3
+    product_sales.rebuild(db_session, chunk_size=7)
+    assert {
+        (r.Day, r.ProductID): r.Sketch
+        for r in db_session.query(models.ProductDailyCustomers).filter_by(ProductID=product["ProductID"])
+    } == expected
+
+
+def test_snapshots_keep_types_and_export_incrementally(client, db_session, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    import models
+    import snapshot
+
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"Snapshot product {suffix}", "Price": 12.5}).json()
+    buyer = _register_customer(client, username=f"snapshot_buyer_{suffix}")
+
+    def buy(day):
+        return client.post(
+            "/checkout",
+            json={
+                "CustomerID": buyer["CustomerID"],
+                "OrderDate": datetime(2035, 6, day, 9).isoformat(),
+                "lines": [{"ProductID": product["ProductID"], "Quantity": 2}],
+            },
+        ).json()
+
+    first = buy(1)
+    full = {entry["name"]: entry for entry in snapshot.export_snapshot(db_session, tmp_path)}
+    assert set(full) == {*Base.metadata.tables, snapshot.ORDER_TOTALS_VIEW}
+    folder = tmp_path / next(path.name for path in tmp_path.iterdir() if path.is_dir())
+
+    customers = pq.read_table(folder / "Customer.parquet")
+    assert "password_hash" not in customers.column_names
+    orders = pq.read_table(folder / "Orders.parquet")
+    assert str(orders.schema.field("OrderDate").type) == "timestamp[us]"
+    assert str(orders.schema.field("Status").type) == "dictionary<values=string, indices=int8, ordered=0>"
+    view = pq.read_table(folder / f"{snapshot.ORDER_TOTALS_VIEW}.parquet").to_pylist()
+    row = next(r for r in view if r["OrderID"] == first["OrderID"])
+    assert (row["CustomerID"], row["Status"], str(row["ProductsTotal"])) == (buyer["CustomerID"], "Pending", "25.00")
+    assert full["Orders"]["rows"] == db_session.query(models.Orders).count()
+
+    second = buy(2)
+    report = snapshot.export_snapshot(db_session, tmp_path, incremental=True, fmt="arrow")
+    incremental = {entry["name"]: entry for entry in report}
+    assert (incremental["Orders"]["rows"], incremental["Orders"]["watermark"]) == (1, second["OrderID"])
+    assert incremental[snapshot.ORDER_TOTALS_VIEW]["rows"] == 1
+    assert incremental["Customer"]["rows"] == 0
+    assert not incremental["ProductDailySales"]["incremental"]
+    watermarks = json.loads((tmp_path / snapshot.WATERMARKS_FILE).read_text())
+    assert watermarks["Orders"] == second["OrderID"]
+    assert "ProductDailySales" not in watermarks
+
+
+def test_order_line_writes_refresh_only_their_own_order(client, db_session, monkeypatch):
+    from sqlalchemy import select
+
+    import models
+    import order_totals
+
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"Popular {suffix}", "Price": 4}).json()
+    buyer = _register_customer(client, username=f"popular_buyer_{suffix}")
+    checkout = {"CustomerID": buyer["CustomerID"], "lines": [{"ProductID": product["ProductID"], "Quantity": 1}]}
+    for _ in range(3):
+        client.post("/checkout", json=checkout)
+
+    replaced = []
+    original = order_totals._replace
+
+    def spy(db, condition):
+        replaced.extend(db.execute(select(models.Orders.OrderID).where(condition(models.Orders.OrderID))).scalars())
+        return original(db, condition)
+
+    monkeypatch.setattr(order_totals, "_replace", spy)
+    new_order = client.post("/checkout", json=checkout).json()
+    assert replaced == [new_order["OrderID"]]
+
+
+def test_analytics_cache_is_not_filled_from_replica_reads():
+    from routers import analytics as analytics_router
+
+    replica_session = database.RoutingSession(bind=engine, replica_bind=engine)
+    replica_session.info[database.USE_REPLICA_KEY] = True
+    primary_session = database.RoutingSession(bind=engine, replica_bind=engine)
+    try:
+        analytics_router._cache_set(replica_session, ("replica-test",), "stale")
+        assert analytics_router.analytics_cache.get(("replica-test",)) is None
+        analytics_router._cache_set(primary_session, ("replica-test",), "fresh")
+        assert analytics_router.analytics_cache.get(("replica-test",)) == "fresh"
+    finally:
+        replica_session.close()
+        primary_session.close()
+
+
+def test_checkout_rejects_unknown_products_before_inserting(client, db_session):
+    buyer = _register_customer(client, username=f"fk_buyer_{random.randint(1, 1_000_000)}")
+    orders_before = client.get("/order", params={"limit": 1000}).json()
+    # MySQL enforces OrderDetail.ProductID; make SQLite do the same.
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+    try:
+        response = client.post(
+            "/checkout",
+            json={"CustomerID": buyer["CustomerID"], "lines": [{"ProductID": 987_654_321, "Quantity": 1}]},
+        )
+    finally:
+        with engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+    assert response.status_code == 404
+    assert client.get("/order", params={"limit": 1000}).json() == orders_before
+
+
+def test_bulk_customer_changes_revoke_cached_auth(client, db_session, monkeypatch):
+    suffix = random.randint(1, 1_000_000)
+    demoted = _register_customer(client, username=f"bulk_demoted_{suffix}", role="seller")
+    removed = _register_customer(client, username=f"bulk_removed_{suffix}")
+    kept = _register_customer(client, username=f"bulk_kept_{suffix}")
+    headers = {
+        customer["CustomerID"]: {"Authorization": f"Bearer {_login_customer(client, customer['Name'], customer['Password'])}"}
+        for customer in (demoted, removed, kept)
+    }
+    for customer_id, customer_headers in headers.items():
+        assert client.get(f"/customer/{customer_id}", headers=customer_headers).status_code == 200
+    assert any(key[0] == demoted["CustomerID"] for key in user_cache._data)
+
+    patched = client.patch(
+        "/customer/bulk", json={"filter": {"CustomerID": demoted["CustomerID"]}, "values": {"Role": "user"}}
+    )
+    assert patched.json() == {"updated": 1}
+    assert not any(key[0] == demoted["CustomerID"] for key in user_cache._data)
+    profile = client.get(f"/customer/{demoted['CustomerID']}", headers=headers[demoted["CustomerID"]])
+    assert profile.json()["Role"] == "user"
+
+    deleted = client.request("DELETE", "/customer/bulk", json={"filter": {"CustomerID": removed["CustomerID"]}})
+    assert deleted.json() == {"deleted": 1}
+    assert client.get(f"/customer/{removed['CustomerID']}", headers=headers[removed["CustomerID"]]).status_code == 401
+
+    # Stateless tokens never reach the database, so they must be revoked.
+    monkeypatch.setattr(customer_router, "AUTH_STATELESS", True)
+    for customer_id in (demoted["CustomerID"], removed["CustomerID"]):
+        response = client.get(f"/customer/{customer_id}", headers=headers[customer_id])
+        assert response.json()["detail"] == "Token revoked"
+    assert client.get(f"/customer/{kept['CustomerID']}", headers=headers[kept["CustomerID"]]).status_code == 200
+
+
+def test_columnar_engine_picks_up_ids_that_commit_out_of_order(client, db_session, monkeypatch):
+    pytest.importorskip("numpy")
+    import columnar
+    import models
+    from routers import analytics as analytics_router
+
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"Late product {suffix}", "Price": 1}).json()
+    buyer = _register_customer(client, username=f"late_buyer_{suffix}")
+    order = client.post(
+        "/checkout",
+        json={"CustomerID": buyer["CustomerID"], "lines": [{"ProductID": product["ProductID"], "Quantity": 1}]},
+    ).json()
+    monkeypatch.setattr(analytics_router, "ANALYTICS_ENGINE", "columnar")
+
+    def quantity():
+        analytics_router.analytics_cache.clear()
+        rows = client.get("/analytics/breakdown", params={"by": "product"}).json()["rows"]
+        return {row["group"]: row["quantity"] for row in rows}[product["ProductID"]]
+
+    columnar.store.invalidate()
+    assert quantity() == 1
+    loaded_at = columnar.store._loaded_at
+    # A line with a higher id commits first, then one with a lower id.
+    high = db_session.query(func.max(models.OrderDetail.OrderDetailID)).scalar() + 100
+    for line_id, amount in ((high, 2), (high - 50, 4)):
+        db_session.add(
+            models.OrderDetail(OrderDetailID=line_id, OrderID=order["OrderID"], ProductID=product["ProductID"], Quantity=amount)
+        )
+        db_session.commit()
+        quantity()
+    assert quantity() == 7
+    assert columnar.store._loaded_at == loaded_at
+
+
+def test_product_sales_edits_recompute_only_the_affected_cells(client, db_session, monkeypatch):
+    import models
+    import product_sales
+
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"Cell product {suffix}", "Price": 2}).json()
+    buyer = _register_customer(client, username=f"cell_buyer_{suffix}")
+    orders = [
+        client.post(
+            "/checkout",
+            json={
+                "CustomerID": buyer["CustomerID"],
+                "OrderDate": datetime(2038, 1, day, 12).isoformat(),
+                "lines": [{"ProductID": product["ProductID"], "Quantity": day}],
+            },
+        ).json()
+        for day in range(1, 11)
+    ]
+
+    replaced = []
+    original = product_sales._replace
+
+    def spy(db, condition, day=None):
+        replaced.append(day)
+        return original(db, condition, day)
+
+    monkeypatch.setattr(product_sales, "_replace", spy)
+
+    def cells():
+        db_session.expire_all()
+        rows = db_session.query(models.ProductDailySales).filter_by(ProductID=product["ProductID"])
+        return {r.Day.day: (r.OrderCount, r.Quantity) for r in rows}
+
+    line = orders[2]["OrderDetailIDs"][0]
+    client.patch("/orderdetail/bulk", json={"filter": {"OrderDetailID": line}, "values": {"Quantity": 30}})
+    assert [day.day for day in replaced] == [3]
+    assert cells()[3] == (1, 30)
+
+    replaced.clear()
+    client.patch(
+        "/order/bulk",
+        json={"filter": {"OrderID": orders[4]["OrderID"]}, "values": {"OrderDate": datetime(2038, 1, 6, 8).isoformat()}},
+    )
+    assert sorted(day.day for day in replaced) == [5, 6]
+    assert 5 not in cells() and cells()[6] == (2, 11)
+
+    replaced.clear()
+    detail = db_session.get(models.OrderDetail, orders[7]["OrderDetailIDs"][0])
+    detail.Quantity = 1
+    db_session.commit()
+    assert [day.day for day in replaced] == [8]
+    assert cells()[8] == (1, 1)
+
+    expected = cells()
+    monkeypatch.setattr(product_sales, "_replace", original)
+    product_sales.rebuild(db_session)
+    assert cells() == expected
+
+
+def test_lifetime_value_pages_show_renamed_customers(client):
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"Rename product {suffix}", "Price": 9}).json()
+    buyer = _register_customer(client, username=f"ltv_before_{suffix}")
+    client.post(
+        "/checkout",
+        json={"CustomerID": buyer["CustomerID"], "lines": [{"ProductID": product["ProductID"], "Quantity": 1}]},
+    )
+
+    def name():
+        rows = client.get("/analytics/customers/ltv", params={"limit": 1000}).json()
+        return {row["CustomerID"]: row["Name"] for row in rows}[buyer["CustomerID"]]
+
+    assert name() == buyer["Name"]
+    client.put(f"/customer/{buyer['CustomerID']}", json={"Name": f"ltv_after_{suffix}"})
+    assert name() == f"ltv_after_{suffix}"
+
+
+def test_token_revocations_are_kept_until_they_expire(monkeypatch):
+    from cache import ExpiringDict
+
+    clock = [1000.0]
+    monkeypatch.setattr("cache.time.monotonic", lambda: clock[0])
+    revocations = ExpiringDict(ttl=60)
+    for customer_id in range(50_000):
+        revocations.set(customer_id, clock[0])
+    assert revocations.get(0) == 1000.0 and len(revocations) == 50_000
+
+    clock[0] += 61
+    assert revocations.get(0) is None
+    revocations.set("new", clock[0])
+    assert len(revocations) == 1
+
+
+def test_bulk_insert_without_returning_inserts_row_by_row_in_interleaved_mode(db_session, monkeypatch):
+    import crud
+    import models
+
+    dialect = db_session.get_bind().dialect
+    monkeypatch.setattr(dialect, "insert_executemany_returning", False)
+    monkeypatch.setattr(crud, "_autoinc_settings", lambda db: (2, 2))
+    suffix = random.randint(1, 1_000_000)
+    rows = [{"ProductName": f"Interleaved {suffix} {n}", "Price": n} for n in range(1, 4)]
+    ids = crud.bulk_insert(db_session, models.Product, rows)
+    db_session.commit()
+    assert [db_session.get(models.Product, product_id).ProductName for product_id in ids] == [
+        row["ProductName"] for row in rows
+    ]
+
+
+def test_orders_summary_streams_orders_without_a_status(client, db_session):
+    import models
+
+    suffix = random.randint(1, 1_000_000)
+    product = client.post("/product", json={"ProductName": f"No status {suffix}", "Price": 3}).json()
+    buyer = _register_customer(client, username=f"no_status_{suffix}")
+    order = client.post(
+        "/checkout",
+        json={"CustomerID": buyer["CustomerID"], "lines": [{"ProductID": product["ProductID"], "Quantity": 1}]},
+    ).json()
+    db_session.get(models.Orders, order["OrderID"]).Status = None
+    db_session.commit()
+
+    response = client.get("/analytics/orders-summary", params={"limit": 1000})
+    assert response.status_code == 200
+    rows = {r["OrderID"]: r for r in response.json()["order_summary"]}
+    assert rows[order["OrderID"]]["Status"] is None
+
+
+def test_random_order_reports_conflict_when_nothing_was_created(client, monkeypatch):
+    import generator
+
+    buyer = _register_customer(client, username=f"no_order_{random.randint(1, 1_000_000)}")
+    monkeypatch.setattr(generator, "generate_orders", lambda *args, **kwargs: [])
+    response = client.post(f"/analytics/create-random-order/{buyer['CustomerID']}")
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Random order could not be created"
+
+
+def test_incremental_snapshots_with_a_margin_pick_up_late_commits(client, db_session, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    import models
+    import snapshot
+
+    buyer = _register_customer(client, username=f"late_commit_{random.randint(1, 1_000_000)}")
+    top = db_session.query(func.max(models.Orders.OrderID)).scalar() or 0
+
+    def add_order(order_id):
+        db_session.add(models.Orders(OrderID=order_id, OrderDate=datetime(2036, 1, 1), CustomerID=buyer["CustomerID"]))
+        db_session.commit()
+
+    def export(margin):
+        [entry] = snapshot.export_snapshot(db_session, tmp_path, incremental=True, names=["Orders"], margin=margin)
+        ids = pq.read_table(tmp_path / sorted(p.name for p in tmp_path.iterdir() if p.is_dir())[-1] / entry["file"])
+        return ids.column("OrderID").to_pylist(), entry["watermark"]
+
+    snapshot.export_snapshot(db_session, tmp_path, names=["Orders"])
+    add_order(top + 2)
+    assert export(0) == ([top + 2], top + 2)
+    # top + 1 commits after the snapshot that moved the watermark past it.
+    add_order(top + 1)
+    assert export(0) == ([], top + 2)
+    assert export(2) == ([top + 1, top + 2], top + 2)
+    assert json.loads((tmp_path / snapshot.WATERMARKS_FILE).read_text())["Orders"] == top + 2
+
+
+def test_hyperloglog_precision_is_bounded_by_the_sketch_format():
+    import os
+    import subprocess
+    import sys
+
+    from hll import MAX_PRECISION, HyperLogLog
+
+    with pytest.raises(ValueError):
+        HyperLogLog(MAX_PRECISION + 1)
+    sketch = HyperLogLog(MAX_PRECISION)
+    for value in range(200_000):
+        sketch.add(value)
+    data = sketch.to_bytes()
+    assert len(data) <= 65_535 and HyperLogLog.from_bytes(data).registers == sketch.registers
+
+    env = {**os.environ, "HLL_PRECISION": "17"}
+    result = subprocess.run(
+        [sys.executable, "-c", "import hll"], cwd=os.path.dirname(__file__), env=env, capture_output=True, text=True
+    )
+    assert result.returncode != 0 and "HLL_PRECISION must be between" in result.stderr
+
+
+def test_id_sampler_gives_up_on_a_sparse_id_range(db_session, monkeypatch):
+    import generator
+    import models
+
+    monkeypatch.setattr(generator, "ID_SAMPLE_MAX_ROUNDS", 3)
+    far = models.Product(ProductID=10**15, ProductName=f"Far product {random.randint(1, 1_000_000)}", Price=1)
+    db_session.add(far)
+    db_session.commit()
+    try:
+        sampler = generator.IdSampler(models.Product.ProductID, max_cached=0)
+        with _count_queries() as statements:
+            sample = sampler.sample(db_session, 5)
+        assert len(sample) < 5 and len(statements) == 1 + 1 + 3
+    finally:
+        db_session.delete(far)
+        db_session.commit()
+
+
+def test_id_sampler_serves_the_stale_array_while_one_caller_reloads(db_session):
+    import threading
+    from array import array
+
+    import generator
+    import models
+
+    db_session.add(models.Product(ProductName=f"Sampled product {random.randint(1, 1_000_000)}", Price=1))
+    db_session.commit()
+    sampler = generator.IdSampler(models.Product.ProductID)
+    sampler.sample(db_session, 1)
+    stale = set(sampler._ids)
+    sampler.invalidate()
+
+    started, release = threading.Event(), threading.Event()
+
+    def slow_load(db):
+        started.set()
+        release.wait(5)
+        return array("q", [-1])
+
+    sampler._load = slow_load
+    reloader = threading.Thread(target=sampler.sample, args=(None, 1))
+    reloader.start()
+    assert started.wait(5)
+    with _count_queries() as statements:
+        assert set(sampler.sample(db_session, 3)) <= stale
+    assert statements == []
+    release.set()
+    reloader.join(5)
+    assert sampler.sample(db_session, 3) == [-1, -1, -1]